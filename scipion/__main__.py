@@ -30,21 +30,34 @@
 """
 Main entry point to scipion. It launches the gui, tests, etc.
 """
-import subprocess
 import sys
 import os
 from os.path import join, exists, expanduser, expandvars
 
-from configparser import ConfigParser
-from threading import Thread
-
 from scipion.constants import *
 from scipion.utils import (getScipionHome, getInstallPath,
-                           getScriptsPath, getTemplatesPath, getModuleFolder)
-from scipion.scripts.config import getConfigPathFromConfigFile, HOSTS
+                           getScriptsPath, getTemplatesPath, getModuleFolder,
+                           getConfigPathFromConfigFile, envOn, getInstalledVersion)
 from scipion.constants import MODE_UPDATE
+from scipion.env_cache import EnvironmentSnapshot, isEnvCacheOn
+from scipion.profiling import getProfiler, getScriptArgs, profileLauncher, stopProfile
 from scipion import __version__
 
+# Modes that only need the environment variables: they use the snapshot of a
+# previous resolution when it is still valid (see scipion.env_cache)
+ENV_SNAPSHOT_MODES = [MODE_RUN, MODE_PYTHON, MODE_PIP, MODE_RUNPROTOCOL]
+
+# Modes that load the plugins: with SCIPION_PREFETCH they are prefetched (see
+# scipion.plugin_prefetch) while pyworkflow is imported
+PREFETCH_MODES = [MODE_MANAGER, MODE_LAST, MODE_HERE, MODE_PROJECT, MODE_RUNPROTOCOL,
+                  MODE_TESTS, MODE_TEST, MODE_TUTORIAL] + MODE_VIEWER
+# Modes that import the plugins from the bundle when SCIPION_BUNDLE is on (not
+# the ones installing packages, see scipion.bundle)
+BUNDLE_MODES = PREFETCH_MODES + [MODE_PYTHON]
+
+# Environment before scipion variables are added, for the snapshot validation
+ORIGINAL_ENVIRON = dict(os.environ)
+
 __nickname__ = "Eugenius"
 
 # *********************  Helper functions *****************************
@@ -56,6 +69,11 @@ def getVersion(long=True):
         return __version__
 
 
+def getPackageVersion(distName):
+    """ Version of an installed distribution, without importing it """
+    return getInstalledVersion(distName) or 'not installed'
+
+
 def printVersion():
     """ Print Scipion version """
     # Print the version and some more info
@@ -68,6 +86,7 @@ def config2Dict(configFile, varDict):
     """
     # If config file exists
     if exists(configFile):
+        from configparser import ConfigParser
         # read the file
         config = ConfigParser()
         config.optionxform = str  # keep case (stackoverflow.com/questions/1611799)
@@ -85,11 +104,6 @@ def config2Dict(configFile, varDict):
     return varDict
 
 
-def envOn(varName):
-    value = os.environ.get(varName, '').lower()
-    return value in ['1', 'true', 'on', 'yes']
-
-
 def getMode():
     """ :returns the mode scipion has to be launched """
     return MODE_MANAGER if len(sys.argv) == 1 else sys.argv[1]
@@ -97,37 +111,77 @@ def getMode():
 
 # Auxiliary functions to run commands in our environment, one of our
 # scripts, or one of our "apps"
-def runCmd(cmd, args=''):
-    """ Runs ANY command with its arguments"""
-    if isinstance(args, list):
-        args = ' '.join('"%s"' % x for x in args)
-
-    cmd = '%s %s' % (cmd, args)
+def runCmd(cmd, args=()):
+    """ Replaces the launcher process with ANY command and its arguments,
+    running in the scipion environment. The command is searched in the PATH. """
+    argv = [cmd] + list(args)
 
     os.environ.update(VARS)
-    # result = os.system(cmd)
-    # Replacement of os.system with subprocess.call(cmd, shell=True)
-    result = subprocess.call(cmd, shell=True)
-    sys.exit(result)
+    stopProfile()  # the launcher profile would be lost with the process
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # No shell nor waiting launcher: the command gets this pid and the signals
+    try:
+        os.execvpe(cmd, argv, os.environ)
+    except OSError as e:
+        sys.stderr.write("Can not run %s: %s\n" % (cmd, e.strerror))
+        sys.exit(127 if isinstance(e, FileNotFoundError) else 126)
 
 
 # The following functions require a working SCIPION_PYTHON
-def runScript(scriptCmd, args='', chdir=True):
-    """"Runs a PYTHON script appending the profiling prefix if ON"""
+def runScript(scriptArgs, chdir=True):
+    """"Runs a PYTHON script (and its arguments), profiled if SCIPION_PROFILE is set"""
     if chdir:
         os.chdir(Vars.SCIPION_HOME)
 
-    if envOn('SCIPION_PROFILE'):
-        profileStr = '-m cProfile -o output.profile'
-    else:
-        profileStr = ''
-    cmd = '%s %s %s' % (Vars.SCIPION_PYTHON, profileStr, scriptCmd)
-    runCmd(cmd, args)
+    runCmd(Vars.SCIPION_PYTHON, getScriptArgs(scriptArgs, getProfiler()))
+
+
+def runInZygote(argv, chdir=True):
+    """ Runs a python script in the zygote if SCIPION_ZYGOTE is on and exits
+    with its exit code. Returns if the zygote can not run it. """
+    if not envOn('SCIPION_ZYGOTE') or getProfiler() is not None:
+        return
+    from scipion.zygote import ZygoteClient
+    os.environ.update(VARS)
+    exitCode = ZygoteClient().run(argv, cwd=Vars.SCIPION_HOME if chdir else None)
+    if exitCode is not None:
+        sys.exit(exitCode)
 
 
-def runApp(app, args='', chdir=True):
+def runApp(app, args=(), chdir=True):
     """Runs an app provided by pyworkflow"""
-    runScript(join(Vars.PW_APPS, app), args=args, chdir=chdir)
+    scriptArgs = [join(Vars.PW_APPS, app)] + list(args)
+    runInZygote(scriptArgs, chdir=chdir)
+    runScript(scriptArgs, chdir=chdir)
+
+
+def runProgram(program):
+    """ Runs a program of the installed binaries, found in the program index
+    built when they were installed, with the environment of its plugin.
+    Returns False if program is unknown or its plugin is not indexed. """
+    from scipion.install.program_index import findProgram, hasEmProgramPrefix
+    entry, entryPoint = findProgram(program)
+
+    if hasEmProgramPrefix(program):
+        # pwem entry point sets the environment of these packages
+        if entryPoint is None:
+            # To avoid Ghost activation warning
+            from pwem import EM_PROGRAM_ENTRY_POINT as entryPoint
+        runCmd(entryPoint, sys.argv[1:])
+
+    elif entry is not None and entry.get('plugin'):
+        os.environ.update(VARS)
+        # Only the plugin of the program is imported
+        from pyworkflow import Config
+        plugin = Config.getDomain().getPluginModule(entry['plugin'])._pluginInstance
+        os.environ.update(plugin.getEnviron() or {})
+        binFolder = os.path.dirname(entry['path'])
+        os.environ['PATH'] = os.pathsep.join([binFolder, os.environ.get('PATH', '')])
+        VARS.update(os.environ)  # runCmd sets VARS again
+        runCmd(entry['path'], sys.argv[2:])
+
+    return False
 
 
 # ***************** END FUNCTIONS *****************************************
@@ -160,9 +214,17 @@ while len(sys.argv) > 2 and sys.argv[1].startswith('--'):
         sys.exit('Unknown argument: %s' % arg)
 
 
-hosts = getConfigPathFromConfigFile(scipionConfig, HOSTS)
-if not exists(hosts):
-    hosts = join(getTemplatesPath(), "hosts.template")
+envSnapshot = EnvironmentSnapshot(scipionHome, [scipionConfig, scipionLocalConfig],
+                                  getVersion())
+if not (isEnvCacheOn() and getMode() in ENV_SNAPSHOT_MODES and envSnapshot.load()):
+    envSnapshot.vars = None
+
+if envSnapshot.vars is not None:
+    hosts = envSnapshot.vars['SCIPION_HOSTS']
+else:
+    hosts = getConfigPathFromConfigFile(scipionConfig, HOSTS)
+    if not exists(hosts):
+        hosts = join(getTemplatesPath(), "hosts.template")
 
 
 # *********************** STORE VARIABLES ********************
@@ -184,7 +246,8 @@ class Vars:
     SCIPION_HOSTS = os.environ.get('SCIPION_HOSTS', hosts)
 
     # Paths to apps or scripts
-    PW_APPS = join(getModuleFolder("pyworkflow"), 'apps')
+    PW_APPS = (envSnapshot.pwApps if envSnapshot.vars is not None
+               else join(getModuleFolder("pyworkflow"), 'apps'))
     SCIPION_TEMPLATES = getTemplatesPath()
 
     SCIPION_VERSION = getVersion()
@@ -196,38 +259,163 @@ class Vars:
 
 
 # *********************** READ CONFIG FILES ***********************
-try:
-    VARS = dict()
-
-    # Load variables from Vars class into VARS dict
-
-    if 'SCIPION_NOGUI' in os.environ:
-        # This cannot work since pyworkflow is not imported and can not be imported here
-        # Due to a wrong/early initialisation of the config
-        # PYTHONPATH_LIST.insert(0, join(pyworkflow.Config.getPyworkflowPath(), 'gui', 'no-tkinter'))
-        print("SCIPION_NOGUI variable not implemented for this version. Please contact us if you need this.")
-
-    # Load VARS dictionary, all items here will go to the environment
-    VARS['SCIPION_DOMAIN'] = Vars.SCIPION_DOMAIN
-    VARS['SCIPION_CONFIG'] = Vars.SCIPION_CONFIG
-    VARS['SCIPION_LOCAL_CONFIG'] = Vars.SCIPION_LOCAL_CONFIG
-    VARS['SCIPION_HOSTS'] = Vars.SCIPION_HOSTS
-    VARS['SCIPION_VERSION'] = Vars.SCIPION_VERSION
-    VARS['SCIPION_PRIORITY_PACKAGE_LIST'] = Vars.SCIPION_PRIORITY_PACKAGE_LIST
-
-    # Read main config file
-    config2Dict(Vars.SCIPION_CONFIG, VARS)
-
-    # Load the local config
-    if Vars.SCIPION_LOCAL_CONFIG != Vars.SCIPION_CONFIG:
-        config2Dict(Vars.SCIPION_LOCAL_CONFIG, VARS)
-
-except Exception as e:
-    if len(sys.argv) == 1 or sys.argv[1] != MODE_CONFIG:
-        print('Error reading config: %s\n' % e)
-        print('Please check the configuration file %s and '
-              'try again.\n' % Vars.SCIPION_CONFIG)
-        sys.exit(1)
+VARS = dict()
+
+if envSnapshot.vars is not None:
+    # Already resolved by a previous execution
+    VARS.update(envSnapshot.vars)
+else:
+    try:
+        # Load variables from Vars class into VARS dict
+
+        if 'SCIPION_NOGUI' in os.environ:
+            # This cannot work since pyworkflow is not imported and can not be imported here
+            # Due to a wrong/early initialisation of the config
+            # PYTHONPATH_LIST.insert(0, join(pyworkflow.Config.getPyworkflowPath(), 'gui', 'no-tkinter'))
+            print("SCIPION_NOGUI variable not implemented for this version. Please contact us if you need this.")
+
+        # Load VARS dictionary, all items here will go to the environment
+        VARS['SCIPION_DOMAIN'] = Vars.SCIPION_DOMAIN
+        VARS['SCIPION_CONFIG'] = Vars.SCIPION_CONFIG
+        VARS['SCIPION_LOCAL_CONFIG'] = Vars.SCIPION_LOCAL_CONFIG
+        VARS['SCIPION_HOSTS'] = Vars.SCIPION_HOSTS
+        VARS['SCIPION_VERSION'] = Vars.SCIPION_VERSION
+        VARS['SCIPION_PRIORITY_PACKAGE_LIST'] = Vars.SCIPION_PRIORITY_PACKAGE_LIST
+
+        # Read main config file
+        config2Dict(Vars.SCIPION_CONFIG, VARS)
+
+        # Load the local config
+        if Vars.SCIPION_LOCAL_CONFIG != Vars.SCIPION_CONFIG:
+            config2Dict(Vars.SCIPION_LOCAL_CONFIG, VARS)
+
+    except Exception as e:
+        if len(sys.argv) == 1 or sys.argv[1] != MODE_CONFIG:
+            print('Error reading config: %s\n' % e)
+            print('Please check the configuration file %s and '
+                  'try again.\n' % Vars.SCIPION_CONFIG)
+            sys.exit(1)
+
+
+def printUsage():
+    """ Prints the modes available """
+    sys.stdout.write("""\
+Usage: scipion [--config PATH] [MODE] [ARGUMENTS]
+
+    --config               Full path to a config file.
+                    
+MODE can be:
+    %s                   Prints this help message.
+
+    %s                 Checks and/or writes Scipion's global and local configuration.
+    
+    %s [search TEXT]  Launches the plugin manager window. With search, lists the
+                           plugins and binaries matching TEXT (prefix and close words
+                           of names, descriptions and authors). Use search --help to see usage.
+    
+    %s, %s      Installs Scipion plugins from a terminal. Use flag --help to see usage.
+    
+    %s, %s  Uninstalls Scipion plugins from a terminal. Use with flag --help to see usage.
+    
+    %s               Installs Plugin Binaries. Use with flag --help to see usage.
+    
+    %s             Uninstalls Plugin Binaries. Use with flag --help to see usage.
+
+    %s                Opens the manager with a list of all projects.
+
+    %s                inspect a python module and check if it looks like a scipion plugin. 
+                           With --all-health, imports every plugin in parallel processes
+                           and reports the import time and memory of its submodules.
+                           With --static [PLUGIN|PATH ...], parses the plugins source
+                           code without importing them.
+    
+    %s               Prints the environment variables used by the application.
+    
+    %s              Displays a list of the available Scipion protocols, read from
+                           the protocol catalog (--rebuild imports all plugins again).
+        
+    %s [ARGS ...] Run the specified Scipion protocol.
+
+    %s NAME           Opens the specified project. The name 'last' opens the last project.
+    
+    %s                   Same as 'project last'.
+
+    %s COMMAND [ARG ...]  Runs COMMAND within the Scipion environment.
+    
+    %s [PIP ARGS ...]     Runs pip within the Scipion environment.
+    
+    %s [ARG ...]       Shortcut for 'scipion run python ...'.
+
+    %s OPTION            Runs/Lists test(s).
+                           OPTION can be:
+                             <name>: name of the test to run
+                             --show: list the available tests
+                             --help: show all the available options
+                             --grep <pattern> : filter the list using the <pattern> 
+                             --run: run the list off tests. Affected by --grep
+                           For example, to run the "test_object" test:
+                             scipion test tests.model.test_object
+
+    %s OPTION        Gets(puts) tests data, from(to) the server to(from) the $SCIPION_TESTS folder.
+                           OPTIONS can be:
+                             --download: copy dataset from remote location to local
+                             --upload: copy dataset from local to remote
+                             <dataset>: name of dataset to download, upload or format
+                             --list: list the datasets in the local computer and in the server
+                             --help: show all the available options
+                           For example, to download the dataset xmipp_tutorial:
+                             scipion testdata --download xmipp_tutorial
+                           Or to upload it:
+                             scipion testdata --upload xmipp_tutorial
+                             
+    %s                Prints main packages version.
+    
+    %s | %s        Displays a GUI which allows to run the available Scipion workflow demos. 
+    
+    %s [NAME]        Creates a new protocol with a tutorial workflow loaded.
+                           If NAME is empty, the list of available tutorials are shown.
+
+    %s | %s FILE       Opens a file with Scipion's showj, or a directory with Browser.
+    
+    %s [TEMPLATE]    Shows all the *.json.template files found in the config folder
+                           and all templates provided by plugins. If TEMPLATE 
+                           (a path to a template or a template name) is provided, 
+                           then that template is used.
+
+    %s SPEC              Installs, updates and uninstalls plugins and binaries to match
+                           SPEC, a yaml or json file. Use --dry to only see the operations
+                           needed and --help to see all options.
+
+    %s report|list|clean  Reports of the profiles saved when SCIPION_PROFILE is
+                           cprofile, importtime or sample. Use --help to see usage.
+
+    %s start|stop|status  Daemon with pyworkflow, pwem and the priority plugins
+                           already imported. With SCIPION_ZYGOTE=1, runprotocol, python
+                           and viewer run their scripts in a fork of it.
+
+    %s build|status|clean  Bundle with the compiled code of pyworkflow, pwem and the
+                           plugins. With SCIPION_BUNDLE=1, they are imported from it.
+
+    %s [ARGS]          Check for updates of scipion-em, scipion-pyworkflow 
+                           and scipion-app and updates them. OPTIONS can be:
+                              -h or --help: to see usage.
+                              -dry : only check the status of scipion-em, scipion-pyworkflow 
+                                     and scipion-app
+                              --plugins [--upgrade]: check the installed plugins and
+                                     optionally upgrade the outdated ones
+                              --rollback [ID]: restore the packages as they were before
+                                     the last update (or snapshot ID), without network
+                              --snapshots: list the snapshots taken before updates
+
+""" % (MODE_HELP, MODE_CONFIG,
+       MODE_PLUGINS,
+       MODE_INSTALL_PLUGIN[1], MODE_INSTALL_PLUGIN[0],
+       MODE_UNINSTALL_PLUGIN[1], MODE_UNINSTALL_PLUGIN[0],
+       MODE_INSTALL_BINS, MODE_UNINSTALL_BINS, MODE_MANAGER, MODE_INSPECT,
+       MODE_ENV, MODE_PROTOCOLS, MODE_RUNPROTOCOL, MODE_PROJECT, MODE_LAST,
+       MODE_RUN, MODE_PIP, MODE_PYTHON, MODE_TEST, MODE_TEST_DATA, MODE_VERSION,
+       MODE_DEMO[0], MODE_DEMO[1], MODE_TUTORIAL, MODE_VIEWER[1], MODE_VIEWER[2],
+       MODE_DEMO[1], MODE_SYNC, MODE_PROFILE, MODE_ZYGOTE, MODE_BUNDLE, MODE_UPDATE))
 
 
 def main():
@@ -257,13 +445,58 @@ def main():
 
         os.environ["VIEWERS"] = '{%s}' % ','.join(defaultViewers)
 
-    # Trigger Config initialization once environment is ready
-    import pyworkflow
-    pwVARS = pyworkflow.Config.getVars()
-    VARS.update(pwVARS)
+    # Modes that do not need pyworkflow are dispatched before loading it
+    if mode == MODE_HELP:
+        printUsage()
+        sys.exit(0)
 
-    # Update the environment now with pyworkflow values.
-    os.environ.update(VARS)
+    elif mode == MODE_VERSION:
+        # Print main packages version, read from their metadata
+        print("pyworkflow - %s" % getPackageVersion('scipion-pyworkflow'))
+        print("pwem - %s" % getPackageVersion('scipion-em'))
+        # Just exit, Scipion version will be printed anyway
+        sys.exit(0)
+
+    # Plugin search is answered from the plugin index, no need to load pyworkflow
+    if mode == MODE_PLUGINS and n > 2 and sys.argv[2] == MODE_SEARCH:
+        from scipion.install.plugin_index import main as searchPlugins
+        sys.exit(searchPlugins(sys.argv[3:]))
+
+    if mode == MODE_PROFILE:
+        from scipion.profiling import main as profile
+        sys.exit(profile(sys.argv[2:]))
+
+    # The bundle is built from the package metadata, pyworkflow is not needed
+    if mode == MODE_BUNDLE:
+        from scipion.bundle import main as bundle
+        sys.exit(bundle(sys.argv[2:]))
+
+    # sync checks the installation from local metadata and only loads pyworkflow if needed
+    if mode == MODE_SYNC:
+        from scipion.install.sync import main as sync
+        sys.exit(sync(sys.argv[2:]))
+
+    if envOn('SCIPION_PREFETCH') and mode in PREFETCH_MODES:
+        from scipion.plugin_prefetch import startPrefetch
+        startPrefetch()
+
+    if envSnapshot.vars is None:
+        # Trigger Config initialization once environment is ready
+        import pyworkflow
+        pwVARS = pyworkflow.Config.getVars()
+        VARS.update(pwVARS)
+
+        # Update the environment now with pyworkflow values.
+        os.environ.update(VARS)
+
+        if isEnvCacheOn() and mode in ENV_SNAPSHOT_MODES:
+            configModule = sys.modules[pyworkflow.Config.__module__]
+            envSnapshot.save(VARS, Vars.PW_APPS, ORIGINAL_ENVIRON,
+                             [pyworkflow.__file__, configModule.__file__])
+
+    if envOn('SCIPION_BUNDLE') and mode in BUNDLE_MODES:
+        from scipion.bundle import useBundle
+        useBundle(VARS)
 
     # Check mode
     if mode == MODE_MANAGER:
@@ -271,7 +504,10 @@ def main():
         from scipion.install.update_manager import UpdateManager
 
         # Check update status in a thread.
-        thread = Thread(target=lambda: UpdateManager.getPackagesStatus(printAll=False))
+        from threading import Thread
+        # Cached and with a timeout: it never delays the exit
+        thread = Thread(target=lambda: UpdateManager.getPackagesStatus(printAll=False),
+                        daemon=True)
         thread.start()
 
         ProjectManagerWindow().show()
@@ -289,6 +525,11 @@ def main():
         else:
             arg = mode
 
+        if envOn('SCIPION_PREFETCH'):
+            # Imported concurrently, registered later by pyworkflow
+            from scipion.plugin_prefetch import importPlugins
+            importPlugins()
+
         openProject(arg)
 
     elif mode == MODE_TESTS or mode == MODE_TEST:
@@ -323,16 +564,6 @@ def main():
         os.environ.update(VARS)
         main(sys.argv[2:])
 
-    elif mode == MODE_VERSION:
-        # Print main packages version
-        import pyworkflow
-        import pwem
-
-        print("pyworkflow - %s" % pyworkflow. __version__)
-        print("pwem - %s" % pwem.__version__)
-        # Just exit, Scipion version will be printed anyway
-        sys.exit(0)
-
     elif mode == MODE_RUNPROTOCOL:
         assert (n == 6 or n == 7), 'runprotocol takes exactly 5 arguments, not %d' % (n - 1)
         # this could be pw_protocol_run.py or pw_protocol_mpirun.py
@@ -341,37 +572,43 @@ def main():
         runApp(protocolApp, args=sys.argv[3:])
 
     elif mode == MODE_PROTOCOLS:
-        runApp('pw_protocol_list.py', args=sys.argv[2:])
+        from scipion.protocol_catalog import isCatalogOn, getProtocolCatalog, printProtocols
+        if isCatalogOn() and set(sys.argv[2:]) <= {'--rebuild'}:
+            # Answered from the catalog: only new plugin versions are imported
+            printProtocols(getProtocolCatalog(rebuild='--rebuild' in sys.argv))
+            sys.exit(0)
+        # Without the catalog there is nothing to rebuild
+        runApp('pw_protocol_list.py', args=[a for a in sys.argv[2:] if a != '--rebuild'])
 
     elif mode == MODE_ENV:
         # Print all the environment variables needed to run scipion.
         from pyworkflow.utils import greenStr,yellowStr
+        from scipion.plugin_variables import getPluginVariables
 
-        # Trigger plugin's variable definition
-        pyworkflow.Config.getDomain().getPlugins()
-
-        for key, var in pyworkflow.VariablesRegistry.variables().items():
+        # Plugin's variables, imported only if the registry is outdated
+        for key, var in getPluginVariables().variables.items():
 
-            sys.stdout.write('%s="%s"\n' % (key,var.value))
+            sys.stdout.write('%s="%s"\n' % (key, var['value']))
 
             if len(sys.argv) > 2:
-                if var.description is not None:
-                    sys.stdout.write(greenStr(var.description+"\n"))
-                sys.stdout.write(yellowStr("SOURCE: %s\n" % var.source))
+                if var['description'] is not None:
+                    sys.stdout.write(greenStr(var['description']+"\n"))
+                sys.stdout.write(yellowStr("SOURCE: %s\n" % var['source']))
 
         sys.exit(0)
 
     elif mode == MODE_RUN:
         # Run any command with the environment of scipion loaded.
-        runCmd('emprogram ' + ' '.join(['"%s"' % arg for arg in sys.argv[2:]]))
+        runCmd('emprogram', sys.argv[2:])
 
     elif mode == MODE_PIP:
         # Runs pip command inside scipion's environment.
-        runCmd('pip ' + ' '.join(['"%s"' % arg for arg in sys.argv[2:]]))
+        runCmd('pip', sys.argv[2:])
 
     elif mode == MODE_PYTHON:
-        runScript(' '.join(['"%s"' % arg for arg in sys.argv[2:]]),
-                  chdir=False)
+        if n > 2 and sys.argv[2].endswith('.py') and exists(sys.argv[2]):
+            runInZygote(sys.argv[2:], chdir=False)
+        runScript(sys.argv[2:], chdir=False)
 
     elif mode == MODE_TUTORIAL:
         runApp(join(Vars.SCIPION_SCRIPTS, 'tutorial.py'), sys.argv[2:])
@@ -382,129 +619,45 @@ def main():
         sys.argv = sys.argv[1:]
         launchKickoff()
 
-    # Allow to run programs from different packages
-    # scipion will load the specified environment
-    elif (mode.startswith('xmipp') or
-          mode.startswith('relion') or
-          mode.startswith('e2') or
-          mode.startswith('sx') or
-          mode.startswith('b')):
-        # To avoid Ghost activation warning
-        from pwem import EM_PROGRAM_ENTRY_POINT
-        runCmd(EM_PROGRAM_ENTRY_POINT, sys.argv[1:])
-
     elif mode == MODE_INSPECT:
+        if n > 2 and sys.argv[2] == '--all-health':
+            # Plugins are imported by the workers, pwem is not needed here
+            from scipion.install.plugin_health import main as checkHealth
+            sys.exit(checkHealth(sys.argv[3:]))
+        if n > 2 and sys.argv[2] == '--static':
+            from scipion.install.static_inspect import main as inspectStatic
+            sys.exit(inspectStatic(sys.argv[3:]))
         from scipion.install.inspect_plugins import inspectPlugin
         inspectPlugin(sys.argv[1:])
 
+    elif mode == MODE_ZYGOTE:
+        from scipion.zygote import main as zygote
+        sys.exit(zygote(sys.argv[2:], envKeys=VARS.keys()))
+
     elif mode == MODE_UPDATE:
         # Once more: local import to avoid importing pyworkflow, triggered by install.__init__ (Plugin Manager)
         from scipion.install.update_manager import updateManagerParser
         updateManagerParser(sys.argv[:])
-    # Else HELP or wrong argument
-    else:
-        sys.stdout.write("""\
-Usage: scipion [--config PATH] [MODE] [ARGUMENTS]
-
-    --config               Full path to a config file.
-                    
-MODE can be:
-    %s                   Prints this help message.
-
-    %s                 Checks and/or writes Scipion's global and local configuration.
-    
-    %s                Launches the plugin manager window.
-    
-    %s, %s      Installs Scipion plugins from a terminal. Use flag --help to see usage.
-    
-    %s, %s  Uninstalls Scipion plugins from a terminal. Use with flag --help to see usage.
-    
-    %s               Installs Plugin Binaries. Use with flag --help to see usage.
-    
-    %s             Uninstalls Plugin Binaries. Use with flag --help to see usage.
-
-    %s                Opens the manager with a list of all projects.
-
-    %s                inspect a python module and check if it looks like a scipion plugin. 
-    
-    %s               Prints the environment variables used by the application.
-    
-    %s              Displays a list of the available Scipion protocols.
-        
-    %s [ARGS ...] Run the specified Scipion protocol.
-
-    %s NAME           Opens the specified project. The name 'last' opens the last project.
-    
-    %s                   Same as 'project last'.
-
-    %s COMMAND [ARG ...]  Runs COMMAND within the Scipion environment.
-    
-    %s [PIP ARGS ...]     Runs pip within the Scipion environment.
-    
-    %s [ARG ...]       Shortcut for 'scipion run python ...'.
-
-    %s OPTION            Runs/Lists test(s).
-                           OPTION can be:
-                             <name>: name of the test to run
-                             --show: list the available tests
-                             --help: show all the available options
-                             --grep <pattern> : filter the list using the <pattern> 
-                             --run: run the list off tests. Affected by --grep
-                           For example, to run the "test_object" test:
-                             scipion test tests.model.test_object
-
-    %s OPTION        Gets(puts) tests data, from(to) the server to(from) the $SCIPION_TESTS folder.
-                           OPTIONS can be:
-                             --download: copy dataset from remote location to local
-                             --upload: copy dataset from local to remote
-                             <dataset>: name of dataset to download, upload or format
-                             --list: list the datasets in the local computer and in the server
-                             --help: show all the available options
-                           For example, to download the dataset xmipp_tutorial:
-                             scipion testdata --download xmipp_tutorial
-                           Or to upload it:
-                             scipion testdata --upload xmipp_tutorial
-                             
-    %s                Prints main packages version.
-    
-    %s | %s        Displays a GUI which allows to run the available Scipion workflow demos. 
-    
-    %s [NAME]        Creates a new protocol with a tutorial workflow loaded.
-                           If NAME is empty, the list of available tutorials are shown.
 
-    %s | %s FILE       Opens a file with Scipion's showj, or a directory with Browser.
-    
-    %s [TEMPLATE]    Shows all the *.json.template files found in the config folder
-                           and all templates provided by plugins. If TEMPLATE 
-                           (a path to a template or a template name) is provided, 
-                           then that template is used.
-
-    %s [ARGS]          Check for updates of scipion-em, scipion-pyworkflow 
-                           and scipion-app and updates them. OPTIONS can be:
-                              -h or --help: to see usage.
-                              -dry : only check the status of scipion-em, scipion-pyworkflow 
-                                     and scipion-app
-
-""" % (MODE_HELP, MODE_CONFIG,
-       MODE_PLUGINS,
-       MODE_INSTALL_PLUGIN[1], MODE_INSTALL_PLUGIN[0],
-       MODE_UNINSTALL_PLUGIN[1], MODE_UNINSTALL_PLUGIN[0],
-       MODE_INSTALL_BINS, MODE_UNINSTALL_BINS, MODE_MANAGER, MODE_INSPECT,
-       MODE_ENV, MODE_PROTOCOLS, MODE_RUNPROTOCOL, MODE_PROJECT, MODE_LAST,
-       MODE_RUN, MODE_PIP, MODE_PYTHON, MODE_TEST, MODE_TEST_DATA, MODE_VERSION,
-       MODE_DEMO[0], MODE_DEMO[1], MODE_TUTORIAL, MODE_VIEWER[1], MODE_VIEWER[2],
-       MODE_DEMO[1], MODE_UPDATE))
+    # Allow to run programs from different packages
+    # scipion will load the specified environment
+    elif runProgram(mode):
+        pass  # runProgram only returns if mode is not a program
 
-        if mode == MODE_HELP:
-            sys.exit(0)
-        else:
-            print("Unknown mode: %s." % mode)
-            sys.exit(1)
+    # Else wrong argument
+    else:
+        printUsage()
+        print("Unknown mode: %s." % mode)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
     try:
-        main()
+        profiler = getProfiler(VARS.get('SCIPION_PROFILE'))
+        if profiler is None:
+            main()
+        else:
+            profileLauncher(main, getMode(), profiler)
     except Exception as e:
         import traceback
         traceback.print_exc()
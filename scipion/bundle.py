@@ -0,0 +1,304 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Bundle: the compiled code of pyworkflow, pwem and the installed plugins in
+a single zip file, to import them without a stat storm on shared filesystems.
+
+    scipion bundle build|status|clean
+
+Importing a module looks for it in every folder of sys.path: thousands of
+stat and open calls that, with many runprotocol jobs at the same time,
+overload the metadata server of a shared filesystem. The bundle keeps the
+bytecode of every module of those distributions and a manifest with their
+names and paths. With SCIPION_BUNDLE on, the launcher puts the bundle first
+in the PYTHONPATH: its sitecustomize adds a finder that takes the code from
+the bundle (reads of one open file) for the modules in the manifest.
+
+Modules keep their real __file__ and packages their real __path__, so data
+files, templates, extension modules and tracebacks are read from the
+installation as usual. Editable installs are not bundled. The bundle is not
+used, with a warning, when a package has been installed or uninstalled
+since it was built: run "scipion bundle build" again. It is written to
+SCIPION_BUNDLE_PATH (default: bundle.zip in the scipion cache).
+"""
+import argparse
+import importlib.util
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+from importlib.machinery import SourceFileLoader
+
+from scipion.utils import getCacheFolder, getMtime
+
+MANIFEST = 'manifest.json'
+CODE_FOLDER = 'code/'
+CORE_DISTS = ['scipion-pyworkflow', 'scipion-em']
+
+SITECUSTOMIZE = '''\
+# Generated by "scipion bundle build": imports the code of the plugins from
+# this bundle if it is up to date, then runs the sitecustomize it hides, if any.
+import sys
+
+
+def _useBundle():
+    archive = __loader__.archive
+    try:
+        from scipion.bundle import checkManifest, installFinder, readManifest
+        reason = checkManifest(readManifest(archive))
+        if reason is None:
+            installFinder(archive)
+        else:
+            sys.stderr.write("Scipion bundle %s not used, %s.\\n" % (archive, reason))
+    except Exception as e:
+        sys.stderr.write("Scipion bundle %s not used: %s\\n" % (archive, e))
+
+    this = sys.modules.pop('sitecustomize')
+    path = sys.path
+    sys.path = [p for p in path if p != archive]
+    try:
+        import sitecustomize
+    except ImportError:
+        sys.modules['sitecustomize'] = this
+    finally:
+        sys.path = path
+
+
+_useBundle()
+'''
+
+
+def getBundlePath():
+    return os.environ.get('SCIPION_BUNDLE_PATH') or getCacheFolder('bundle.zip')
+
+
+def _isEditable(dist):
+    try:
+        return json.loads(dist.read_text('direct_url.json') or '{}').get(
+            'dir_info', {}).get('editable', False)
+    except ValueError:
+        return False
+
+
+def getModules(dist):
+    """ Returns {module name: (path, is package)} of the python files of a
+    distribution, read from its RECORD """
+    modules = {}
+    for f in dist.files or []:
+        parts = list(f.parts)
+        if f.suffix != '.py' or '..' in parts or not all(p.isidentifier() for p in parts[:-1]):
+            continue
+        parts[-1] = parts[-1][:-3]
+        isPackage = parts[-1] == '__init__'
+        if isPackage:
+            parts.pop()
+        if parts and parts[-1].isidentifier():
+            modules['.'.join(parts)] = (str(dist.locate_file(f)), isPackage)
+    return modules
+
+
+def _compile(path):
+    """ Returns the marshalled code of a python file, None if it can not be compiled """
+    try:
+        with open(path, 'rb') as f:
+            source = f.read()
+        return marshal.dumps(compile(source, path, 'exec', dont_inherit=True))
+    except (SyntaxError, ValueError, OSError):
+        return None
+
+
+def buildBundle(path=None, jobs=None):
+    """ Writes the bundle with the installed plugins, pyworkflow and pwem.
+    Returns the manifest """
+    import zipfile
+    from concurrent.futures import ProcessPoolExecutor
+    from importlib import metadata
+    from scipion.utils import getInstalledPlugins
+
+    path = path or getBundlePath()
+    distNames = CORE_DISTS + [dist for _, _, dist, _ in getInstalledPlugins() if dist]
+    manifest = {'python': sys.executable, 'magic': importlib.util.MAGIC_NUMBER.hex(),
+                'time': time.time(), 'dists': {}, 'skipped': [], 'sites': {}, 'modules': {}}
+    for distName in dict.fromkeys(distNames):
+        try:
+            dist = metadata.distribution(distName)
+        except metadata.PackageNotFoundError:
+            continue
+        if _isEditable(dist):
+            manifest['skipped'].append(distName)
+            continue
+        manifest['dists'][distName] = dist.version
+        # Installing or uninstalling packages changes the folder
+        site = str(dist.locate_file(''))
+        manifest['sites'][site] = getMtime(site)
+        manifest['modules'].update(getModules(dist))
+
+    names = sorted(manifest['modules'])
+    paths = [manifest['modules'][name][0] for name in names]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        codes = list(executor.map(_compile, paths, chunksize=max(1, len(paths) // 64)))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with zipfile.ZipFile(tmpPath, 'w', zipfile.ZIP_STORED) as bundle:
+        bundle.writestr('sitecustomize.py', SITECUSTOMIZE)
+        for name, code in zip(names, codes):
+            if code is None:  # imported from the installation
+                del manifest['modules'][name]
+            else:
+                bundle.writestr(CODE_FOLDER + name, code)
+        bundle.writestr(MANIFEST, json.dumps(manifest))
+    os.replace(tmpPath, path)
+    return manifest
+
+
+def readManifest(path=None):
+    import zipfile
+    try:
+        with zipfile.ZipFile(path or getBundlePath()) as bundle:
+            return json.loads(bundle.read(MANIFEST))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def checkManifest(manifest):
+    """ Returns why the bundle can not be used, None if it can """
+    if manifest is None:
+        return 'not built'
+    if manifest['python'] != sys.executable or manifest['magic'] != importlib.util.MAGIC_NUMBER.hex():
+        return 'built for another python'
+    for site, mtime in manifest['sites'].items():
+        if getMtime(site) != mtime:
+            return 'packages installed or uninstalled in %s since it was built' % site
+    return None
+
+
+class BundleLoader(SourceFileLoader):
+    """ Loader of a module with its real path, taking the code from the bundle """
+    def __init__(self, fullname, path, finder):
+        SourceFileLoader.__init__(self, fullname, path)
+        self.finder = finder
+
+    def get_code(self, fullname):
+        return marshal.loads(self.finder.getCode(fullname))
+
+
+class BundleFinder:
+    """ Finds the modules of the bundle manifest """
+    def __init__(self, path):
+        import zipfile
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        self._lock = threading.Lock()
+        manifest = json.loads(self._zip.read(MANIFEST))
+        if manifest['magic'] != importlib.util.MAGIC_NUMBER.hex():
+            raise ImportError('bundle built for another python')
+        self.modules = manifest['modules']
+
+    def getCode(self, fullname):
+        with self._lock:
+            return self._zip.read(CODE_FOLDER + fullname)
+
+    def find_spec(self, fullname, path=None, target=None):
+        entry = self.modules.get(fullname)
+        if entry is None:
+            return None
+        modulePath, isPackage = entry
+        return importlib.util.spec_from_file_location(
+            fullname, modulePath, loader=BundleLoader(fullname, modulePath, self),
+            submodule_search_locations=[os.path.dirname(modulePath)] if isPackage else None)
+
+    def invalidate_caches(self):
+        pass
+
+
+def installFinder(path):
+    """ Imports the modules of the bundle from it in this process """
+    for finder in sys.meta_path:
+        if isinstance(finder, BundleFinder) and finder.path == path:
+            return finder
+    finder = BundleFinder(path)
+    sys.meta_path.insert(0, finder)
+    return finder
+
+
+def useBundle(environ):
+    """ Puts the bundle first in the PYTHONPATH of environ and imports from
+    it in this process. Returns False if it can not be used """
+    path = getBundlePath()
+    reason = checkManifest(readManifest(path))
+    if reason is not None:
+        sys.stderr.write("Plugin bundle not used, %s. Run \"scipion bundle build\".\n" % reason)
+        return False
+    pythonPath = environ.get('PYTHONPATH', os.environ.get('PYTHONPATH', ''))
+    environ['PYTHONPATH'] = os.pathsep.join(
+        [path] + [p for p in pythonPath.split(os.pathsep) if p and p != path])
+    os.environ['PYTHONPATH'] = environ['PYTHONPATH']
+    installFinder(path)
+    return True
+
+
+def main(args):
+    """ scipion bundle build|status|clean """
+    parser = argparse.ArgumentParser(prog='scipion bundle',
+                                     description='Bundle with the compiled code of pyworkflow, '
+                                                 'pwem and the plugins. Set SCIPION_BUNDLE=1 to '
+                                                 'import them from it.')
+    parser.add_argument('command', choices=['build', 'status', 'clean'])
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='processes compiling the modules (default: number of cpus)')
+    parsedArgs = parser.parse_args(args)
+    path = getBundlePath()
+
+    if parsedArgs.command == 'build':
+        t0 = time.time()
+        manifest = buildBundle(path, parsedArgs.jobs)
+        print("Bundle %s built in %0.1f seconds: %d modules of %d distributions, %0.1f MB"
+              % (path, time.time() - t0, len(manifest['modules']), len(manifest['dists']),
+                 os.path.getsize(path) / 2 ** 20))
+        if manifest['skipped']:
+            print("Editable installs not bundled: %s" % ' '.join(manifest['skipped']))
+        return 0
+
+    if parsedArgs.command == 'clean':
+        if os.path.exists(path):
+            os.remove(path)
+            print("Bundle %s removed." % path)
+        return 0
+
+    manifest = readManifest(path)
+    reason = checkManifest(manifest)
+    if manifest is not None:
+        print("Bundle %s, built %s: %d modules of %d distributions, %0.1f MB"
+              % (path, time.strftime('%Y-%m-%d %H:%M', time.localtime(manifest['time'])),
+                 len(manifest['modules']), len(manifest['dists']),
+                 os.path.getsize(path) / 2 ** 20))
+        for distName, version in sorted(manifest['dists'].items()):
+            print("   %s %s" % (distName, version))
+    print("Up to date." if reason is None else "Can not be used: %s." % reason)
+    return 0 if reason is None else 1
@@ -14,6 +14,8 @@ MODE_VIEWER = ['viewer', 'view', 'show']
 
 # Installation modes
 MODE_PLUGINS = 'plugins'
+MODE_SEARCH = 'search'  # scipion plugins search
+MODE_SYNC = 'sync'
 MODE_INSTALL_PLUGIN = ['installp', "install"]
 MODE_UNINSTALL_PLUGIN = ['uninstallp', 'uninstall']
 MODE_INSTALL_BINS = 'installb'
@@ -25,6 +27,9 @@ MODE_PROTOCOLS = 'protocols'
 MODE_ENV = 'printenv'
 MODE_RUN = 'run'
 MODE_PYTHON = 'python'
+MODE_ZYGOTE = 'zygote'
+MODE_BUNDLE = 'bundle'
+MODE_PROFILE = 'profile'
 MODE_TUTORIAL = 'tutorial'
 MODE_DEMO = ['demo', 'template']
 MODE_INSPECT = "inspect"
@@ -35,6 +40,9 @@ PLUGIN_MODES = [MODE_UNINSTALL_PLUGIN[0], MODE_UNINSTALL_PLUGIN[1],
                 MODE_INSTALL_BINS,
                 MODE_UNINSTALL_BINS]
 
+# Config files
+HOSTS = 'hosts'
+
 # Entry points
 SCIPION_EP = "scipion"
 
@@ -0,0 +1,139 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Snapshot of the environment resolved by the launcher.
+
+Resolving the scipion environment means reading the config files and
+importing pyworkflow to merge its variables. The result is saved together
+with what it depends on: SCIPION_HOME, the python executable, the scipion
+version, the paths and modification times of the config files and of
+pyworkflow, the values the variables had in the environment and the values
+of the environment variables the config files expand ($VAR, ${VAR} and
+HOME for ~). Modes that
+only need the variables (run, python, pip, runprotocol) apply a valid
+snapshot without parsing or importing anything.
+
+Set SCIPION_ENV_CACHE to 0 to always resolve the environment.
+"""
+import hashlib
+import os
+import re
+import sys
+
+from scipion.utils import envOn, getCacheFolder, getMtime, readJsonCache, writeJsonCache
+
+_VAR_RE = re.compile(r'\$(\w+)|\$\{(\w+)\}')
+
+
+def getExpandedNames(configFiles):
+    """ Names of the environment variables expanded in the config files """
+    names = {'HOME'}  # ~ in paths
+    for path in configFiles:
+        try:
+            with open(path) as f:
+                lines = f.readlines()
+        except (OSError, UnicodeDecodeError):
+            continue
+        for line in lines:
+            if not line.lstrip().startswith(('#', ';')):
+                names.update(a or b for a, b in _VAR_RE.findall(line))
+    return sorted(names)
+
+
+def isEnvCacheOn():
+    return envOn('SCIPION_ENV_CACHE', True)
+
+
+class EnvironmentSnapshot:
+    """ Resolved VARS dictionary and the inputs it was resolved from """
+
+    def __init__(self, home, configFiles, version):
+        self.home = home
+        self.configFiles = list(configFiles)
+        self.version = version
+        self.vars = None
+        self.pwApps = None
+
+    def getPath(self):
+        """ One snapshot per installation and config files """
+        key = '\n'.join([self.home, sys.executable] + self.configFiles)
+        return getCacheFolder('environment-%s.json'
+                              % hashlib.sha1(key.encode()).hexdigest()[:16])
+
+    def _getKey(self, packageFiles, expandedNames, environ=None):
+        environ = os.environ if environ is None else environ
+        return {'home': self.home,
+                'python': sys.executable,
+                'version': self.version,
+                'files': [[f, getMtime(f)] for f in self.configFiles + packageFiles],
+                'expanded': [[name, environ.get(name)] for name in expandedNames]}
+
+    def load(self):
+        """ Loads the snapshot. Returns True if it is still valid for the
+        current config files, packages and environment. """
+        data = readJsonCache(self.getPath())
+        if not isinstance(data, dict) or 'key' not in data:
+            return False
+
+        key = data['key']
+        packageFiles = [f for f, mtime in key.get('files', [])
+                        if f not in self.configFiles]
+        expandedNames = [name for name, value in key.get('expanded', [])]
+        if key != self._getKey(packageFiles, expandedNames):
+            return False
+
+        # Variables present in the environment take priority when resolving:
+        # the snapshot is only valid if they have the value they had when it was
+        # created or the resolved one (e.g. scipion launched from scipion)
+        for varName, value in data['vars'].items():
+            current = os.environ.get(varName)
+            if current is not None and current == value:
+                continue
+            if current != data['environ'].get(varName):
+                return False
+
+        self.vars = data['vars']
+        self.pwApps = data['pwApps']
+        return True
+
+    def save(self, resolvedVars, pwApps, originalEnviron, packageFiles):
+        """ Saves the resolved variables.
+
+        :param resolvedVars: the VARS dictionary
+        :param pwApps: the pyworkflow apps folder
+        :param originalEnviron: environment before the variables were resolved
+        :param packageFiles: files of the packages the variables come from
+        """
+        self.vars = dict(resolvedVars)
+        self.pwApps = pwApps
+        # The variables resolved are checked below, with their own values
+        expandedNames = [name for name in getExpandedNames(self.configFiles)
+                         if name not in self.vars]
+        data = {'key': self._getKey(list(packageFiles), expandedNames, originalEnviron),
+                'vars': self.vars,
+                'pwApps': pwApps,
+                'environ': {k: originalEnviron.get(k) for k in self.vars}}
+        return writeJsonCache(self.getPath(), data)
@@ -3,14 +3,17 @@
 # Since pyworkflow scans packages, this init will be triggered by pyworkflow and then
 # we will register the menu (only works for the project window and not for the "project list" window).
 # register plugin menus
+import importlib.util
 import os
+import sys
 
-from scipion.scripts.kickoff import (getTemplates, chooseTemplate,
-                                     resolveTemplate,
-                                     importTemplate)
 from scipion.utils import getInstallPath, getScriptsPath
 from scipion.constants import PLUGIN_MANAGER_PY, PYTHON, KICKOFF
 
+# Windows where the menus are registered. This module is loaded by any process
+# scanning the packages: they are only imported by the GUI
+WINDOWS_MODULE = 'pyworkflow.gui.project'
+
 
 def launchPluginManager(window):
     os.system("%s %s" % (PYTHON, os.path.join(getInstallPath(), PLUGIN_MANAGER_PY)))
@@ -20,14 +23,10 @@ def launchTemplates(window):
     os.system("%s %s" % (PYTHON, os.path.join(getScriptsPath(), KICKOFF)))
 
 
-# Cancel this for now to prevent an early import of Config and a false initialization
-from pyworkflow.gui.project import ProjectManagerWindow, ProjectWindow
-
-ProjectManagerWindow.registerPluginMenu("Plugin manager", launchPluginManager, None)
-ProjectManagerWindow.registerPluginMenu("Workflow templates", launchTemplates, None)
-
-
 def importFromTemplate(window):
+    # kickoff loads tkinter, templates and projects: only when the menu is used
+    from scipion.scripts.kickoff import (getTemplates, chooseTemplate,
+                                         resolveTemplate, importTemplate)
     templates = getTemplates()
     chosenTemplate = chooseTemplate(templates, parentWindow=window.getRoot())
     if chosenTemplate is not None and resolveTemplate(chosenTemplate, [],
@@ -39,5 +38,38 @@ def importFromTemplate(window):
         importTemplate(chosenTemplate, window)
 
 
-ProjectWindow.registerPluginMenu("Import workflow template", importFromTemplate,
-                                 None)
+def registerMenus():
+    from pyworkflow.gui.project import ProjectManagerWindow, ProjectWindow
+
+    ProjectManagerWindow.registerPluginMenu("Plugin manager", launchPluginManager, None)
+    ProjectManagerWindow.registerPluginMenu("Workflow templates", launchTemplates, None)
+    ProjectWindow.registerPluginMenu("Import workflow template", importFromTemplate,
+                                     None)
+
+
+class _PostImportHook:
+    """ Calls a function right after a module is imported """
+    def __init__(self, moduleName, func):
+        self.moduleName = moduleName
+        self.func = func
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname != self.moduleName:
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        if spec is not None and spec.loader is not None:
+            execModule = spec.loader.exec_module
+
+            def exec_module(module):
+                execModule(module)
+                self.func()
+
+            spec.loader.exec_module = exec_module
+        return spec
+
+
+if WINDOWS_MODULE in sys.modules:
+    registerMenus()
+else:
+    sys.meta_path.insert(0, _PostImportHook(WINDOWS_MODULE, registerMenus))
@@ -25,4 +25,11 @@
 # *
 # **************************************************************************
 
-from .funcs import Environment
+
+def __getattr__(name):
+    """ Environment is imported on first use, so the light modules of this
+    package (sync, plugin_index...) can be used without loading pyworkflow """
+    if name == 'Environment':
+        from .funcs import Environment
+        return Environment
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,167 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Catalog of the binaries defined by the installed plugins, kept on disk.
+
+Knowing which plugin defines a binary means importing every plugin and
+calling its defineBinaries. installb, uninstallb and the plugin manager
+read them from this catalog instead: for each plugin (name and version,
+read from the package metadata) it keeps the targets and the packages
+(name and versions) it defines. Only the plugins installed, upgraded or
+downgraded since the last time are imported again, one by one.
+
+Set SCIPION_BINARY_CATALOG to 0 to always import the plugins.
+"""
+import sys
+
+from scipion.utils import (envOn, getCacheFolder, getInstalledPlugins, readJsonCache,
+                           writeJsonCache)
+
+CATALOG_FILE = 'binary_catalog.json'
+
+
+def isCatalogOn():
+    return envOn('SCIPION_BINARY_CATALOG', True)
+
+
+class BinaryCatalog:
+    """ Binaries of each plugin: {plugin name: {'version', 'dist',
+    'binaries': target names, 'packages': {package: [[name, version], ...]}}} """
+
+    def __init__(self):
+        self.plugins = {}
+
+    @staticmethod
+    def getPath():
+        return getCacheFolder(CATALOG_FILE)
+
+    def load(self):
+        data = readJsonCache(self.getPath())
+        if isinstance(data, dict) and data.get('python') == sys.executable:
+            self.plugins = data.get('plugins', {})
+
+    def update(self, rebuild=False):
+        """ Imports the plugins whose version changed and removes the ones
+        uninstalled. Returns the names of the plugins imported """
+        installed = {name: (dist, version) for name, _, dist, version in getInstalledPlugins()}
+        stale = [name for name, (_, version) in sorted(installed.items())
+                 if rebuild or name not in self.plugins
+                 or self.plugins[name]['version'] != version]
+        removed = [name for name in self.plugins if name not in installed]
+
+        if stale:
+            # Binaries may use the variables of other plugins
+            from scipion.plugin_variables import definePluginVariables
+            definePluginVariables()
+        for name in removed:
+            del self.plugins[name]
+        for name in stale:
+            dist, version = installed[name]
+            self.plugins[name] = dict(version=version, dist=dist, **_getBinaries(name))
+
+        if (stale or removed) and isCatalogOn():
+            writeJsonCache(self.getPath(), {'python': sys.executable, 'plugins': self.plugins})
+        return stale
+
+    def getBinaries(self, distName, version):
+        """ Returns the binaries of a plugin distribution, None if that
+        version is not in the catalog (e.g. installed after loading it) """
+        for entry in self.plugins.values():
+            if _sameDist(entry['dist'], distName) and entry['version'] == version:
+                return entry['binaries']
+        return None
+
+    def getBinToPluginDict(self):
+        """ Returns {binary: plugin name}, for the binaries with and without
+        version, as PluginRepository.getBinToPluginDict did """
+        binToPluginDict = {}
+        for name in sorted(self.plugins):
+            binaries = self.plugins[name]['binaries']
+            binToPluginDict.update({b: name for b in binaries})
+            binToPluginDict.update({b.split('-', 1)[0]: name for b in binaries})
+        return binToPluginDict
+
+    def getEnvironment(self, distName=None):
+        """ Returns an Environment with the packages of all the plugins (or
+        of one), to print its help """
+        from scipion.install.funcs import Environment
+        env = Environment()
+        for entry in self.plugins.values():
+            if distName is None or _sameDist(entry['dist'], distName):
+                for package, versions in entry['packages'].items():
+                    env._packages.setdefault(package, []).extend(tuple(v) for v in versions)
+        return env
+
+
+def _sameDist(name1, name2):
+    """ Compares distribution names as pip does: scipion_em_x is scipion-em-x """
+    def normalize(name):
+        return (name or '').lower().replace('_', '-').replace('.', '-')
+    return normalize(name1) == normalize(name2)
+
+
+def _getBinaries(name):
+    """ Imports a plugin and returns the binaries it defines """
+    from pyworkflow import Config
+    from scipion.install.funcs import Environment
+
+    env = Environment()
+    env.setDefault(False)
+    defaultTargets = [target.getName() for target in env.getTargetList()]
+    try:
+        module = Config.getDomain().getPluginModule(name)
+        module._pluginInstance.defineBinaries(env)
+    except Exception as e:
+        print("Error retrieving plugin %s binaries: %s" % (name, e), file=sys.stderr)
+    return {'binaries': [target.getName() for target in env.getTargetList()
+                         if target.getName() not in defaultTargets],
+            'packages': {package: [list(v) for v in versions]
+                         for package, versions in env._packages.items()}}
+
+
+_catalog = None
+
+
+def getLoadedCatalog():
+    """ Returns the BinaryCatalog as it was loaded or saved, not updated:
+    no plugin is imported """
+    if _catalog is not None:
+        return _catalog
+    catalog = BinaryCatalog()
+    if isCatalogOn():
+        catalog.load()
+    return catalog
+
+
+def getBinaryCatalog():
+    """ Returns the BinaryCatalog, updated for the installed plugins """
+    global _catalog
+    if _catalog is None:
+        _catalog = BinaryCatalog()
+        if isCatalogOn():
+            _catalog.load()
+        _catalog.update(rebuild=not isCatalogOn())
+    return _catalog
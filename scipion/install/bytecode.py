@@ -0,0 +1,196 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Bytecode precompilation of the distributions installed or updated.
+
+pip compiles the files of a wheel one after the other, and nothing compiles
+the sources of plugins installed in editable mode (installp --devel): the
+first launch after an install compiles them, on every node that can write
+the installation. After installp, sync, "update --plugins --upgrade" and
+update, the python files of the distributions involved are compiled in
+parallel processes:
+
+    python -m scipion.install.bytecode [-j N] DIST [DIST ...]
+
+Files whose .pyc is up to date are skipped. SCIPION_PYC_MODE sets how the
+.pyc files are validated: timestamp (default, as pip does) or checked-hash,
+for installations copied or synchronized without keeping the modification
+times. Set SCIPION_PRECOMPILE to 0 to leave the compilation to the imports.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import py_compile
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+
+from scipion.utils import envOn
+
+MODES = {'timestamp': py_compile.PycInvalidationMode.TIMESTAMP,
+         'checked-hash': py_compile.PycInvalidationMode.CHECKED_HASH}
+COMPILED = 'compiled'
+UP_TO_DATE = 'up to date'
+FAILED = 'failed'
+SKIP_FOLDERS = {'__pycache__', '.git'}
+
+
+def isPrecompileOn():
+    return envOn('SCIPION_PRECOMPILE', True)
+
+
+def getPycMode():
+    return os.environ.get('SCIPION_PYC_MODE', 'timestamp').lower()
+
+
+def _isEditable(dist):
+    try:
+        return json.loads(dist.read_text('direct_url.json') or '{}').get(
+            'dir_info', {}).get('editable', False)
+    except ValueError:
+        return False
+
+
+def getSourceFiles(distName):
+    """ Python files of a distribution: the ones in its RECORD or, for
+    editable installs, the ones in its top level packages """
+    try:
+        dist = metadata.distribution(distName)
+    except metadata.PackageNotFoundError:
+        return []
+    if not _isEditable(dist):
+        return [str(dist.locate_file(f)) for f in dist.files or []
+                if f.suffix == '.py' and '..' not in f.parts]
+
+    # The RECORD only has the .pth or finder pointing to the sources
+    moduleNames = (dist.read_text('top_level.txt') or '').split()
+    moduleNames += [ep.value.split(':')[0].split('.')[0] for ep in dist.entry_points]
+    files = []
+    folders = []
+    for moduleName in dict.fromkeys(moduleNames):
+        try:
+            spec = importlib.util.find_spec(moduleName)
+        except (ImportError, ValueError):
+            continue
+        if spec is not None and spec.submodule_search_locations:
+            folders.extend(spec.submodule_search_locations)
+        elif spec is not None and spec.origin and spec.origin.endswith('.py'):
+            files.append(spec.origin)
+    for folder in folders:
+        for root, dirs, fileNames in os.walk(folder):
+            dirs[:] = [d for d in dirs if d not in SKIP_FOLDERS]
+            files.extend(os.path.join(root, f) for f in fileNames if f.endswith('.py'))
+    return files
+
+
+def _isUpToDate(path, pycPath, mode):
+    """ Checks the .pyc header as the import system does """
+    try:
+        with open(pycPath, 'rb') as f:
+            header = f.read(16)
+        if len(header) < 16 or header[:4] != importlib.util.MAGIC_NUMBER:
+            return False
+        flags = int.from_bytes(header[4:8], 'little')
+        if mode == py_compile.PycInvalidationMode.TIMESTAMP:
+            stat = os.stat(path)
+            return (flags == 0 and
+                    int.from_bytes(header[8:12], 'little') == int(stat.st_mtime) & 0xFFFFFFFF and
+                    int.from_bytes(header[12:16], 'little') == stat.st_size & 0xFFFFFFFF)
+        with open(path, 'rb') as f:
+            return flags == 0b11 and header[8:16] == importlib.util.source_hash(f.read())
+    except OSError:
+        return False
+
+
+def compileFile(path, mode=py_compile.PycInvalidationMode.TIMESTAMP):
+    """ Compiles a python file if its .pyc is not up to date """
+    pycPath = importlib.util.cache_from_source(path)
+    if _isUpToDate(path, pycPath, mode):
+        return UP_TO_DATE
+    try:
+        py_compile.compile(path, cfile=pycPath, doraise=True, invalidation_mode=mode)
+        return COMPILED
+    except (py_compile.PyCompileError, OSError, ValueError):
+        # Python 2 examples, templates... or a read only installation
+        return FAILED
+
+
+def compileDists(distNames, jobs=None, mode=None):
+    """ Compiles the python files of the distributions in parallel processes.
+    Returns {status: number of files} and the seconds it took """
+    mode = MODES[mode or getPycMode()]
+    files = sorted({f for distName in distNames for f in getSourceFiles(distName)})
+    t0 = time.time()
+    counts = {COMPILED: 0, UP_TO_DATE: 0, FAILED: 0}
+    if files:
+        jobs = max(1, min(jobs or os.cpu_count() or 1, len(files)))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for status in executor.map(compileFile, files, [mode] * len(files),
+                                       chunksize=max(1, len(files) // (jobs * 4))):
+                counts[status] += 1
+    return counts, time.time() - t0
+
+
+def precompile(distNames):
+    """ Compiles the distributions after they are installed, in another
+    process (the plugin manager runs it in a thread) """
+    distNames = [d for d in distNames if d]
+    if not distNames or not isPrecompileOn():
+        return
+    cmd = [sys.executable, '-m', 'scipion.install.bytecode'] + list(distNames)
+    try:
+        output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                stdin=subprocess.DEVNULL, universal_newlines=True,
+                                errors='replace').stdout
+    except OSError as e:
+        output = "Could not precompile %s: %s\n" % (' '.join(distNames), e)
+    print(output, end='')
+    sys.stdout.flush()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m scipion.install.bytecode',
+                                     description='Compiles the python files of installed '
+                                                 'distributions in parallel processes.')
+    parser.add_argument('distributions', nargs='+', metavar='DIST')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='processes (default: number of cpus)')
+    parser.add_argument('--mode', choices=sorted(MODES), default=None,
+                        help='.pyc validation (default: SCIPION_PYC_MODE or timestamp)')
+    parsedArgs = parser.parse_args(args)
+
+    counts, seconds = compileDists(parsedArgs.distributions, parsedArgs.jobs, parsedArgs.mode)
+    print("Precompiled %s: %d files compiled, %d up to date, %d failed in %.1fs"
+          % (' '.join(parsedArgs.distributions), counts[COMPILED], counts[UP_TO_DATE],
+             counts[FAILED], seconds))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -40,6 +40,8 @@ from pyworkflow import Config
 import pwem
 from typing import List, Tuple, Dict
 
+from .program_index import updateProgramIndex
+
 
 # Then we get some OS vars
 MACOSX = (platform.system() == 'Darwin')
@@ -781,6 +783,8 @@ class Environment:
                 self._showTargetTree(targetList)
         else:
             self._executeTargets(targetList)
+            # Programs of the new binaries
+            updateProgramIndex()
 
     def updateCudaEnviron(self, package):
         """ Update the environment adding CUDA_LIB and/or CUDA_BIN to support
@@ -42,6 +42,8 @@ import pyworkflow.utils as pwutils
 from scipion.install.plugin_funcs import PluginInfo
 
 ERROR_PREFIX = " error -> %s"
+# Submodules of a plugin, in the order they are imported
+PLUGIN_SUBMODULES = ['constants', 'convert', 'protocols', 'wizards', 'viewers', 'tests']
 
 def usage(error=""):
 
@@ -51,7 +53,7 @@ def usage(error=""):
         exitCode = 1
 
     print("""%s
-    Usage: scipion3 python -m scipion.install.inspect_plugins [h]|[all]|[PLUGIN-NAME] [info] [--showBase]
+    Usage: scipion3 python -m scipion.install.inspect_plugins [h]|[all]|[--all-health]|[--static]|[PLUGIN-NAME] [info] [--showBase]
         
         Without parameters this will show the list of avaialble plugins.
         
@@ -65,6 +67,13 @@ def usage(error=""):
           - 'info' argument will print plugin summary of the plugin,
           - '-showBase' will print Base class protocols (hidden by default).
         
+        With '--all-health' will import every plugin in its own process, in parallel,
+        and report the import time and memory of its submodules. Use
+        'scipion3 inspect --all-health -h' to see its options.
+        
+        With '--static [PLUGIN|PATH ...]' will parse the plugins source code, without
+        importing them, and report their protocols, binaries, variables and references.
+        
     """ % error)
     sys.exit(exitCode)
 
@@ -105,6 +114,14 @@ def inspectPlugin(args):
 
     n = len(args)
 
+    if n > 1 and args[1] == '--all-health':
+        from scipion.install.plugin_health import main as checkHealth
+        sys.exit(checkHealth(args[2:]))
+
+    if n > 1 and args[1] == '--static':
+        from scipion.install.static_inspect import main as inspectStatic
+        sys.exit(inspectStatic(args[2:]))
+
     if n > 4:
         usage("Incorrect number of input parameters")
 
@@ -135,8 +152,7 @@ def inspectPlugin(args):
 def showPluginInfo(exitWithErrors, pluginName):
     plugin = Domain.getPluginModule(pluginName)
     print("Plugin: %s" % pluginName)
-    for subName in ['constants', 'convert', 'protocols',
-                    'wizards', 'viewers', 'tests']:
+    for subName in PLUGIN_SUBMODULES:
         sub, error = getSubmodule(plugin, pluginName, subName)
 
         if sub is None:
@@ -173,6 +189,12 @@ def showInfo(args, anyError, n):
 
 def showProtocols(anyError, plugin, pluginName, showBase):
 
+    from scipion.protocol_catalog import getCatalogEntry
+    # Read from the catalog if it is up to date for this plugin, without importing the others
+    entry = getCatalogEntry(pluginName)
+    if entry is not None:
+        return showCatalogProtocols(anyError, entry, showBase)
+
     subclasses=dict()
 
     sub, error = getSubmodule(plugin, pluginName, 'protocols')
@@ -204,6 +226,21 @@ def showProtocols(anyError, plugin, pluginName, showBase):
     return anyError
 
 
+def showCatalogProtocols(anyError, entry, showBase):
+    """ Same as showProtocols, read from the protocol catalog entry of the plugin """
+    if entry['error']:
+        anyError = True
+    print("Plugin protocols:\n")
+    print("%-35s %-35s %-s" % (
+        'NAME', 'LABEL', 'DESCRIPTION'))
+    for prot in sorted(entry['protocols'], key=lambda p: p['name']):
+        # skip Base protocols if not requested
+        if prot['base'] and not showBase:
+            continue
+        print("%-35s %-35s %-s" % (prot['name'], prot['label'], prot['doc']))
+    return anyError
+
+
 def showReferences(anyError, plugin, pluginName):
     bib, error2 = getSubmodule(plugin, pluginName, 'bibtex')
     if bib is None:
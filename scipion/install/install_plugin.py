@@ -30,9 +30,9 @@ import os
 import re
 
 from scipion.constants import MODE_INSTALL_PLUGIN, MODE_UNINSTALL_PLUGIN
-from scipion.install import Environment
+from scipion.install.binary_catalog import getBinaryCatalog
 from scipion.install.plugin_funcs import PluginRepository, PluginInfo, installBinsDefault
-from pyworkflow.utils import redStr
+from scipion.plugin_variables import definePluginVariables
 
 #  ************************************************************************
 #  *                                                                      *
@@ -52,8 +52,8 @@ SCIPION_CMD = "scipion"
 def installPluginMethods():
     """ Deals with plugin installation methods"""
 
-    # Trigger plugin's variable definition
-    Config.getDomain().getPlugins()
+    # Define the plugin's variables without importing all the plugins
+    definePluginVariables()
 
     invokeCmd = SCIPION_CMD + " " + sys.argv[1]
     pluginRepo = PluginRepository()
@@ -179,16 +179,7 @@ def installPluginMethods():
         if mode not in [MODE_INSTALL_BINS, MODE_UNINSTALL_BINS]:
             parserUsed.epilog += pluginRepo.printPluginInfoStr()
         else:
-            env = Environment()
-            env.setDefault(False)
-            installedPlugins = Config.getDomain().getPlugins()
-            for p, pobj in installedPlugins.items():
-                try:
-                    pobj._pluginInstance.defineBinaries(env)
-                except Exception as e:
-                    print(
-                        redStr("Error retrieving plugin %s binaries: " % str(p)), e)
-            parserUsed.epilog += env.printHelp()
+            parserUsed.epilog += getBinaryCatalog().getEnvironment().printHelp()
         parserUsed.print_help()
         parserUsed.exit(0)
 
@@ -255,7 +246,7 @@ def installPluginMethods():
 
     elif parsedArgs.mode == MODE_INSTALL_BINS:
         binToInstallList = parsedArgs.binName
-        binToPlugin = pluginRepo.getBinToPluginDict()
+        binToPlugin = getBinaryCatalog().getBinToPluginDict()
         for binTarget in binToInstallList:
             pluginTargetName = binToPlugin.get(binTarget, None)
             if pluginTargetName is None:
@@ -269,7 +260,7 @@ def installPluginMethods():
     elif parsedArgs.mode == MODE_UNINSTALL_BINS:
 
         binToInstallList = parsedArgs.binName
-        binToPlugin = pluginRepo.getBinToPluginDict()
+        binToPlugin = getBinaryCatalog().getBinToPluginDict()
         for binTarget in binToInstallList:
             pluginTargetName = binToPlugin.get(binTarget, None)
             if pluginTargetName is None:
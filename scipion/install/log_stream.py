@@ -0,0 +1,151 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Incremental output streams used by the plugin manager.
+
+Everything written to a LogStream (from python or from child processes
+inheriting its file descriptor) goes through a pipe. A reader thread
+appends it to the log file on disk and hands the new lines over to the
+GUI through a queue, so the GUI never has to re-read the log file.
+"""
+import os
+import queue
+import threading
+from collections import deque
+
+# Max lines kept in memory for each operation
+OPERATION_BUFFER_SIZE = 2000
+# In-band mark used to tell the reader thread that a new operation starts
+OPERATION_MARK = '\x00operation:'
+SYNC_MARK = '\x00sync\n'
+
+
+class LogStream:
+    """ Pipe backed stream that mirrors its content into a log file and
+    keeps a bounded buffer with the last lines of each operation. """
+
+    def __init__(self, logPath, bufferSize=OPERATION_BUFFER_SIZE):
+        self.logPath = logPath
+        self.bufferSize = bufferSize
+        self._logFile = open(logPath, 'wb')  # a new log for each run
+        self._offset = 0
+        self._newLines = queue.Queue()
+        self._buffers = {}
+        self._operation = None
+        self._writer = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+
+    def open(self):
+        """ Create the pipe and start the reader thread. Returns the
+        writable side, to be used as sys.stdout or sys.stderr. """
+        if self._writer is None:
+            readFd, writeFd = os.pipe()
+            # Line buffered so the GUI gets the output as soon as a line is completed
+            self._writer = os.fdopen(writeFd, 'w', buffering=1,
+                                     encoding='utf-8', errors='replace')
+            self._reader = threading.Thread(name="log-stream-%s" % os.path.basename(self.logPath),
+                                            target=self._readLoop, args=(readFd,),
+                                            daemon=True)
+            self._reader.start()
+        return self._writer
+
+    def close(self):
+        """ Close the writable side and wait until all pending output
+        has been written to disk. """
+        if self._writer is not None:
+            self._writer.close()
+            self._reader.join()
+            self._writer = None
+            self._reader = None
+
+    def beginOperation(self, name):
+        """ Lines written from now on belong to operation name. The mark
+        travels through the pipe so the output already written by the
+        previous operation is not attributed to the new one. """
+        if self._writer is not None:
+            self._writer.write('%s%s\n' % (OPERATION_MARK, name))
+            self._writer.flush()
+        else:
+            self._setOperation(name)
+
+    def sync(self, timeout=5):
+        """ Wait until everything written so far has been processed
+        by the reader thread. """
+        if self._writer is not None:
+            self._synced.clear()
+            self._writer.write(SYNC_MARK)
+            self._writer.flush()
+            self._synced.wait(timeout)
+
+    def _setOperation(self, name):
+        with self._lock:
+            self._operation = name
+            if name is not None:
+                self._buffers[name] = deque(maxlen=self.bufferSize)
+
+    def getOperationLines(self, name):
+        """ Return the last lines written during operation name. """
+        with self._lock:
+            return list(self._buffers.get(name, []))
+
+    def getNewLines(self):
+        """ Return the list of (line, offset) pairs written since the last call
+        without blocking. Offset is the position in the log file right after
+        the line. """
+        lines = []
+        while True:
+            try:
+                lines.append(self._newLines.get_nowait())
+            except queue.Empty:
+                return lines
+
+    def _readLoop(self, readFd):
+        with os.fdopen(readFd, 'rb') as pipe:
+            for rawLine in pipe:
+                line = rawLine.decode('utf-8', errors='replace')
+                markPos = line.find('\x00')
+                if markPos > 0:
+                    # Unfinished line written just before a mark
+                    self._addLine(line[:markPos] + '\n')
+                    line = line[markPos:]
+                if line == SYNC_MARK:
+                    self._synced.set()
+                elif line.startswith(OPERATION_MARK):
+                    self._setOperation(line[len(OPERATION_MARK):].rstrip('\n'))
+                else:
+                    self._addLine(line)
+
+    def _addLine(self, line):
+        rawLine = line.encode('utf-8')
+        self._logFile.write(rawLine)
+        self._logFile.flush()
+        self._offset += len(rawLine)
+        with self._lock:
+            if self._operation is not None:
+                self._buffers[self._operation].append(line)
+        self._newLines.put((line, self._offset))
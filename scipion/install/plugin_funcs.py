@@ -1,17 +1,21 @@
-import requests
 import os
 import re
 import sys
 import json
-import pkg_resources
-from pkg_resources import parse_version
+import time
+import threading
+from importlib import metadata
 
 from .funcs import Environment
-from pwem import Domain
+from .program_index import updateProgramIndex
+from .bytecode import precompile
+from .snapshots import takeSnapshot
 from pyworkflow.utils import redStr, yellowStr
 from pyworkflow.utils.path import cleanPath
 from pyworkflow import LAST_VERSION, CORE_VERSION, Config
-from importlib import reload
+from scipion.utils import getCacheFolder, readJsonCache, writeJsonCache, parse_version
+# requests, pkg_resources and pwem are slow to import and only needed by some
+# operations, so they are imported when used
 
 NULL_VERSION = "0.0.0"
 # This constant is used in order to install all plugins taking into account a
@@ -23,18 +27,97 @@ REPOSITORY_URL = Config.SCIPION_PLUGIN_JSON
 if REPOSITORY_URL is None:
     REPOSITORY_URL = Config.SCIPION_PLUGIN_REPO_URL
 
-PIP_BASE_URL = 'https://pypi.python.org/pypi'
+# Can be pointed to a pypi mirror or a local stand-in (benchmarks)
+PIP_BASE_URL = os.environ.get('SCIPION_PYPI_URL', 'https://pypi.python.org/pypi')
 PIP_CMD = '{0} -m pip install %(installSrc)s'.format(
     Environment.getPython())
 
 PIP_UNINSTALL_CMD = '{0} -m pip uninstall -y %s'.format(
     Environment.getPython())
 
+# Remote data (plugin repository and pypi) is cached in this file
+REMOTE_CACHE_FILE = 'plugins_remote.json'
+# Hours after which the cached remote data is requested again
+REMOTE_CACHE_TTL = float(os.environ.get('SCIPION_PLUGIN_CACHE_TTL', 24)) * 3600
+# Seconds to wait for the plugin repository or pypi
+REMOTE_TIMEOUT = float(os.environ.get('SCIPION_REMOTE_TIMEOUT', 10))
+# pypi json fields used by PluginInfo. The rest is not cached
+PIP_INFO_KEYS = ['home_page', 'project_urls', 'summary', 'author', 'author_email']
+
+
+class RemoteDataCache:
+    """ Keeps the plugin repository and the pypi data of the plugins
+    between executions, so the plugin list can be shown without
+    network round-trips. """
+    _data = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def getPath(cls):
+        return getCacheFolder(REMOTE_CACHE_FILE)
+
+    @classmethod
+    def _getData(cls):
+        if cls._data is None:
+            data = readJsonCache(cls.getPath())
+            cls._data = data if isinstance(data, dict) else {}
+            cls._data.setdefault('repositories', {})
+            cls._data.setdefault('pypi', {})
+        return cls._data
+
+    @classmethod
+    def _get(cls, section, key, maxAge):
+        """ Returns the cached value or None if missing or older than maxAge
+        seconds. maxAge None means any age. """
+        with cls._lock:
+            entry = cls._getData()[section].get(key)
+        if entry is None:
+            return None
+        if maxAge is not None and time.time() - entry['time'] > maxAge:
+            return None
+        return entry['data']
+
+    @classmethod
+    def _set(cls, section, key, data):
+        with cls._lock:
+            cls._getData()[section][key] = {'time': time.time(), 'data': data}
+
+    @classmethod
+    def getRepository(cls, repoUrl, maxAge=REMOTE_CACHE_TTL):
+        return cls._get('repositories', repoUrl, maxAge)
+
+    @classmethod
+    def setRepository(cls, repoUrl, pluginsJson):
+        cls._set('repositories', repoUrl, pluginsJson)
+
+    @classmethod
+    def getPipData(cls, pipName, maxAge=REMOTE_CACHE_TTL):
+        return cls._get('pypi', pipName, maxAge)
+
+    @classmethod
+    def setPipData(cls, pipName, pipJsonData):
+        """ Caches the part of the pypi json data used by PluginInfo """
+        info = pipJsonData.get('info', {})
+        releases = {}
+        for release, releaseData in pipJsonData.get('releases', {}).items():
+            releases[release] = [{'comment_text': r.get('comment_text', ''),
+                                  'upload_time': r.get('upload_time', '')}
+                                 for r in releaseData[:1]]
+        cls._set('pypi', pipName,
+                 {'info': {k: info.get(k) for k in PIP_INFO_KEYS},
+                  'releases': releases})
+
+    @classmethod
+    def save(cls):
+        with cls._lock:
+            if cls._data is not None:
+                writeJsonCache(cls.getPath(), cls._data)
+
 
 class PluginInfo(object):
 
     def __init__(self, pipName="", name="", pluginSourceUrl="", remote=True,
-                 plugin=None, **kwargs):
+                 plugin=None, offline=False, **kwargs):
         self.pipName = pipName
         self.name = name
         self.pluginSourceUrl = pluginSourceUrl
@@ -51,14 +134,14 @@ class PluginInfo(object):
         # things we have when installed
         self.dirName = ""
         self.pipVersion = ""
-        self.binVersions = []
+        self._binVersions = None
         self.pluginEnv = None
 
         # Distribution
         self._dist = None
         self._plugin = plugin
         if self.remote:
-            self.setRemotePluginInfo()
+            self.setRemotePluginInfo(offline=offline)
         else:
             self.setFakedRemotePluginInfo()
 
@@ -74,11 +157,12 @@ class PluginInfo(object):
         self.setLocalPluginInfo()
 
     def _getDistribution(self):
-        if self._dist is None:
-            try:
-                self._dist = pkg_resources.get_distribution(self.pipName)
-            except:
-                pass
+        """ Returns the installed distribution read from its metadata on
+        disk, so it is always up to date, or None if not installed """
+        try:
+            self._dist = metadata.distribution(self.pipName)
+        except metadata.PackageNotFoundError:
+            self._dist = None
         return self._dist
 
     def _getPlugin(self):
@@ -98,7 +182,6 @@ class PluginInfo(object):
     def isInstalled(self):
         """Checks if the current plugin is installed (i.e. has pip package).
         NOTE: we might want to change definition of isInstalled, hence the extra function."""
-        reload(pkg_resources)
         return self.hasPipPackage()
 
     def installPipModule(self, version=""):
@@ -148,16 +231,23 @@ class PluginInfo(object):
 
         # check if we're doing a version change of an already installed plugin
         reloadPkgRes = self.isInstalled()
+        if reloadPkgRes:
+            takeSnapshot([self.pipName], reason='install %s %s' % (self.pipName, version))
 
         environment.execute()
+        precompile([self.pipName])
         # we already have a dir for the plugin:
         if reloadPkgRes:
             # if plugin was already installed, pkg_resources has the old one
             # so it needs a reload
-            reload(pkg_resources)
+            if 'pkg_resources' in sys.modules:
+                from importlib import reload
+                reload(sys.modules['pkg_resources'])
+            from pwem import Domain
             self.dirName = self.getDirName()
             Domain.refreshPlugin(self.dirName)
             self._plugin = None
+            self._binVersions = None
         return True
 
     def installBin(self, args=None):
@@ -189,11 +279,13 @@ class PluginInfo(object):
                 print('Binary %s has been uninstalled successfully ' % binVersion)
             else:
                 print('The binary %s does not exist ' % binVersion)
+        updateProgramIndex()
         return
 
     def uninstallPip(self):
         """Removes pip package from site-packages"""
         print('Removing %s plugin...' % self.pipName)
+        takeSnapshot([self.pipName], reason='uninstall %s' % self.pipName)
         import subprocess
         args = (PIP_UNINSTALL_CMD % self.pipName).split()
         subprocess.call(PIP_UNINSTALL_CMD % self.pipName, shell=True,
@@ -202,12 +294,33 @@ class PluginInfo(object):
 
     # ###################### Remote data funcs ############################
 
-    def getPipJsonData(self):
-        """"Request json data from pypi, return json content"""
-        pipData = requests.get("%s/%s/json" % (PIP_BASE_URL, self.pipName))
-        if pipData.ok:
+    def getPipJsonData(self, maxAge=REMOTE_CACHE_TTL, offline=False):
+        """"Request json data from pypi, return json content.
+
+        :param maxAge: seconds after which cached data is requested again. 0 forces the request.
+        :param offline: if True, only cached data (of any age) is returned.
+        """
+        if offline:
+            return RemoteDataCache.getPipData(self.pipName, maxAge=None) or {}
+
+        cached = RemoteDataCache.getPipData(self.pipName, maxAge) if maxAge else None
+        if cached is not None:
+            return cached
+
+        import requests
+        try:
+            pipData = requests.get("%s/%s/json" % (PIP_BASE_URL, self.pipName),
+                                   timeout=REMOTE_TIMEOUT)
+        except requests.RequestException:
+            pipData = None
+
+        if pipData is not None and pipData.ok:
             pipData = pipData.json()
+            RemoteDataCache.setPipData(self.pipName, pipData)
             return pipData
+        elif RemoteDataCache.getPipData(self.pipName, maxAge=None) is not None:
+            # Better outdated data than nothing
+            return RemoteDataCache.getPipData(self.pipName, maxAge=None)
         else:
             print("Warning: Couldn't get remote plugin data for %s" % self.pipName)
             return {}
@@ -243,9 +356,9 @@ class PluginInfo(object):
         releases['latest'] = latestCompRelease
         return releases
 
-    def setRemotePluginInfo(self):
+    def setRemotePluginInfo(self, maxAge=REMOTE_CACHE_TTL, offline=False):
         """Sets value for the attributes that need to be obtained from pypi"""
-        pipData = self.getPipJsonData()
+        pipData = self.getPipJsonData(maxAge=maxAge, offline=offline)
         if not pipData:
             return
         info = pipData['info']
@@ -298,29 +411,21 @@ class PluginInfo(object):
         plugin is installed."""
         if self.isInstalled():
 
-            metadata = {}
+            pkgMetadata = {}
             # Take into account 2 cases here:
             # A.: plugin is a proper pipmodule and is installed as such
             # B.: Plugin is not yet a pipmodule but a local folder.
             try:
-                package = pkg_resources.get_distribution(self.pipName)
-                keys = ['Name', 'Version', 'Summary', 'Home-page', 'Author',
-                        'Author-email']
-                pattern = r'(.*): (.*)'
-
-                for line in package._get_metadata(package.PKG_INFO):
-                    match = re.match(pattern, line)
-                    if match:
-                        key = match.group(1)
-                        if key in keys:
-                            metadata[key] = match.group(2)
-                            keys.remove(key)
-                            if not len(keys):
-                                break
-
-                self.pipVersion = metadata.get('Version', "")
+                package = self._dist.metadata
+                for key in ['Name', 'Version', 'Summary', 'Home-page', 'Author',
+                            'Author-email']:
+                    if package.get(key) is not None:
+                        pkgMetadata[key] = package.get(key)
+
+                self.pipVersion = pkgMetadata.get('Version', "")
                 self.dirName = self.getDirName()
-                self.binVersions = self.getBinVersions()
+                # Binaries need the plugin to be imported: resolved on demand
+                self._binVersions = None
 
             except:
                 # Case B: code local but not yet a pipmodule.
@@ -328,10 +433,41 @@ class PluginInfo(object):
 
             if not self.remote:
                 # only do this if we don't already have it from remote
-                self.homePage = metadata.get('Home-page', "")
-                self.summary = metadata.get('Summary', "")
-                self.author = metadata.get('Author', "")
-                self.email = metadata.get('Author-email', "")
+                self.homePage = pkgMetadata.get('Home-page', "")
+                self.summary = pkgMetadata.get('Summary', "")
+                self.author = pkgMetadata.get('Author', "")
+                self.email = pkgMetadata.get('Author-email', "")
+
+    def refreshLocalInfo(self):
+        """Reads again the local information of the plugin after it has been
+        installed, updated or uninstalled. Remote data is kept, so no request
+        is done."""
+        self._dist = None
+        self._plugin = None
+        self._binVersions = None
+        self.pluginEnv = None
+        self.pipVersion = ""
+        self.dirName = ""
+        self.setLocalPluginInfo()
+
+    @property
+    def binVersions(self):
+        """ Names of the binaries of this plugin. They are read from the
+        binary catalog; the plugin is only imported if this version of it
+        is not there. """
+        if self._binVersions is None:
+            if self.isInstalled():
+                from .binary_catalog import getBinaryCatalog
+                self._binVersions = getBinaryCatalog().getBinaries(self.pipName, self.pipVersion)
+                if self._binVersions is None:
+                    self._binVersions = self.getBinVersions()
+            else:
+                self._binVersions = []
+        return self._binVersions
+
+    @binVersions.setter
+    def binVersions(self, value):
+        self._binVersions = value
 
     def getPluginClass(self):
         """ Tries to find the Plugin object."""
@@ -347,10 +483,16 @@ class PluginInfo(object):
 
     def getInstallenv(self, envArgs=None):
         """Reads the defineBinaries function from Plugin class and returns an
-        Environment object with the plugin's binaries."""
+        Environment object with the plugin's binaries. Without envArgs, the
+        Environment is kept until the local info is refreshed."""
         if envArgs is None:
-            envArgs = dict()
+            if self.pluginEnv is None:
+                self.pluginEnv = self._getInstallenv(dict())
+            return self.pluginEnv
 
+        return self._getInstallenv(envArgs)
+
+    def _getInstallenv(self, envArgs):
         env = Environment(**envArgs)
         env.setDefault(False)
 
@@ -387,7 +529,7 @@ class PluginInfo(object):
         # top level file is a file included in all pip packages that contains
         # the name of the package's top level directory
         try:
-            return pkg_resources.get_distribution(self.pipName).get_metadata('top_level.txt').strip()
+            return metadata.distribution(self.pipName).read_text('top_level.txt').strip()
         except Exception as e:
             return None
 
@@ -395,7 +537,12 @@ class PluginInfo(object):
         """Returns string with info of binaries installed to print in console
         with flag --help"""
         try:
-            env = self.getInstallenv()
+            from .binary_catalog import getBinaryCatalog
+            catalog = getBinaryCatalog()
+            if catalog.getBinaries(self.pipName, self.pipVersion) is not None:
+                env = catalog.getEnvironment(self.pipName)
+            else:
+                env = self.getInstallenv()
 
             return env.printHelp().split('\n', 1)[1]
         except IndexError as noBins:
@@ -449,22 +596,18 @@ class PluginRepository(object):
 
     @staticmethod
     def getBinToPluginDict():
-        localPlugins = Domain.getPlugins()
-        binToPluginDict = {}
-        for p, pobj in localPlugins.items():
-            pinfo = PluginInfo(name=p, plugin=pobj, remote=False)
-            pbins = pinfo.getBinVersions()
-            binToPluginDict.update({k: p for k in pbins})
-            pbinsNoVersion = set([b.split('-', 1)[0] for b in pbins])
-            binToPluginDict.update({k: p for k in pbinsNoVersion})
-        return binToPluginDict
-
-    def getPlugins(self, pluginList=None, getPipData=False):
+        from .binary_catalog import getBinaryCatalog
+        return getBinaryCatalog().getBinToPluginDict()
+
+    def getPlugins(self, pluginList=None, getPipData=False, offline=False):
         """Reads available plugins from self.repoUrl and returns a dict with
         PluginInfo objects. Params:
         - pluginList: A list with specific plugin pip-names we want to get.
         - getPipData: If true, each PluginInfo object will try to get the data
-        of the plugin from pypi."""
+        of the plugin from pypi.
+        - offline: If true, cached remote data is used whatever its age and
+        pypi is not contacted. Plugins without cached data are returned
+        without remote information."""
 
         pluginsJson = {}
         if self.plugins is None:
@@ -475,20 +618,13 @@ class PluginRepository(object):
                 pluginsJson = json.load(f)
             getPipData = False
         else:
-            try:
-                r = requests.get(self.repoUrl)
-                getPipData = True
-            except requests.ConnectionError as e:
-                print("\nWARNING: Error while trying to connect with a server:\n"
-                      "  > Please, check your internet connection!\n")
-                print(e)
-                return self.plugins
-            if r.ok:
-                pluginsJson = r.json()
-            else:
-                print("WARNING: Can't get Scipion's plugin list, the plugin "
-                      "repository is not available")
-                return self.plugins
+            getPipData = True
+            pluginsJson = RemoteDataCache.getRepository(self.repoUrl,
+                                                        maxAge=None if offline else REMOTE_CACHE_TTL)
+            if pluginsJson is None:
+                pluginsJson = self._requestRepository()
+                if pluginsJson is None:
+                    return self.plugins
 
         availablePlugins = pluginsJson.keys()
 
@@ -505,13 +641,39 @@ class PluginRepository(object):
                       "scipion installp --help")
 
         for pluginName in targetPlugins:
-            pluginsJson[pluginName].update(remote=getPipData)
-            pluginInfo = PluginInfo(**pluginsJson[pluginName])
-            if pluginInfo.getLatestRelease() != NULL_VERSION:
+            pluginKwargs = dict(pluginsJson[pluginName], remote=getPipData,
+                                offline=offline)
+            pluginInfo = PluginInfo(**pluginKwargs)
+            # Without cached data, the releases are unknown until pypi is contacted
+            if offline or pluginInfo.getLatestRelease() != NULL_VERSION:
                 self.plugins[pluginName] = pluginInfo
 
+        if getPipData and not offline:
+            RemoteDataCache.save()
+
         return self.plugins
 
+    def _requestRepository(self):
+        """ Requests the plugin list from self.repoUrl. Returns None if
+        it is not available. """
+        import requests
+        try:
+            r = requests.get(self.repoUrl, timeout=REMOTE_TIMEOUT)
+        except requests.RequestException as e:
+            print("\nWARNING: Error while trying to connect with a server:\n"
+                  "  > Please, check your internet connection!\n")
+            print(e)
+            return RemoteDataCache.getRepository(self.repoUrl, maxAge=None)
+        if r.ok:
+            pluginsJson = r.json()
+            RemoteDataCache.setRepository(self.repoUrl, pluginsJson)
+            RemoteDataCache.save()
+            return pluginsJson
+        else:
+            print("WARNING: Can't get Scipion's plugin list, the plugin "
+                  "repository is not available")
+            return RemoteDataCache.getRepository(self.repoUrl, maxAge=None)
+
     def printPluginInfoStr(self, withBins=False, withUpdates=False):
         """Returns string to print in console which plugins are installed.
 
@@ -0,0 +1,246 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Import health of all the installed plugins.
+
+    scipion inspect --all-health [-j N] [--sort KEY] [--timeout SECONDS] [--output json]
+
+Each plugin is imported in its own python process, several at the same
+time, so plugins do not hide each other's import cost. The worker imports
+pyworkflow and pwem first (reported as the base cost), then the plugin and
+its submodules, recording the wall time and the memory (resident set size)
+added by each one. Imports of other plugins the plugin depends on are
+counted in the plugin.
+
+The plugins are read from the package metadata: this process does not
+import any of them.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scipion.utils import getInstalledPlugins
+
+# The worker writes its result in a line starting with this
+RESULT_PREFIX = 'SCIPION_HEALTH '
+INIT = '__init__'
+SORT_KEYS = ['name', 'time', 'memory', 'errors']
+DEFAULT_TIMEOUT = 300
+
+
+def _getRss():
+    """ Resident memory of this process, in bytes """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource  # peak memory: only grows
+        maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxRss if sys.platform == 'darwin' else maxRss * 1024
+
+
+def _measure(func):
+    """ Calls func. Returns (result, seconds, bytes) """
+    rss = _getRss()
+    t0 = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - t0, _getRss() - rss
+
+
+def checkPlugin(pluginName, moduleName, onProgress=None):
+    """ Imports a plugin and its submodules in this process. Returns the
+    import time and memory of each one. onProgress(health) is called
+    before each import, with the name of the module in health['importing'] """
+    import importlib
+    import traceback
+
+    health = {'plugin': pluginName, 'modules': [], 'errors': {}, 'importing': None}
+    _, health['baseTime'], health['baseMemory'] = _measure(
+        lambda: importlib.import_module('scipion.install.inspect_plugins'))
+    from scipion.install.inspect_plugins import PLUGIN_SUBMODULES, getSubmodule
+
+    def progress(importing):
+        health['importing'] = importing
+        if onProgress is not None:
+            onProgress(health)
+
+    progress(INIT)
+    try:
+        plugin, seconds, memory = _measure(lambda: importlib.import_module(moduleName))
+    except Exception:
+        health['errors'][INIT] = traceback.format_exc()
+        health['modules'].append([INIT, 'error', None, None])
+        progress(None)
+        return health
+    health['modules'].append([INIT, 'loaded', seconds, memory])
+
+    for subName in PLUGIN_SUBMODULES:
+        progress(subName)
+        (sub, error), seconds, memory = _measure(
+            lambda: getSubmodule(plugin, moduleName, subName))
+        if sub is not None:
+            health['modules'].append([subName, 'loaded', seconds, memory])
+        elif error is None:
+            health['modules'].append([subName, 'missing', None, None])
+        else:
+            health['errors'][subName] = error
+            health['modules'].append([subName, 'error', seconds, memory])
+    progress(None)
+    return health
+
+
+def runWorker(plugin, timeout=DEFAULT_TIMEOUT, env=None):
+    """ Checks a plugin, [name, module, ...], in a new python process """
+    name, module = plugin[0], plugin[1].split(':')[0]
+    cmd = [sys.executable, '-m', 'scipion.install.plugin_health', '--worker', name, module]
+    try:
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 stdin=subprocess.DEVNULL, universal_newlines=True,
+                                 timeout=timeout, env=env)
+    except subprocess.TimeoutExpired:
+        return {'plugin': name, 'modules': [[INIT, 'error', None, None]],
+                'errors': {INIT: 'Not imported after %d seconds' % timeout}}
+
+    health = {'plugin': name, 'modules': [], 'errors': {}, 'importing': INIT}
+    for line in reversed(process.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            health = json.loads(line[len(RESULT_PREFIX):])
+            break
+    importing = health.pop('importing')
+    if importing is not None:
+        # The worker died: a crash in an extension module, sys.exit in the plugin...
+        health['modules'].append([importing, 'error', None, None])
+        health['errors'][importing] = 'Worker exited with code %s\n%s' % (
+            process.returncode, '\n'.join(process.stderr.splitlines()[-10:]))
+    return health
+
+
+def checkPlugins(plugins=None, jobs=None, timeout=DEFAULT_TIMEOUT):
+    """ Checks the plugins, [name, module, ...] as returned by
+    getInstalledPlugins, in parallel processes """
+    plugins = getInstalledPlugins() if plugins is None else plugins
+    jobs = jobs or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(lambda p: runWorker(p, timeout), plugins))
+
+
+def getTotals(health):
+    """ Returns (seconds, bytes) added by importing the plugin """
+    seconds = sum(m[2] or 0 for m in health['modules'])
+    memory = sum(m[3] or 0 for m in health['modules'])
+    return seconds, memory
+
+
+def sortHealth(results, key):
+    if key == 'name':
+        return sorted(results, key=lambda h: h['plugin'])
+    if key == 'errors':
+        return sorted(results, key=lambda h: (-len(h['errors']), h['plugin']))
+    if key == 'time' or key == 'memory':
+        index = 0 if key == 'time' else 1
+        return sorted(results, key=lambda h: getTotals(h)[index], reverse=True)
+    # A submodule: slowest import of it first
+    return sorted(results, key=lambda h: max([m[2] or 0 for m in h['modules'] if m[0] == key] or [0]),
+                  reverse=True)
+
+
+def printReport(results):
+    columns = []
+    for health in results:
+        for module in health['modules']:
+            if module[0] not in columns:
+                columns.append(module[0])
+
+    row = "{:<25} {:>8} {:>8}" + " {:>11}" * len(columns)
+    print(row.format('PLUGIN', 'TIME(s)', 'MEM(MB)', *columns))
+    for health in results:
+        modules = {m[0]: m for m in health['modules']}
+        cells = []
+        for column in columns:
+            module = modules.get(column)
+            if module is None or module[1] == 'missing':
+                cells.append('-')
+            elif module[1] == 'error':
+                cells.append('ERROR')
+            else:
+                cells.append('%.2f' % module[2])
+        seconds, memory = getTotals(health)
+        print(row.format(health['plugin'], '%.2f' % seconds, '%.1f' % (memory / 2 ** 20), *cells))
+
+    base = [h['baseTime'] for h in results if 'baseTime' in h]
+    if base:
+        print("\nBase import (pyworkflow, pwem) not included: %.2fs on average." % (sum(base) / len(base)))
+
+    for health in results:
+        for subName, error in health['errors'].items():
+            print("\n%s.%s:\n%s" % (health['plugin'], subName, error.rstrip()))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog='scipion inspect --all-health',
+                                     description='Imports every installed plugin in isolated '
+                                                 'processes and reports the import time and '
+                                                 'memory of each submodule.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='plugins checked at the same time (default: number of cpus)')
+    parser.add_argument('--sort', default='time',
+                        help='sort by: %s or a submodule name' % ', '.join(SORT_KEYS))
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT,
+                        help='seconds to wait for the import of each plugin')
+    parser.add_argument('--output', choices=['table', 'json'], default='table')
+    parsedArgs = parser.parse_args(args)
+
+    results = sortHealth(checkPlugins(jobs=parsedArgs.jobs, timeout=parsedArgs.timeout),
+                         parsedArgs.sort)
+    if parsedArgs.output == 'json':
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    else:
+        printReport(results)
+    return 1 if any(h['errors'] for h in results) else 0
+
+
+def _worker(pluginName, moduleName):
+    # Whatever the plugins print does not mix with the result
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+
+    def write(health):
+        stdout.write(RESULT_PREFIX + json.dumps(health) + '\n')
+        stdout.flush()
+
+    checkPlugin(pluginName, moduleName, onProgress=write)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--worker']:
+        _worker(*sys.argv[2:4])
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,235 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Searchable index of the plugin catalog.
+
+The index keeps the plugin names, summaries, authors and the binaries
+(names and versions) known for each plugin. It is saved in the scipion
+cache folder so "scipion plugins search" answers without importing any
+plugin. The plugin manager keeps it up to date as it loads the plugins.
+"""
+import argparse
+import re
+import time
+from bisect import bisect_left
+from difflib import get_close_matches
+
+from scipion.utils import getCacheFolder, getInstalledVersion, readJsonCache, writeJsonCache
+
+INDEX_FILE = 'plugins_index.json'
+
+# Fields of an index entry and the score of a match in each of them
+FIELD_NAME = 'name'
+FIELD_BINARY = 'binary'
+FIELD_SUMMARY = 'summary'
+FIELD_AUTHOR = 'author'
+FIELD_SCORES = {FIELD_NAME: 8, FIELD_BINARY: 6, FIELD_SUMMARY: 2, FIELD_AUTHOR: 2}
+# Close (fuzzy) matches are worth less than prefix matches
+FUZZY_FACTOR = 0.5
+FUZZY_CUTOFF = 0.75
+
+_WORD_RE = re.compile(r'[\w.]+')
+
+
+def _getWords(text):
+    """ Lower case words of text. Words with dots or underscores are also
+    split in their parts, and versions in their dotted prefixes:
+    ctffind_4.1.14 -> ctffind_4.1.14, ctffind, 4.1.14, 4.1, 4, 1, 14 """
+    words = set()
+    for word in _WORD_RE.findall(text.lower().replace('-', ' ')):
+        words.add(word)
+        for part in word.split('_'):
+            parts = [p for p in part.split('.') if p]
+            words.update(parts)
+            words.update('.'.join(parts[:i]) for i in range(2, len(parts) + 1))
+    return words
+
+
+class PluginIndex:
+    """ Index of the plugin catalog with prefix and fuzzy search.
+
+    Entries are dictionaries keyed by pip name with: summary, author,
+    version (latest release) and binaries (list of name-version). """
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self._tokens = None  # sorted (word, pipName, field) tuples
+
+    # ###################### Building ############################
+
+    def addPlugin(self, pluginInfo, binaries=None):
+        """ Add or update the entry of a PluginInfo object. Known
+        binaries are kept if none are given. """
+        pipName = pluginInfo.getPipName()
+        entry = self.entries.get(pipName, {})
+        if binaries is None:
+            binaries = entry.get('binaries', [])
+        self.entries[pipName] = {'summary': (pluginInfo.getSummary() or '').strip(),
+                                 'author': (pluginInfo.getAuthor() or '').strip(),
+                                 'version': pluginInfo.getLatestRelease() or '',
+                                 'binaries': list(binaries)}
+        self._tokens = None
+
+    def setBinaries(self, pipName, binaries):
+        """ Set the binaries (name-version) of a plugin """
+        if pipName in self.entries:
+            self.entries[pipName]['binaries'] = list(binaries)
+            self._tokens = None
+
+    def removePlugin(self, pipName):
+        if self.entries.pop(pipName, None) is not None:
+            self._tokens = None
+
+    def _getTokens(self):
+        if self._tokens is None:
+            tokens = set()
+            for pipName, entry in self.entries.items():
+                fields = [(FIELD_NAME, pipName),
+                          (FIELD_SUMMARY, entry.get('summary', '')),
+                          (FIELD_AUTHOR, entry.get('author', ''))]
+                fields += [(FIELD_BINARY, b) for b in entry.get('binaries', [])]
+                for field, text in fields:
+                    for word in _getWords(text):
+                        tokens.add((word, pipName, field))
+            self._tokens = sorted(tokens)
+        return self._tokens
+
+    # ###################### Searching ############################
+
+    def _prefixMatches(self, term):
+        """ Yields (pipName, field, word) for indexed words starting with term """
+        tokens = self._getTokens()
+        i = bisect_left(tokens, (term,))
+        while i < len(tokens) and tokens[i][0].startswith(term):
+            yield tokens[i][1], tokens[i][2], tokens[i][0]
+            i += 1
+
+    def _termScores(self, term, fuzzy):
+        """ Returns {pipName: score} for a single term """
+        scores = {}
+
+        def add(pipName, field, word, factor):
+            score = FIELD_SCORES[field] * factor
+            if word == term:
+                score *= 1.5
+            scores[pipName] = max(scores.get(pipName, 0), score)
+
+        for pipName, field, word in self._prefixMatches(term):
+            add(pipName, field, word, 1)
+
+        if fuzzy and not scores:
+            words = sorted({t[0] for t in self._getTokens()})
+            for close in get_close_matches(term, words, n=5, cutoff=FUZZY_CUTOFF):
+                for pipName, field, word in self._prefixMatches(close):
+                    if word == close:
+                        add(pipName, field, word, FUZZY_FACTOR)
+        return scores
+
+    def search(self, text, fuzzy=True):
+        """ Returns the list of (pipName, score) matching all the words of
+        text, best matches first. Words match as prefixes of the indexed
+        words or, when nothing starts with them, as close words. """
+        terms = set(_WORD_RE.findall(text.lower().replace('-', ' ')))
+        if not terms:
+            return [(pipName, 0) for pipName in sorted(self.entries)]
+
+        results = None
+        for term in terms:
+            termScores = self._termScores(term, fuzzy)
+            if results is None:
+                results = termScores
+            else:
+                results = {p: results[p] + termScores[p]
+                           for p in results if p in termScores}
+        return sorted(results.items(), key=lambda r: (-r[1], r[0]))
+
+    # ###################### Persistence ############################
+
+    @classmethod
+    def getPath(cls):
+        return getCacheFolder(INDEX_FILE)
+
+    @classmethod
+    def load(cls):
+        """ Returns the saved index or None if there is none """
+        data = readJsonCache(cls.getPath())
+        if not isinstance(data, dict) or 'plugins' not in data:
+            return None
+        return cls(data['plugins'])
+
+    def save(self):
+        return writeJsonCache(self.getPath(), {'time': time.time(),
+                                               'plugins': self.entries})
+
+
+def buildIndex(withBinaries=False):
+    """ Builds the index from the plugin repository data (cached data
+    is used when available). Binaries of the installed plugins are only
+    added if withBinaries since the plugins have to be imported. """
+    from scipion.install.plugin_funcs import PluginRepository
+
+    index = PluginIndex.load() or PluginIndex()
+    plugins = PluginRepository().getPlugins(getPipData=True, offline=True)
+    for pipName, plugin in plugins.items():
+        binaries = None
+        if withBinaries and plugin.isInstalled():
+            binaries = plugin.binVersions
+        index.addPlugin(plugin, binaries)
+    index.save()
+    return index
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='scipion plugins search',
+                                     description='Search the plugins and binaries '
+                                                 'by name, description or author.')
+    parser.add_argument('text', nargs='*', help='Words to search for. All of them '
+                                                'must match.')
+    parser.add_argument('--exact', action='store_true',
+                        help="Only prefix matches, no close words.")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Build the index again including the binaries of "
+                             "the installed plugins (imports them).")
+    parsedArgs = parser.parse_args(args)
+
+    index = None if parsedArgs.rebuild else PluginIndex.load()
+    if index is None:
+        print("Building plugin index...")
+        index = buildIndex(withBinaries=parsedArgs.rebuild)
+
+    results = index.search(' '.join(parsedArgs.text), fuzzy=not parsedArgs.exact)
+    if not results:
+        print("No plugins found.")
+        return 1
+
+    for pipName, score in results:
+        entry = index.entries[pipName]
+        installed = getInstalledVersion(pipName)
+        state = ('[X] %s' % installed) if installed else '[ ]'
+        print("{:<30} {:<12} {}".format(pipName, state, entry.get('summary', '')))
+        if entry.get('binaries'):
+            print("{:<30} {:<12} binaries: {}".format('', '', ', '.join(entry['binaries'])))
+    return 0
@@ -25,19 +25,38 @@
 # **************************************************************************
 from logging.handlers import RotatingFileHandler
 from tkinter import *
+from concurrent.futures import ThreadPoolExecutor
+import queue
 import threading
 
 from pyworkflow.gui.project import ProjectManagerWindow
 from pyworkflow.project import MenuConfig
 from pyworkflow.gui import *
 import pyworkflow.gui.dialog as pwgui
-from scipion.install.plugin_funcs import PluginRepository, PluginInfo, NULL_VERSION, installBinsDefault
+from scipion.install.plugin_funcs import (PluginRepository, PluginInfo, NULL_VERSION,
+                                          installBinsDefault, RemoteDataCache)
+from scipion.install.log_stream import LogStream
+from scipion.install.plugin_index import PluginIndex
+from scipion.plugin_variables import definePluginVariables, getPluginVariables
 
 from pyworkflow.utils.properties import *
 from pyworkflow.utils import redStr, makeFilePath
 
 PLUGIN_LOG_NAME = 'Plugin.log'
 PLUGIN_ERRORS_LOG_NAME = 'Plugin.err'
+# Milliseconds between two consecutive updates of the Output Log
+LOG_REFRESH_MS = 200
+# Output lines of a failed operation repeated in the errors log
+FAILED_OPERATION_TAIL = 20
+# Rows shown under a plugin until its binaries are loaded
+LOADING_TAG = 'loading'
+LOADING_SUFFIX = '[%s]' % LOADING_TAG
+# Threads requesting the plugins remote data in the background
+REMOTE_WORKERS = 8
+# Milliseconds between two checks of the background jobs
+BACKGROUND_REFRESH_MS = 100
+# Milliseconds without typing before the plugin tree is filtered
+SEARCH_DELAY_MS = 150
 
 pluginRepo = PluginRepository()
 pluginDict = None
@@ -92,6 +111,7 @@ class PluginTree(ttk.Treeview):
         self.tag_configure(PluginInformation.PLUGIN_RELEASE_DATE, image=self.im_pluginReleaseDate, font=standardFont)
         self.tag_configure(PluginInformation.PLUGIN_DESCRIPTION,  image=self.im_pluginDescription, font=standardFont)
         self.tag_configure(PluginInformation.PLUGIN_AUTHORS, image=self.im_pluginAuthors, font=standardFont)
+        self.tag_configure(LOADING_TAG, font=standardFont, foreground='gray')
 
         toUpdateFont = getNamedFont(FONT_BOLD)
         self.tag_configure(PluginStates.AVAILABLE_RELEASE,
@@ -120,7 +140,8 @@ class PluginTree(ttk.Treeview):
                   PluginInformation.PLUGIN_RELEASE_DATE in kw['tags'] or
                   PluginInformation.PLUGIN_DESCRIPTION in kw['tags'] or
                   PluginInformation.PLUGIN_URL in kw['tags'] or
-                  PluginInformation.PLUGIN_AUTHORS in kw['tags']):
+                  PluginInformation.PLUGIN_AUTHORS in kw['tags'] or
+                  LOADING_TAG in kw['tags']):
             kw["tags"] = (PluginStates.UNCHECKED,)
         ttk.Treeview.insert(self, parent, index, iid, **kw)
 
@@ -338,6 +359,16 @@ class PluginBrowser(tk.Frame):
         tk.Frame.__init__(self, master, **args)
         self._lastSelected = None
         self.operationList = OperationList()
+        # Jobs completing the plugin tree in the background. Imports are not
+        # thread safe so plugins are imported one by one in the local executor
+        self._remoteExecutor = ThreadPoolExecutor(max_workers=REMOTE_WORKERS)
+        self._localExecutor = ThreadPoolExecutor(max_workers=1)
+        self._backgroundResults = queue.Queue()
+        self._pendingJobs = 0
+        self._jobsLock = threading.Lock()
+        self._loadingBinaries = set()
+        self.pluginIndex = PluginIndex()
+        self._searchJob = None
         gui.configureWeigths(self)
 
         # Creating the layout where all application elements will be placed
@@ -476,15 +507,28 @@ class PluginBrowser(tk.Frame):
         Fill the left Panel with the plugins list
         """
         gui.configureWeigths(leftFrame)
+        leftFrame.rowconfigure(0, weight=0)
+        leftFrame.rowconfigure(1, weight=1)
+
+        # Search box filtering the plugins as the user types
+        searchFrame = tk.Frame(leftFrame)
+        searchFrame.grid(row=0, column=0, columnspan=2, sticky='ew')
+        searchFrame.columnconfigure(1, weight=1)
+        tk.Label(searchFrame, text='Search:').grid(row=0, column=0, padx=5, pady=3)
+        self.searchVar = tk.StringVar()
+        searchEntry = tk.Entry(searchFrame, textvariable=self.searchVar,
+                               font=getDefaultFont())
+        searchEntry.grid(row=0, column=1, sticky='ew', padx=5, pady=3)
+        self.searchVar.trace_add('write', self._onSearchChanged)
 
         # This 5! lines are only to set the row height!! Should be centralized
 
         self.tree = PluginTree(leftFrame, show="tree", style=self._getStandardTreeStyle())
-        self.tree.grid(row=0, column=0, sticky='news')
+        self.tree.grid(row=1, column=0, sticky='news')
 
         self.yscrollbar = ttk.Scrollbar(leftFrame, orient='vertical',
                                         command=self.tree.yview)
-        self.yscrollbar.grid(row=0, column=1, sticky='news')
+        self.yscrollbar.grid(row=1, column=1, sticky='news')
         self.tree.configure(yscrollcommand=self.yscrollbar.set)
         self.yscrollbar.configure(command=self.tree.yview)
 
@@ -517,12 +561,39 @@ class PluginBrowser(tk.Frame):
 
         self.tree.bind("<Button-3>", self._popup)  # Button-3 on Plugin
         self.tree.bind("<FocusOut>", self._popupFocusOut)
+        # binaries are loaded when a plugin is expanded
+        self.tree.bind("<<TreeviewOpen>>", self._onPluginTreeOpen)
 
         # Load all plugins and fill the tree view
         threadLoadPlugin = threading.Thread(name="loading_plugin",
                                             target=self.loadPlugins)
         threadLoadPlugin.start()
 
+    def _onSearchChanged(self, *args):
+        """ Filter the plugin tree once the user stops typing """
+        if self._searchJob is not None:
+            self.after_cancel(self._searchJob)
+        self._searchJob = self.after(SEARCH_DELAY_MS, self._filterPluginTree)
+
+    def _filterPluginTree(self):
+        """ Show only the plugins matching the search text, best matches first """
+        self._searchJob = None
+        if pluginDict is None:
+            return
+        text = self.searchVar.get()
+        if text.strip():
+            visible = [p for p, score in self.pluginIndex.search(text)
+                       if self.tree.exists(p)]
+        else:
+            visible = [p for p in sorted(pluginDict) if self.tree.exists(p)]
+
+        visibleSet = set(visible)
+        for item in self.tree.get_children():
+            if item not in visibleSet:
+                self.tree.detach(item)
+        for index, item in enumerate(visible):
+            self.tree.move(item, '', index)
+
     def _popup(self, event):
         if self.tree.is_enabled():
             try:
@@ -531,6 +602,8 @@ class PluginBrowser(tk.Frame):
                 self.popup_menu.selection = self.tree.set(
                     self.tree.identify_row(event.y))
                 tags = self.tree.item(self.tree.selectedItem, "tags")
+                if not tags or LOADING_TAG in tags:
+                    return
                 self.popup_menu.entryconfigure(0, state=tk.DISABLED)
                 self.popup_menu.entryconfigure(1, state=tk.DISABLED)
                 self.popup_menu.entryconfigure(2, state=tk.DISABLED)
@@ -659,8 +732,11 @@ class PluginBrowser(tk.Frame):
         self.file_errors_path = os.path.join(Config.getLogsFolder(),
                                              pluginErrorsLogName)
 
-        self.fileLog = open(self.file_log_path, 'w')
-        self.fileLogErr = open(self.file_errors_path, 'w')
+        # Operations output is streamed: only new lines reach the Output Log
+        self.logStream = LogStream(self.file_log_path)
+        self.errorsStream = LogStream(self.file_errors_path)
+        self.fileLog = self.logStream.open()
+        self.fileLogErr = self.errorsStream.open()
         self.plug_log = getRotatingFileLogger("plugins_stdout", self.file_log_path)
         self.plug_errors_log = getRotatingFileLogger("plugin_strerr", self.file_errors_path)
         # Create two tabs where the log and errors will appear
@@ -728,25 +804,43 @@ class PluginBrowser(tk.Frame):
                                              target=self._applyOperations,
                                              args=(None,))
             self.threadOp.start()
+            self._refreshLogsComponent()
 
-            self.threadRefresh = threading.Thread(name="refresh_log",
-                                                  target=self._refreshLogsComponent,
-                                                  args=(2,))
-            self.threadRefresh.start()
-
-    def _refreshLogsComponent(self, wait=3):
+    def _refreshLogsComponent(self, wait=LOG_REFRESH_MS):
         """
-        Refresh the Plugin Manager log
+        Refresh the Plugin Manager log with the lines written since the
+        last refresh. It runs in the GUI thread and reschedules itself
+        while the operations are running.
         """
-        import time
-        while self.threadOp.is_alive():
-            time.sleep(wait)
-            # Taking the vertical scroll position
-            vsPos = self.Textlog.taList[0].getVScroll()
-            if vsPos[1] == 1.0:
-                self.Textlog.refreshAll(goEnd=True)
-            else:
-                self.Textlog.refreshAll(goEnd=False)
+        running = self.threadOp.is_alive()
+        streams = [self.logStream, self.errorsStream]
+        if not running:
+            # Make sure the last lines written by the operations are shown
+            for stream in streams:
+                stream.sync()
+
+        for stream, textArea in zip(streams, self.Textlog.taList):
+            self._appendLogLines(textArea, stream.getNewLines())
+
+        if running:
+            self.after(wait, self._refreshLogsComponent, wait)
+
+    def _appendLogLines(self, textArea, lines):
+        """ Add lines at the end of textArea keeping the scroll at the
+        bottom if it was already there. """
+        if not lines:
+            return
+        # Taking the vertical scroll position
+        goEnd = textArea.getVScroll()[1] == 1.0
+        textArea.setReadOnly(False)
+        for line, offset in lines:
+            textArea.lineNo += 1
+            textArea.addLine(line)
+        textArea.setReadOnly(True)
+        # Keep the text area in sync with the file in case it is refreshed
+        textArea.offset = offset
+        if goEnd:
+            textArea.goEnd()
 
     def _applyOperations(self, operation=None):
         """
@@ -766,6 +860,8 @@ class PluginBrowser(tk.Frame):
         message.show()
         for op in self.operationList.getOperations(operation):
             item = op.getObjName()
+            self.logStream.beginOperation(item)
+            self.errorsStream.beginOperation(item)
             try:
                 self.operationTree.processing_item(item)
                 op.runOperation(self.numberProcessors.get(), not self.skipBinaries.get())
@@ -790,6 +886,7 @@ class PluginBrowser(tk.Frame):
                              op.getObjName())
                 self.plug_log.info(redStr(strErr), False)
                 self.plug_errors_log.error(redStr(strErr), False)
+                self._showOperationTail(item)
         self.operationList.clearOperations()
         sys.stdout.flush()
         sys.stderr.flush()
@@ -814,6 +911,18 @@ class PluginBrowser(tk.Frame):
                                   value=text,
                                   tags=tag)
 
+    def _showOperationTail(self, operationName):
+        """ Repeat the last output lines of a failed operation in the errors
+        log, so they can be found without scrolling through the whole build
+        output. """
+        sys.stdout.flush()
+        self.logStream.sync()
+        lines = self.logStream.getOperationLines(operationName)
+        if lines:
+            sys.stderr.write('Last output lines of %s:\n' % operationName)
+            sys.stderr.writelines(lines[-FAILED_OPERATION_TAIL:])
+            sys.stderr.flush()
+
     def linkToWebSite(self, event):
         """
         Load the plugin url
@@ -913,31 +1022,28 @@ class PluginBrowser(tk.Frame):
 
     def reloadInstalledPlugin(self, pluginName):
         """
-        Reload a given plugin and update the tree view
+        Reload a given plugin and update the tree view. The remote data
+        already loaded is reused, only the local state of the plugin is read
+        again, in the local worker since it imports the plugin.
         """
-        plugin = PluginInfo(pluginName, pluginName, remote=True)
-        if plugin is not None:
+        self._submitJob(self._localExecutor, self._reloadPlugin, pluginName)
+
+    def _reloadPlugin(self, pluginName):
+        """ Read the local state of a plugin (runs in the local worker) """
+        plugin = pluginDict.get(pluginName, None)
+        if plugin is None:
+            plugin = PluginInfo(pluginName, pluginName, offline=True)
+        else:
+            plugin.refreshLocalInfo()
+        installed = plugin.isInstalled()
+        pluginBinaryList = plugin.getInstallenv() if installed else None
+
+        def showPlugin():
+            if not self.tree.exists(pluginName):
+                return
             # Insert all binaries of plugin on the tree
-            if plugin.isInstalled():
-                pluginBinaryList = plugin.getInstallenv()
-                if pluginBinaryList is not None:
-                    binaryList = pluginBinaryList.getPackages()
-                    keys = sorted(binaryList.keys())
-                    for k in keys:
-                        pVersions = binaryList[k]
-                        for binary, version in pVersions:
-                            installed = pluginBinaryList._isInstalled(binary,
-                                                                      version)
-                            tag = PluginStates.UNCHECKED
-                            if installed:
-                                tag = PluginStates.CHECKED
-                            binaryName = str(binary)
-                            if version:
-                                binaryName += str('-' + version)
-                            self.tree.insert(pluginName, "end",
-                                             binaryName + "[" + pluginName + "]",
-                                             text=binaryName, tags=tag,
-                                             values=PluginStates.BINARY)
+            if installed:
+                self._insertBinaries(pluginName, pluginBinaryList)
                 tag = PluginStates.CHECKED
                 if plugin.latestRelease != plugin.pipVersion:
                     tag = PluginStates.AVAILABLE_RELEASE
@@ -946,67 +1052,172 @@ class PluginBrowser(tk.Frame):
             else:
                 if PluginStates.UNINSTALL in self.tree.item(pluginName, 'tags'):
                     self.tree.item(pluginName, tags=(PluginStates.UNCHECKED,))
-        else:
-            self.tree.item(pluginName, tags=(PluginStates.UNCHECKED,))
+
+        return showPlugin
 
     def loadPlugins(self):
         """
-        Load all plugins and fill the tree view widget
+        Load all plugins and fill the tree view widget. Plugins are inserted
+        from the cached catalog data and completed in the background: remote
+        data is refreshed by the remote workers and binaries are loaded when
+        a plugin is expanded.
         """
         global pluginDict
-        pluginDict = pluginRepo.getPlugins(getPipData=True)
+        pluginDict = pluginRepo.getPlugins(getPipData=True, offline=True)
         pluginList = sorted(pluginDict.keys(), reverse=True)
-        countPlugin = self.progressbar['value']
         self.tree.delete(*self.tree.get_children())
-        self.progressbar["maximum"] = countPlugin + len(pluginList)
         for pluginName in pluginList:
-            countPlugin = countPlugin + 1
-            self.progressbar['value'] = countPlugin
-            plugin = PluginInfo(pluginName, pluginName, remote=False)
-            if plugin is not None:
-                tag = PluginStates.UNCHECKED
-                if plugin._getPlugin():
-                    # Insert the plugin name in the tree
-                    latestRelease = pluginDict.get(pluginName).getLatestRelease()
-                    tag = PluginStates.CHECKED
-                    if latestRelease and plugin.pipVersion != latestRelease\
-                            and latestRelease != NULL_VERSION:
-                        tag = PluginStates.AVAILABLE_RELEASE
-                    self.tree.insert("", 0, pluginName, text=pluginName,
-                                     tags=tag, values=PluginStates.PLUGIN)
-                    # Insert all binaries of plugin on the tree
-                    pluginBinaryList = plugin.getInstallenv()
-                    if pluginBinaryList is not None:
-                        binaryList = pluginBinaryList.getPackages()
-                        keys = sorted(binaryList.keys())
-                        for k in keys:
-                            pVersions = binaryList[k]
-                            for binary, version in pVersions:
-                                installed = pluginBinaryList._isInstalled(binary,
-                                                                          version)
-                                tag = PluginStates.UNCHECKED
-                                if installed:
-                                    tag = PluginStates.CHECKED
-                                binaryName = str(binary)
-                                if version:
-                                    binaryName += str('-' + version)
-                                self.tree.insert(pluginName, "end",
-                                                 binaryName + "[" + pluginName + "]",
-                                                 text=binaryName, tags=tag,
-                                                 values=PluginStates.BINARY)
-                else:
-                    latestRelease = pluginDict.get(pluginName).getLatestRelease()
-                    if latestRelease != NULL_VERSION:
-                        self.tree.insert("", 0, pluginName, text=pluginName,
-                                         tags=tag, values=PluginStates.PLUGIN)
+            plugin = pluginDict.get(pluginName)
+            self.tree.insert("", 0, pluginName, text=pluginName,
+                             tags=self._getPluginTag(plugin),
+                             values=PluginStates.PLUGIN)
+            if plugin.isInstalled():
+                self._insertLoadingRow(pluginName)
         self._closeProgressBar()
 
+        self.pluginIndex = PluginIndex.load() or PluginIndex()
+        for pluginName in pluginList:
+            self.pluginIndex.addPlugin(pluginDict.get(pluginName))
+
         if len(self.tree.get_children()) == 0:
             pwgui.showInfo("No plugins loaded", "We haven't found any plugins. "
                            "Either this is a early stage of a new release or this is a bug. "
                            "Please, check the terminal output and contact us if you still think"
                            " this is a bug.", self)
 
+        for pluginName in pluginList:
+            self._submitJob(self._remoteExecutor, self._loadRemoteInfo, pluginName)
+
+    def _getPluginTag(self, plugin):
+        """ Returns the tag of a plugin row based on its installation state """
+        if not plugin.isInstalled():
+            return PluginStates.UNCHECKED
+        latestRelease = plugin.getLatestRelease()
+        if (latestRelease and latestRelease != NULL_VERSION
+                and plugin.pipVersion != latestRelease):
+            return PluginStates.AVAILABLE_RELEASE
+        return PluginStates.CHECKED
+
+    def _insertLoadingRow(self, pluginName):
+        """ Insert a child row so the plugin can be expanded before its
+        binaries are known """
+        self.tree.insert(pluginName, "end", pluginName + LOADING_SUFFIX,
+                         text='Loading binaries...', tags=(LOADING_TAG,),
+                         values=LOADING_TAG)
+
+    def _insertBinaries(self, pluginName, pluginBinaryList):
+        """ Insert all binaries of plugin on the tree or update their state
+        if they are already there """
+        loadingRow = pluginName + LOADING_SUFFIX
+        if self.tree.exists(loadingRow):
+            self.tree.delete(loadingRow)
+        if pluginBinaryList is None or not self.tree.exists(pluginName):
+            return
+
+        binaryList = pluginBinaryList.getPackages()
+        binaryNames = []
+        keys = sorted(binaryList.keys())
+        for k in keys:
+            pVersions = binaryList[k]
+            for binary, version in pVersions:
+                installed = pluginBinaryList._isInstalled(binary, version)
+                tag = PluginStates.UNCHECKED
+                if installed:
+                    tag = PluginStates.CHECKED
+                binaryName = str(binary)
+                if version:
+                    binaryName += str('-' + version)
+                binaryNames.append(binaryName)
+                binaryItem = binaryName + "[" + pluginName + "]"
+                if self.tree.exists(binaryItem):
+                    self.tree.item(binaryItem, tags=(tag,))
+                else:
+                    self.tree.insert(pluginName, "end", binaryItem,
+                                     text=binaryName, tags=tag,
+                                     values=PluginStates.BINARY)
+        self.pluginIndex.setBinaries(pluginName, binaryNames)
+
+    def _onPluginTreeOpen(self, event=None):
+        """ Load the binaries of the expanded plugin if not loaded yet """
+        pluginName = self.tree.focus()
+        if (self.tree.exists(pluginName + LOADING_SUFFIX)
+                and pluginName not in self._loadingBinaries):
+            self._loadingBinaries.add(pluginName)
+            self._submitJob(self._localExecutor, self._loadBinaries, pluginName)
+
+    def _submitJob(self, executor, function, *args):
+        """ Run function in executor. It returns a function that will be
+        called in the GUI thread to show its result. """
+        with self._jobsLock:
+            self._pendingJobs += 1
+            startPolling = self._pendingJobs == 1
+        future = executor.submit(function, *args)
+        future.add_done_callback(self._backgroundResults.put)
+        if startPolling:
+            self.after(BACKGROUND_REFRESH_MS, self._processBackgroundResults)
+
+    def _processBackgroundResults(self):
+        """ Show the results of the finished background jobs """
+        while True:
+            try:
+                future = self._backgroundResults.get_nowait()
+            except queue.Empty:
+                break
+            with self._jobsLock:
+                self._pendingJobs -= 1
+            try:
+                showResult = future.result()
+                if showResult is not None:
+                    showResult()
+            except Exception as e:
+                print(redStr("Error loading plugin information: %s" % e))
+
+        with self._jobsLock:
+            pending = self._pendingJobs
+        if pending:
+            self.after(BACKGROUND_REFRESH_MS, self._processBackgroundResults)
+        else:
+            RemoteDataCache.save()
+            self.pluginIndex.save()
+            if self.searchVar.get().strip():
+                self._filterPluginTree()
+
+    def _loadRemoteInfo(self, pluginName):
+        """ Refresh the plugin remote data (runs in a remote worker) """
+        pluginDict.get(pluginName).setRemotePluginInfo()
+        return lambda: self._updatePluginRow(pluginName)
+
+    def _updatePluginRow(self, pluginName):
+        """ Update the plugin row with its refreshed remote data """
+        plugin = pluginDict.get(pluginName)
+        if plugin is None or not self.tree.exists(pluginName):
+            return
+        tags = self.tree.item(pluginName, 'tags')
+        # Plugins with pending operations keep their state
+        if tags and tags[0] not in [PluginStates.CHECKED,
+                                    PluginStates.UNCHECKED,
+                                    PluginStates.AVAILABLE_RELEASE]:
+            return
+        if not plugin.isInstalled() and plugin.getLatestRelease() == NULL_VERSION:
+            self.tree.delete(pluginName)
+            del pluginDict[pluginName]
+            self.pluginIndex.removePlugin(pluginName)
+        else:
+            self.tree.item(pluginName, tags=(self._getPluginTag(plugin),))
+            self.pluginIndex.addPlugin(plugin)
+
+    def _loadBinaries(self, pluginName):
+        """ Get the binaries of a plugin (runs in the local worker since
+        it imports the plugin) """
+        plugin = pluginDict.get(pluginName)
+        pluginBinaryList = plugin.getInstallenv() if plugin is not None else None
+
+        def showBinaries():
+            self._loadingBinaries.discard(pluginName)
+            self._insertBinaries(pluginName, pluginBinaryList)
+
+        return showBinaries
+
 
 class PluginManagerWindow(gui.Window):
     """
@@ -1040,10 +1251,7 @@ class PluginManagerWindow(gui.Window):
     def onVariables(self):
         if pluginDict is not None:
             msg = ""
-            pluginsVars = dict()
-            for plugin in pluginDict.values():
-                if plugin.isInstalled():
-                    pluginsVars.update(plugin.getPluginClass().getVars())
+            pluginsVars = getPluginVariables().pluginVars
 
             sortedVars = sorted(pluginsVars)
             if sortedVars:
@@ -1136,8 +1344,8 @@ class PluginManager(PluginManagerWindow):
     """
     def __init__(self, title, master=None, **kwargs):
 
-        # Trigger plugin's variable definition
-        Config.getDomain().getPlugins()
+        # Define the plugin's variables without importing all the plugins
+        definePluginVariables()
 
         PluginManagerWindow.__init__(self, title, master, **kwargs)
         PluginBrowser(self.root, **kwargs)
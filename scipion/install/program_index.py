@@ -0,0 +1,138 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Index of the programs provided by the binaries installed in EM_ROOT.
+
+Each package folder (name-version) is scanned for executables in its bin
+folder and the index maps each program name to its package, version and
+path. It is written in EM_ROOT when binaries are installed or uninstalled,
+so "scipion <program>" finds the program with a dictionary lookup.
+
+The plugin that defines each package (read from the binary catalog, no
+plugin is imported) is saved too: its environment (Plugin.getEnviron) is
+resolved when one of its programs is run.
+"""
+import os
+from os.path import isdir, islink, join
+
+from scipion.utils import getEmRoot, readJsonCache, writeJsonCache
+
+INDEX_FILE = '.scipion_programs.json'
+# Programs whose environment is set by the pwem program entry point
+EM_PROGRAM_PREFIXES = ['xmipp', 'relion', 'e2', 'sx', 'b']
+# Used to run the programs above, saved with the index so pwem is not imported
+DEFAULT_ENTRY_POINT = 'emprogram'
+
+
+def getIndexPath(emRoot=None):
+    return join(emRoot or getEmRoot(), INDEX_FILE)
+
+
+def _versionKey(version):
+    """ Sort key of versions: numbers compared as numbers """
+    return [(0, int(p), '') if p.isdigit() else (1, 0, p)
+            for p in version.replace('-', '.').split('.')]
+
+
+def _getPrograms(binFolder):
+    try:
+        names = os.listdir(binFolder)
+    except OSError:
+        return []
+    return [name for name in names
+            if not name.startswith('.')
+            and os.access(join(binFolder, name), os.X_OK)
+            and not isdir(join(binFolder, name))]
+
+
+def getPackageOwners():
+    """ Returns {package: plugin name} from the binary catalog as it is,
+    without importing any plugin """
+    from scipion.install.binary_catalog import getLoadedCatalog
+    owners = {}
+    for pluginName, entry in sorted(getLoadedCatalog().plugins.items()):
+        for package in entry['packages']:
+            owners.setdefault(package, pluginName)
+    return owners
+
+
+def buildProgramIndex(emRoot=None, entryPoint=None, owners=None):
+    """ Scans EM_ROOT and saves the program index. When several versions of
+    a package provide a program, the latest one wins. owners maps packages
+    to the plugins defining them. Returns the index. """
+    emRoot = emRoot or getEmRoot()
+    packages = []
+    try:
+        folders = os.listdir(emRoot)
+    except OSError:
+        folders = []
+    for folder in folders:
+        path = join(emRoot, folder)
+        # Links (e.g. relion -> relion-5.0) point to packages already scanned
+        if '-' not in folder or islink(path) or not isdir(path):
+            continue
+        name, version = folder.split('-', 1)
+        packages.append((name, version, path))
+
+    owners = owners or {}
+    programs = {}
+    for name, version, path in sorted(packages, key=lambda p: (p[0], _versionKey(p[1]))):
+        binFolder = join(path, 'bin')
+        for program in _getPrograms(binFolder):
+            programs[program] = {'package': name,
+                                 'version': version,
+                                 'path': join(binFolder, program),
+                                 'plugin': owners.get(name)}
+
+    index = {'entryPoint': entryPoint or DEFAULT_ENTRY_POINT,
+             'programs': programs}
+    writeJsonCache(getIndexPath(emRoot), index)
+    return index
+
+
+def updateProgramIndex():
+    """ Rebuilds the index after binaries are installed or uninstalled """
+    try:
+        from pwem import EM_PROGRAM_ENTRY_POINT as entryPoint
+    except ImportError:
+        entryPoint = None
+    buildProgramIndex(entryPoint=entryPoint, owners=getPackageOwners())
+
+
+def findProgram(program, emRoot=None):
+    """ Returns (entry, entryPoint) of an indexed program, or (None, None)
+    if it is not indexed or not there anymore """
+    index = readJsonCache(getIndexPath(emRoot))
+    if not isinstance(index, dict):
+        return None, None
+    entry = index.get('programs', {}).get(program)
+    if entry is None or not os.path.exists(entry['path']):
+        return None, None
+    return entry, index.get('entryPoint', DEFAULT_ENTRY_POINT)
+
+
+def hasEmProgramPrefix(program):
+    return any(program.startswith(prefix) for prefix in EM_PROGRAM_PREFIXES)
@@ -0,0 +1,231 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Snapshots of installed distributions, to roll back updates without network.
+
+Before scipion or a plugin is updated, installed or uninstalled, the files
+of the affected distributions (as listed in their RECORD) are hard linked
+into a snapshot folder, or copied when the snapshot folder is in another
+file system. pip never rewrites files in place, so the links keep the old
+content. Distributions not installed are recorded as such. The installed
+dependencies of the distributions, direct or not, are saved with them: pip
+may upgrade them in the same operation.
+
+    scipion update --rollback [ID]
+
+uninstalls the current versions and links the files back. Snapshots are
+kept in SCIPION_SNAPSHOT_FOLDER (default: the snapshots folder of the
+scipion cache); only the last SCIPION_SNAPSHOTS_KEEP (default 5) are kept.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from importlib import metadata
+from os.path import exists, join
+
+from scipion.utils import getCacheFolder
+
+SNAPSHOT_INFO = 'snapshot.json'
+FILES_FOLDER = 'files'
+# Dependencies never saved: a rollback must not uninstall them
+SKIP_DEPENDENCIES = {'pip', 'setuptools', 'wheel'}
+_REQUIREMENT_NAME_RE = re.compile(r'\s*([A-Za-z0-9][A-Za-z0-9._-]*)')
+
+
+def getSnapshotFolder(*paths):
+    folder = os.environ.get('SCIPION_SNAPSHOT_FOLDER') or getCacheFolder('snapshots')
+    return join(folder, *paths)
+
+
+def _getKeep():
+    return max(1, int(os.environ.get('SCIPION_SNAPSHOTS_KEEP', 5)))
+
+
+def _linkOrCopy(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        return
+    try:
+        os.link(src, dst)
+    except OSError:  # another file system
+        shutil.copy2(src, dst)
+
+
+def _getDistribution(name):
+    try:
+        return metadata.distribution(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _normalize(name):
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def getDependencyClosure(distNames):
+    """ Returns distNames and the installed distributions they depend on,
+    directly or not. Extras are not followed """
+    names = {}
+    pending = list(distNames)
+    while pending:
+        name = pending.pop()
+        if _normalize(name) in names:
+            continue
+        names[_normalize(name)] = name
+        dist = _getDistribution(name)
+        for requirement in (dist.requires or []) if dist is not None else []:
+            requirement, _, marker = requirement.partition(';')
+            match = _REQUIREMENT_NAME_RE.match(requirement)
+            if (match is None or 'extra' in marker
+                    or _normalize(match.group(1)) in SKIP_DEPENDENCIES):
+                continue
+            if _getDistribution(match.group(1)) is not None:
+                pending.append(match.group(1))
+    return list(names.values())
+
+
+def takeSnapshot(distNames, reason='', keepIds=()):
+    """ Saves the installed files of distNames and their dependencies
+    (see getDependencyClosure). Returns the snapshot id,
+    None if it could not be taken (the update goes on anyway). The
+    snapshots in keepIds are never pruned """
+    snapshotId = time.strftime('%Y%m%d-%H%M%S-') + str(os.getpid())
+    count = 1
+    while exists(getSnapshotFolder(snapshotId)):  # several in the same second
+        snapshotId = '%s.%d' % (snapshotId.split('.')[0], count)
+        count += 1
+    folder = getSnapshotFolder(snapshotId)
+    distributions = []
+    try:
+        for name in sorted(getDependencyClosure(distNames)):
+            dist = _getDistribution(name)
+            if dist is None:
+                distributions.append({'name': name, 'version': None, 'files': []})
+                continue
+
+            files = []
+            for packagePath in dist.files or []:
+                if packagePath.suffix == '.pyc':
+                    continue  # regenerated by python
+                path = os.path.abspath(str(dist.locate_file(packagePath)))
+                if os.path.isfile(path) or os.path.islink(path):
+                    _linkOrCopy(path, join(folder, FILES_FOLDER, path.lstrip(os.sep)))
+                    files.append(path)
+            distributions.append({'name': dist.metadata['Name'], 'version': dist.version,
+                                  'files': files})
+
+        with open(join(folder, SNAPSHOT_INFO), 'w') as f:
+            json.dump({'id': snapshotId, 'time': time.time(), 'reason': reason,
+                       'python': sys.executable, 'distributions': distributions}, f)
+    except OSError as e:
+        print("WARNING: Could not take a snapshot of %s: %s" % (' '.join(distNames), e))
+        shutil.rmtree(folder, ignore_errors=True)
+        return None
+
+    pruneSnapshots(_getKeep(), keepIds)
+    return snapshotId
+
+
+def getSnapshots():
+    """ Returns the info of the saved snapshots, newest first """
+    folder = getSnapshotFolder()
+    snapshots = []
+    if exists(folder):
+        for snapshotId in os.listdir(folder):
+            try:
+                with open(join(folder, snapshotId, SNAPSHOT_INFO)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return sorted(snapshots, key=lambda s: s['time'], reverse=True)
+
+
+def pruneSnapshots(keep, keepIds=()):
+    """ Removes the oldest snapshots but the last keep ones and keepIds """
+    for snapshot in [s for s in getSnapshots() if s['id'] not in keepIds][keep:]:
+        shutil.rmtree(getSnapshotFolder(snapshot['id']), ignore_errors=True)
+
+
+def printSnapshots():
+    snapshots = getSnapshots()
+    if not snapshots:
+        print("No snapshots in %s" % getSnapshotFolder())
+    for snapshot in snapshots:
+        versions = ', '.join('%s %s' % (d['name'], d['version'] or '(not installed)')
+                             for d in snapshot['distributions'])
+        print("%s  %s  %s" % (snapshot['id'], snapshot['reason'], versions))
+
+
+def rollback(snapshotId=None):
+    """ Restores the distributions of a snapshot, the newest one if
+    snapshotId is None. Returns True if everything was restored """
+    snapshots = getSnapshots()
+    if snapshotId is not None:
+        snapshots = [s for s in snapshots if s['id'] == snapshotId]
+    if not snapshots:
+        print("No snapshot to roll back to.")
+        return False
+    snapshot = snapshots[0]
+    if snapshot['python'] != sys.executable:
+        print("Snapshot %s was taken for %s, not for this python (%s)."
+              % (snapshot['id'], snapshot['python'], sys.executable))
+        return False
+
+    distributions = snapshot['distributions']
+    filesFolder = getSnapshotFolder(snapshot['id'], FILES_FOLDER)
+    missing = [path for dist in distributions for path in dist['files']
+               if not os.path.lexists(join(filesFolder, path.lstrip(os.sep)))]
+    if missing:
+        print("ERROR: Snapshot %s is incomplete, nothing was changed. Missing: %s"
+              % (snapshot['id'], ' '.join(missing[:10])))
+        return False
+
+    print("Rolling back to %s (%s)" % (snapshot['id'], snapshot['reason']))
+    # The current state can be restored too. The snapshot restored must survive the pruning
+    takeSnapshot([d['name'] for d in distributions], reason='before rollback to %s' % snapshot['id'],
+                 keepIds=[snapshot['id']])
+
+    # Uninstall without contacting any server, then link the old files back
+    installed = [d['name'] for d in distributions if _getDistribution(d['name']) is not None]
+    if installed:
+        result = subprocess.call([sys.executable, '-m', 'pip', 'uninstall', '-y', '-q'] + installed)
+        if result != 0:
+            print("ERROR: pip could not uninstall %s" % ' '.join(installed))
+            return False
+
+    for dist in distributions:
+        for path in dist['files']:
+            _linkOrCopy(join(filesFolder, path.lstrip(os.sep)), path)
+        print("%s %s" % (dist['name'], ('restored to %s' % dist['version']) if dist['version']
+                         else 'uninstalled'))
+    return True
@@ -0,0 +1,329 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Inspection of plugins from their source code, without importing them.
+
+    scipion inspect --static [PLUGIN | PATH ...] [-j N] [--output json]
+
+The python files of each plugin are parsed with ast, so broken plugins or
+plugins with missing dependencies are reported as well. Without arguments,
+all installed plugins are inspected; a PATH can be a plugin package or a
+source tree (e.g. a git clone) with plugin packages in it. Plugins are
+inspected in parallel processes.
+
+For each plugin it reports:
+  - the protocols: classes of the protocols module deriving, in the
+    plugin, from a class named Protocol, EMProtocol or Prot*, with their
+    _label (base protocols have none) and the first line of their doc,
+  - the references in the bibtex module docstring,
+  - the binaries (addPackage and similar calls) and the variables
+    (_defineVar and _defineEmVar calls) defined in the Plugin class.
+
+Names that are not literals are resolved with the module level string
+constants of the plugin; if that fails, their source is shown.
+"""
+import argparse
+import ast
+import importlib.util
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from os.path import basename, exists, isdir, join
+
+from scipion.utils import getInstalledPlugins
+
+PROTOCOL_BASES = {'Protocol', 'EMProtocol'}
+BINARY_CALLS = {'addPackage', 'addPipModule'}
+VARIABLE_CALLS = {'_defineVar', '_defineEmVar'}
+SKIP_FOLDERS = {'tests', '__pycache__', 'docs', 'build', 'dist'}
+BIBTEX_KEY = re.compile(r'@\w+\s*\{\s*([^,\s]+)\s*,')
+
+
+def _iterSources(pluginPath):
+    """ Yields (module name relative to the plugin, path) of the python files """
+    for root, dirs, files in os.walk(pluginPath):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_FOLDERS and not d.startswith('.'))
+        for fileName in sorted(files):
+            if fileName.endswith('.py'):
+                path = join(root, fileName)
+                module = os.path.relpath(path, pluginPath)[:-3].replace(os.sep, '.')
+                yield module[:-len('.__init__')] if module.endswith('__init__') else module, path
+
+
+def _baseName(node):
+    """ Last name of a base class: EMProtocol for pwem.protocols.EMProtocol """
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Subscript):  # Generic[...]
+        return _baseName(node.value)
+    return None
+
+
+def _concatenate(node):
+    """ Value of a sum of constants (literal_eval does not add strings) """
+    if isinstance(node, ast.Expression):
+        return _concatenate(node.body)
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        return _concatenate(node.left) + _concatenate(node.right)
+    raise ValueError('Not constant')
+
+
+class _Value:
+    """ Resolves expressions to strings with the constants of the plugin """
+    def __init__(self, constants):
+        self.constants = constants
+
+    def __call__(self, node):
+        if node is None:
+            return None
+        if isinstance(node, ast.Constant):
+            return node.value
+        name = _baseName(node)
+        if name in self.constants:
+            return self.constants[name]
+        if not hasattr(ast, 'unparse'):  # python < 3.9
+            return '?'
+        if isinstance(node, ast.JoinedStr) or isinstance(node, ast.BinOp):
+            try:  # 'prefix' + VERSION, f'{NAME}-{VERSION}'
+                return _concatenate(self._substitute(node))
+            except (ValueError, TypeError, SyntaxError, RecursionError):
+                pass
+        return ast.unparse(node)
+
+    def _substitute(self, node):
+        constants = self.constants
+
+        class Substitute(ast.NodeTransformer):
+            def visit_Name(self, n):
+                if n.id in constants:
+                    return ast.copy_location(ast.Constant(constants[n.id]), n)
+                return n
+
+            def visit_JoinedStr(self, n):
+                self.generic_visit(n)
+                parts = []
+                for value in n.values:
+                    if isinstance(value, ast.FormattedValue):
+                        value = value.value
+                    if not isinstance(value, ast.Constant):
+                        raise ValueError('Not constant')
+                    parts.append(str(value.value))
+                return ast.copy_location(ast.Constant(''.join(parts)), n)
+
+        return Substitute().visit(ast.parse(ast.unparse(node), mode='eval'))
+
+
+def _getDoc(node):
+    doc = ast.get_docstring(node)
+    for line in (doc or '').splitlines():
+        if line.strip():
+            return line.strip()
+    return ''
+
+
+def inspectSource(pluginPath, name=None):
+    """ Parses the plugin package in pluginPath. Returns its description """
+    name = name or basename(pluginPath.rstrip(os.sep))
+    info = {'plugin': name, 'path': pluginPath, 'protocols': [], 'references': [],
+            'binaries': [], 'variables': [], 'errors': {}}
+    trees = {}
+    for module, path in _iterSources(pluginPath):
+        try:
+            with open(path, 'rb') as f:
+                trees[module] = ast.parse(f.read(), filename=path)
+        except (SyntaxError, ValueError, OSError) as e:
+            info['errors'][module] = '%s: %s' % (type(e).__name__, e)
+
+    # Module level string constants, to resolve names
+    constants = {}
+    for tree in trees.values():
+        for node in tree.body:
+            if (isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant)
+                    and isinstance(node.value.value, str)):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        constants.setdefault(target.id, node.value.value)
+    value = _Value(constants)
+
+    # Classes and their bases in the whole plugin
+    classes = []
+    for module, tree in trees.items():
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ClassDef):
+                classes.append((module, node, [_baseName(b) for b in node.bases]))
+
+    protocolNames = set(PROTOCOL_BASES)
+    changed = True
+    while changed:  # Subclasses of subclasses
+        changed = False
+        for _, node, bases in classes:
+            if node.name not in protocolNames and any(
+                    b in protocolNames or (b or '').startswith('Prot') for b in bases):
+                protocolNames.add(node.name)
+                changed = True
+
+    for module, node, bases in classes:
+        isProtocolsModule = module == 'protocols' or module.startswith('protocols.')
+        if isProtocolsModule and node.name in protocolNames and node.name not in PROTOCOL_BASES:
+            label = None
+            for statement in node.body:
+                if (isinstance(statement, ast.Assign) and
+                        any(isinstance(t, ast.Name) and t.id == '_label' for t in statement.targets)):
+                    label = value(statement.value)
+            info['protocols'].append({'name': node.name, 'module': module,
+                                      'label': label, 'base': label is None,
+                                      'doc': _getDoc(node)})
+
+        elif node.name == 'Plugin' and module == '':
+            for method in node.body:
+                if not isinstance(method, ast.FunctionDef):
+                    continue
+                for call in ast.walk(method):
+                    if not isinstance(call, ast.Call) or not isinstance(call.func, ast.Attribute):
+                        continue
+                    args = [value(a) for a in call.args]
+                    keywords = {k.arg: value(k.value) for k in call.keywords if k.arg}
+                    # Also in the helper methods called by defineBinaries or _defineVariables
+                    if call.func.attr in BINARY_CALLS:
+                        info['binaries'].append({'call': call.func.attr,
+                                                 'name': args[0] if args else keywords.get('name'),
+                                                 'version': keywords.get('version'),
+                                                 # True, False or the expression
+                                                 'default': keywords.get('default', False)})
+                    elif call.func.attr in VARIABLE_CALLS:
+                        info['variables'].append({'name': args[0] if args else None,
+                                                  'default': args[1] if len(args) > 1 else None})
+
+    bibtex = trees.get('bibtex')
+    if bibtex is not None:
+        info['references'] = BIBTEX_KEY.findall(ast.get_docstring(bibtex) or '')
+    return info
+
+
+def _findPlugins(path):
+    """ Returns the plugin packages in path: path itself if it is one, or
+    the packages in it with a Plugin class (a source tree) """
+    if exists(join(path, '__init__.py')):
+        return [path]
+    packages = []
+    for folder in sorted(os.listdir(path)):
+        initPath = join(path, folder, '__init__.py')
+        if folder not in SKIP_FOLDERS and exists(initPath):
+            with open(initPath, 'rb') as f:
+                if b'class Plugin' in f.read():
+                    packages.append(join(path, folder))
+    return packages
+
+
+def _findPackage(moduleName):
+    """ Folder of a package, located without importing it nor its parent
+    packages: only the top level name is looked up in sys.path """
+    top, _, rest = moduleName.partition('.')
+    try:
+        spec = importlib.util.find_spec(top)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    for location in spec.submodule_search_locations:
+        path = join(location, *rest.split('.')) if rest else location
+        if exists(join(path, '__init__.py')) or (not rest and isdir(path)):
+            return path
+    return None
+
+
+def getPluginPaths(args):
+    """ Returns (name, path) of the plugins to inspect: installed plugins
+    by name, or paths. Installed plugins are located without importing them """
+    installed = {name: module.split(':')[0] for name, module, _, _ in getInstalledPlugins()}
+    targets = []
+    for arg in args or sorted(installed):
+        if isdir(arg):
+            targets.extend((basename(p), p) for p in _findPlugins(arg))
+            continue
+        path = _findPackage(installed.get(arg, arg))
+        if path is None:
+            raise ValueError('%s is not an installed plugin nor a folder' % arg)
+        targets.append((arg, path))
+    return targets
+
+
+def printInfo(info):
+    print("Plugin: %s (%s)" % (info['plugin'], info['path']))
+    protocols = [p for p in info['protocols'] if not p['base']]
+    print("   Protocols: %d (%d base)" % (len(protocols), len(info['protocols']) - len(protocols)))
+    for prot in sorted(protocols, key=lambda p: p['name']):
+        print("      %-35s %-35s %s" % (prot['name'], prot['label'], prot['doc']))
+    print("   Binaries: %s" % (', '.join('%s %s%s' % (b['name'], b['version'] or '',
+                                                     ' (default)' if b['default'] is True else '')
+                                         for b in info['binaries']) or '-'))
+    print("   Variables: %s" % (', '.join('%s=%s' % (v['name'], v['default'])
+                                          for v in info['variables']) or '-'))
+    print("   References: %s" % (', '.join(info['references']) or '-'))
+    for module, error in sorted(info['errors'].items()):
+        print("   ERROR in %s: %s" % (module, error))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog='scipion inspect --static',
+                                     description='Inspects plugins from their source code, '
+                                                 'without importing them.')
+    parser.add_argument('plugins', nargs='*', metavar='PLUGIN|PATH',
+                        help='installed plugins or folders (default: all installed plugins)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='plugins parsed at the same time (default: number of cpus)')
+    parser.add_argument('--output', choices=['text', 'json'], default='text')
+    parsedArgs = parser.parse_args(args)
+
+    try:
+        targets = getPluginPaths(parsedArgs.plugins)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if len(targets) > 1:
+        with ProcessPoolExecutor(max_workers=parsedArgs.jobs) as executor:
+            results = list(executor.map(inspectSource, [p for _, p in targets],
+                                        [n for n, _ in targets]))
+    else:
+        results = [inspectSource(path, name) for name, path in targets]
+
+    if parsedArgs.output == 'json':
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    else:
+        for info in results:
+            printInfo(info)
+    return 1 if any(info['errors'] for info in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,331 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Declarative synchronization of the installed plugins and binaries.
+
+"scipion sync spec.yaml" compares the plugins, versions and binaries
+declared in the spec with the installed ones, using only the local
+metadata, and applies the operations needed in one run: a single pip call
+installs or updates all plugins and the binaries of the different plugins
+are built in parallel processes. Spec example (json is also accepted):
+
+    plugins:
+      scipion-em-relion: 5.0.1           # any version if empty
+      scipion-em-xmipp:
+        version: 3.24.12.0
+        binaries: [xmippSrc-v3.24.12]    # installed if missing
+      scipion-em-eman2:
+        binaries: []                     # do not install the default ones
+    uninstall:
+      - scipion-em-gctf
+
+Binaries not listed are left untouched. Plugins installed without a binaries
+list get their default binaries, as "scipion installp" does.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os.path import exists, join
+
+from scipion.constants import MODE_SYNC
+from scipion.utils import getEmRoot, getInstalledVersion, parse_version
+
+# Number of binary installations running at the same time
+DEFAULT_PARALLEL = 2
+
+SPEC_PLUGINS = 'plugins'
+SPEC_UNINSTALL = 'uninstall'
+SPEC_VERSION = 'version'
+SPEC_BINARIES = 'binaries'
+
+_printLock = threading.Lock()
+
+
+class SyncPlan:
+    """ Operations needed to match a spec """
+
+    def __init__(self):
+        self.pipInstall = {}  # pipName -> version ('' for the latest compatible)
+        self.pipUninstall = []
+        self.binaries = {}  # pipName -> binaries to install, None for the default ones
+        self.installed = {}  # pipName -> installed version
+
+    def isEmpty(self):
+        return not (self.pipInstall or self.pipUninstall or self.binaries)
+
+    def __str__(self):
+        lines = []
+        for pipName, version in sorted(self.pipInstall.items()):
+            current = self.installed.get(pipName)
+            if current is None:
+                lines.append("install    %s %s" % (pipName, version or '(latest compatible)'))
+            else:
+                lines.append("update     %s %s -> %s" % (pipName, current, version))
+        for pipName in self.pipUninstall:
+            lines.append("uninstall  %s" % pipName)
+        for pipName, binaries in sorted(self.binaries.items()):
+            lines.append("installb   %s: %s" % (pipName, ' '.join(binaries)
+                                                if binaries is not None else '(default binaries)'))
+        return '\n'.join(lines)
+
+
+def readSpec(specPath):
+    """ Reads a yaml or json spec and returns {plugins: {pipName: (version, binaries)},
+    uninstall: [pipName, ...]}. Raises ValueError if the spec is not valid. """
+    with open(specPath) as f:
+        if specPath.endswith('.json'):
+            spec = json.load(f)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is needed to read %s. Install it with "
+                                 "'scipion pip install pyyaml' or use a json spec."
+                                 % specPath)
+            spec = yaml.safe_load(f)
+
+    if not isinstance(spec, dict):
+        raise ValueError("%s does not define any plugin." % specPath)
+
+    plugins = {}
+    for pipName, wanted in (spec.get(SPEC_PLUGINS) or {}).items():
+        binaries = None
+        if isinstance(wanted, dict):
+            version = wanted.get(SPEC_VERSION)
+            binaries = wanted.get(SPEC_BINARIES)
+            if binaries is not None and not isinstance(binaries, list):
+                raise ValueError("Binaries of %s must be a list." % pipName)
+        else:
+            version = wanted
+        if version is not None and not isinstance(version, str):
+            # yaml reads 3.10 as the number 3.1
+            raise ValueError("Version %r of %s is not a string: quote it, e.g. '%s'."
+                             % (version, pipName, version))
+        plugins[pipName] = ('' if version is None else version,
+                            None if binaries is None else [str(b) for b in binaries])
+
+    uninstall = spec.get(SPEC_UNINSTALL) or []
+    if not isinstance(uninstall, list):
+        raise ValueError("%s must be a list of plugins." % SPEC_UNINSTALL)
+    both = set(plugins).intersection(uninstall)
+    if both:
+        raise ValueError("Plugins to install and uninstall at the same time: %s"
+                         % ' '.join(sorted(both)))
+
+    return {SPEC_PLUGINS: plugins, SPEC_UNINSTALL: [str(p) for p in uninstall]}
+
+
+def _sameVersion(version1, version2):
+    """ Compares versions as pip does: 5.0 is 5.0.0 """
+    try:
+        return parse_version(version1) == parse_version(version2)
+    except ValueError:  # not PEP 440
+        return version1 == version2
+
+
+def computePlan(spec, emRoot=None):
+    """ Returns the SyncPlan with the operations needed to match spec.
+    Only local metadata and the EM_ROOT folder are checked. """
+    emRoot = emRoot or getEmRoot()
+    plan = SyncPlan()
+
+    for pipName, (version, binaries) in spec[SPEC_PLUGINS].items():
+        installed = getInstalledVersion(pipName)
+        if installed is not None:
+            plan.installed[pipName] = installed
+
+        if installed is None or (version and not _sameVersion(version, installed)):
+            plan.pipInstall[pipName] = version
+
+        if installed is None and binaries is None:
+            plan.binaries[pipName] = None
+        elif binaries:
+            missing = [b for b in binaries if not exists(join(emRoot, b))]
+            if missing:
+                plan.binaries[pipName] = missing
+
+    for pipName in spec[SPEC_UNINSTALL]:
+        installed = getInstalledVersion(pipName)
+        if installed is not None:
+            plan.installed[pipName] = installed
+            plan.pipUninstall.append(pipName)
+
+    return plan
+
+
+def _print(*args):
+    with _printLock:
+        print(*args)
+        sys.stdout.flush()
+
+
+def _runCmd(cmd, prefix=''):
+    """ Runs cmd printing its output lines with prefix. Returns the exit code """
+    _print(prefix + ' '.join(cmd))
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True, errors='replace')
+    for line in proc.stdout:
+        _print(prefix + line.rstrip('\n'))
+    return proc.wait()
+
+
+def applyPlan(plan, processors='1', parallel=DEFAULT_PARALLEL, withBinaries=True):
+    """ Applies the plan: plugins are uninstalled and installed with one pip
+    call each and the binaries of each plugin are installed in parallel
+    processes. Returns True if everything went fine. """
+    # pyworkflow is only needed when there is something to do
+    import pyworkflow
+    os.environ.update(pyworkflow.Config.getVars())
+    from scipion.install.plugin_funcs import PluginInfo, PluginRepository, installBinsDefault
+
+    withBinaries = withBinaries and installBinsDefault()
+    python = sys.executable
+    success = True
+
+    if plan.pipUninstall or plan.pipInstall:
+        from scipion.install.snapshots import takeSnapshot
+        takeSnapshot(plan.pipUninstall + list(plan.pipInstall), reason=MODE_SYNC)
+
+    if plan.pipUninstall:
+        if withBinaries:
+            for pipName in plan.pipUninstall:
+                PluginInfo(pipName, pipName, remote=False).uninstallBins()
+        cmd = [python, '-m', 'pip', 'uninstall', '-y'] + plan.pipUninstall
+        success = _runCmd(cmd) == 0
+
+    if plan.pipInstall:
+        latest = [pipName for pipName, version in plan.pipInstall.items() if not version]
+        plugins = PluginRepository().getPlugins(pluginList=latest, getPipData=True) if latest else {}
+        requirements = []
+        for pipName, version in sorted(plan.pipInstall.items()):
+            if not version:
+                plugin = plugins.get(pipName)
+                if plugin is None:
+                    _print("ERROR: No compatible release found for %s." % pipName)
+                    success = False
+                    continue
+                version = plugin.getLatestRelease()
+            requirements.append('%s==%s' % (pipName, version))
+
+        if requirements:
+            cmd = [python, '-m', 'pip', 'install'] + requirements
+            if _runCmd(cmd) != 0:
+                _print("ERROR: pip could not install the plugins. Binaries are not installed.")
+                return False
+            from scipion.install.bytecode import precompile
+            precompile([r.split('==')[0] for r in requirements])
+
+    binaries = plan.binaries if withBinaries else {}
+    if binaries:
+        def installBinaries(item):
+            pipName, targets = item
+            cmd = ([python, '-m', 'scipion', MODE_SYNC, '--binaries', pipName]
+                   + (targets or []) + ['-j', str(processors)])
+            return _runCmd(cmd, prefix='[%s] ' % pipName) == 0
+
+        with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+            results = list(executor.map(installBinaries, sorted(binaries.items())))
+        success = success and all(results)
+
+    return success
+
+
+def installPluginBinaries(pipName, targets, processors):
+    """ Installs the binaries of a plugin, the default ones if no targets.
+    Runs in its own process, one per plugin. Returns 1 if any of them is
+    not in EM_ROOT afterwards. """
+    from scipion.install.plugin_funcs import PluginInfo
+
+    plugin = PluginInfo(pipName, pipName, remote=False)
+    pluginClass = plugin.getPluginClass()
+    if pluginClass is None:
+        return 1
+    pluginClass._defineVariables()
+    environment = plugin.getInstallenv(envArgs={'args': list(targets) + ['-j', processors]})
+    environment.execute()
+
+    # Folders of the packages, the targets that are not packages are not checked
+    folders = {(name + '-' + version if version else name)
+               for versions in environment._packages.values() for name, version in versions}
+    wanted = list(targets) or [t.getName() for t in environment.getTargetList() if t.isDefault()]
+    missing = [t for t in wanted
+               if t in folders and not exists(join(environment.getEmFolder(), t))]
+    if missing:
+        _print("ERROR: %s binaries not installed: %s" % (pipName, ' '.join(missing)))
+        return 1
+    return 0
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='scipion %s' % MODE_SYNC,
+                                     description='Installs, updates and uninstalls plugins '
+                                                 'and binaries to match a spec file.')
+    parser.add_argument('spec', nargs='?', help='yaml or json file with the plugins wanted.')
+    parser.add_argument('--dry', action='store_true',
+                        help='Only print the operations needed.')
+    parser.add_argument('--noBin', action='store_true',
+                        help='Do not install or uninstall binaries.')
+    parser.add_argument('-j', default='1', metavar='j',
+                        help='Number of CPUs to use for compilation.')
+    parser.add_argument('--parallel', type=int, default=DEFAULT_PARALLEL,
+                        help='Number of binary installations running at the same time '
+                             '(default %d).' % DEFAULT_PARALLEL)
+    parser.add_argument('--binaries', nargs='+', metavar=('pipName', 'binary'),
+                        help=argparse.SUPPRESS)  # used by the parallel workers
+    parsedArgs = parser.parse_args(args)
+
+    if parsedArgs.binaries:
+        pipName, targets = parsedArgs.binaries[0], parsedArgs.binaries[1:]
+        return installPluginBinaries(pipName, targets, parsedArgs.j)
+
+    if parsedArgs.spec is None:
+        parser.print_help()
+        return 1
+
+    try:
+        spec = readSpec(parsedArgs.spec)
+    except (OSError, ValueError) as e:
+        print("ERROR: %s" % e)
+        return 1
+
+    plan = computePlan(spec)
+    if parsedArgs.noBin:
+        plan.binaries = {}
+    if plan.isEmpty():
+        print("Nothing to do, the installation matches %s." % parsedArgs.spec)
+        return 0
+
+    print("Operations needed:\n%s" % plan)
+    if parsedArgs.dry:
+        return 0
+
+    success = applyPlan(plan, processors=parsedArgs.j, parallel=parsedArgs.parallel,
+                        withBinaries=not parsedArgs.noBin)
+    return 0 if success else 1
@@ -31,13 +31,35 @@ scipion-app if a higher version of these is released
 """
 import subprocess
 import argparse
+import sys
+import json
+import os
+import threading
+import time
 
-from pyworkflow.utils import redStr, greenStr, os
+from pyworkflow.utils import greenStr
 from scipion.constants import MODE_UPDATE
+from scipion.utils import (getCacheFolder, readJsonCache, writeJsonCache, parse_version,
+                           getInstalledPlugins)
 
 DRY_COMMAND = '-dry'
+PLUGINS_COMMAND = '--plugins'
+UPGRADE_COMMAND = '--upgrade'
+ROLLBACK_COMMAND = '--rollback'
+SNAPSHOTS_COMMAND = '--snapshots'
 SCIPION_NAME = 'Scipion'
 
+# Latest versions found in pypi are kept in this file of the cache folder
+UPDATE_STATUS_FILE = 'update_status.json'
+# Hours a checked version is reused. Failed checks are retried after one hour
+UPDATE_CHECK_TTL = float(os.environ.get('SCIPION_UPDATE_CHECK_TTL', 24)) * 3600
+FAILED_CHECK_TTL = min(3600, UPDATE_CHECK_TTL)
+# Seconds to wait for pypi
+UPDATE_CHECK_TIMEOUT = float(os.environ.get('SCIPION_UPDATE_CHECK_TIMEOUT', 5))
+PYPI_URL = os.environ.get('SCIPION_PYPI_URL', 'https://pypi.org/pypi')
+# Plugins checked at the same time
+PLUGIN_CHECK_WORKERS = 16
+
 
 def updateManagerParser(args):
     """
@@ -50,15 +72,52 @@ def updateManagerParser(args):
                                      description='description: update {}.'.format(
                                          SCIPION_NAME),
                                      formatter_class=argparse.RawTextHelpFormatter,
-                                     usage="{} [-h/--help] [{}]".format(
-                                         ' '.join(args[:2]), DRY_COMMAND)
+                                     usage="{} [-h/--help] [{}] [{} [{}]] [{} [ID]] [{}]".format(
+                                         ' '.join(args[:2]), DRY_COMMAND,
+                                         PLUGINS_COMMAND, UPGRADE_COMMAND,
+                                         ROLLBACK_COMMAND, SNAPSHOTS_COMMAND)
                                      )
     parser_f.add_argument(DRY_COMMAND,
-                          help='only check status {}.'.format(SCIPION_NAME),
+                          help='only check status {}. Latest versions are always requested '
+                               'again, the manager uses the ones checked in the last '
+                               'SCIPION_UPDATE_CHECK_TTL hours.'.format(SCIPION_NAME),
+                          action="store_true")
+
+    parser_f.add_argument(PLUGINS_COMMAND,
+                          help='check the installed plugins instead. Plugins are checked at\n'
+                               'the same time against the pypi data cached in the last\n'
+                               'SCIPION_PLUGIN_CACHE_TTL hours.',
+                          action="store_true")
+    parser_f.add_argument(UPGRADE_COMMAND,
+                          help='with {}, upgrade the outdated plugins to their latest\n'
+                               'compatible release with a single pip call.'.format(PLUGINS_COMMAND),
+                          action="store_true")
+
+    parser_f.add_argument(ROLLBACK_COMMAND, nargs='?', const='', metavar='ID',
+                          help='restore the packages as they were before the last update,\n'
+                               'or the one of the snapshot ID. No network is needed.')
+    parser_f.add_argument(SNAPSHOTS_COMMAND,
+                          help='list the snapshots taken before each update.',
                           action="store_true")
 
     parsedArgs = parser.parse_args(args[1:])
-    outdatedPackages = UpdateManager.getPackagesStatus()
+    if parsedArgs.snapshots or parsedArgs.rollback is not None:
+        from scipion.install.snapshots import printSnapshots, rollback
+        if parsedArgs.snapshots:
+            printSnapshots()
+        elif not rollback(parsedArgs.rollback or None):
+            sys.exit(1)
+        return
+
+    if parsedArgs.plugins:
+        outdatedPlugins = UpdateManager.printPluginsStatus(UpdateManager.getPluginsStatus())
+        if parsedArgs.upgrade and outdatedPlugins and not parsedArgs.dry:
+            if not UpdateManager.upgradePlugins(outdatedPlugins):
+                sys.exit(1)
+        return
+
+    # Asked explicitly: versions are always requested again
+    outdatedPackages = UpdateManager.getPackagesStatus(refresh=True)
     if not outdatedPackages:
         print('{} is up to date.'.format(SCIPION_NAME))
     elif not parsedArgs.dry:
@@ -70,25 +129,40 @@ class UpdateManager:
     Class responsible for updating scipion-em, scipion-pyworkflow and
     scipion-app if a higher version of these is released
     """
-    import pyworkflow
-    import pwem
-    import scipion
 
-    packageNames = [('scipion-pyworkflow', pyworkflow.__version__),
-                    ('scipion-em', pwem.__version__),
-                    ('scipion-app', scipion.__version__)]
+    @staticmethod
+    def getPackageNames():
+        """ Returns the (name, installed version) of the core packages. They
+        are imported only when checking, not when loading this module """
+        import pyworkflow
+        import pwem
+        import scipion
+
+        return [('scipion-pyworkflow', pyworkflow.__version__),
+                ('scipion-em', pwem.__version__),
+                ('scipion-app', scipion.__version__)]
 
     @classmethod
-    def getPackagesStatus(cls, printAll=True):
+    def getPackagesStatus(cls, printAll=True, refresh=False):
         """
         Check for scipion-app, scipion-pyworkflow and scipion-em updates
+
+        :param printAll: print the status of the packages that are up to date too
+        :param refresh: request the latest versions even if they were checked recently
+
         return: a list of modules to be updated
         """
         outdatedPackages = []
-        for package in cls.packageNames:
+        packages = cls.getPackageNames()
+        latestVersions = cls.getLatestVersions([name for name, _ in packages],
+                                               refresh=refresh)
+        for package in packages:
+            latest = latestVersions.get(package[0])
+            if latest is None:
+                print("Cannot check update status of %s (%s)" % package)
+                continue
 
-            needToUpdate, version = cls.getPackageState(package[0],
-                                                        package[1])
+            needToUpdate, version = cls._isOutdated(package[1], latest), latest
             if needToUpdate:
                 outdatedPackages.append((package[0], version))
                 print(
@@ -97,7 +171,7 @@ class UpdateManager:
                                                   version)))
             elif printAll:
                 print(greenStr('The package %s is up to date.  Your version '
-                               'is %s' % (package[0], version)))
+                               'is %s' % (package[0], package[1])))
 
         return outdatedPackages
 
@@ -112,36 +186,142 @@ class UpdateManager:
                 (False, version)
 
         """
-        # Ignore auto-check of outdated package that happens at import time
-        os.environ["OUTDATED_IGNORE"] = "1"
-        from outdated import check_outdated
-        from requests.exceptions import ConnectionError
-        try:
-            checkOutdated = check_outdated(packageName, version)
-        except ConnectionError:
+        latest = cls.getLatestVersions([packageName]).get(packageName)
+        if latest is None:
             print("Cannot check update status of %s (%s)" % (packageName, version))
             return False, version
-        except ValueError:
-            # We intentionally skip this error
-            # When working in devel mode with an increased version not yet release this Value error
-            # happens: --> example: Version 3.0.2 is greater than the latest version on PyPI: 3.0.1
-            return False, version
-        except Exception as ex:
-            print(redStr('%s :%s' % (packageName, ex)))
-            return False, version
+        return cls._isOutdated(version, latest), latest
+
+    @staticmethod
+    def _isOutdated(version, latest):
+        # A devel version higher than the released one is not outdated
+        try:
+            return parse_version(latest) > parse_version(version)
+        except (ValueError, TypeError):  # InvalidVersion: not PEP 440, can not be compared
+            return False
+
+    @staticmethod
+    def _requestLatestVersion(packageName, timeout):
+        from urllib.request import urlopen
+        with urlopen('%s/%s/json' % (PYPI_URL, packageName), timeout=timeout) as response:
+            return json.load(response)['info']['version']
+
+    @classmethod
+    def getLatestVersions(cls, packageNames, refresh=False, timeout=UPDATE_CHECK_TIMEOUT):
+        """ Returns {packageName: latest version in pypi, None if unknown}.
+
+        Versions checked less than SCIPION_UPDATE_CHECK_TTL hours ago are
+        taken from the cache unless refresh. The rest are requested at the
+        same time, waiting at most timeout seconds: requests still running
+        then are abandoned and do not delay the exit.
+        """
+        path = getCacheFolder(UPDATE_STATUS_FILE)
+        cache = readJsonCache(path)
+        cache = cache if isinstance(cache, dict) else {}
+        now = time.time()
+
+        latestVersions = {}
+        pending = []
+        for name in packageNames:
+            entry = cache.get(name)
+            if (not refresh and isinstance(entry, dict) and
+                    now - entry.get('time', 0) < (UPDATE_CHECK_TTL if entry.get('version')
+                                                  else FAILED_CHECK_TTL)):
+                latestVersions[name] = entry.get('version')
+            else:
+                pending.append(name)
+
+        if pending:
+            results = {}
+
+            def check(packageName):
+                try:
+                    results[packageName] = cls._requestLatestVersion(packageName, timeout)
+                except Exception:
+                    pass  # unknown: offline, timeout, not in pypi...
+
+            threads = [threading.Thread(target=check, args=(name,), daemon=True)
+                       for name in pending]
+            for thread in threads:
+                thread.start()
+            deadline = now + timeout
+            for thread in threads:
+                thread.join(max(0, deadline - time.time()))
+
+            for name in pending:
+                latestVersions[name] = results.get(name)
+                cache[name] = {'time': now, 'version': results.get(name)}
+            writeJsonCache(path, cache)
 
-        return checkOutdated
+        return latestVersions
 
     @classmethod
     def updateScipion(cls, outdatedPackages):
         """
         Update a module from which there is released a higher version
         """
+        from scipion.install.snapshots import takeSnapshot
+        from scipion.install.bytecode import precompile
+        takeSnapshot([name for name, _ in outdatedPackages], reason=MODE_UPDATE)
+        updated = []
         for packageName in outdatedPackages:
             cmd_args = ['pip', 'install', '--upgrade', packageName[0]]
             result = subprocess.call(cmd_args)
             if result == 0:
                 print('%s was correctly updated.' % packageName[0])
+                updated.append(packageName[0])
             else:
                 print('Something went wrong during the update of %s.'
                       % packageName[0])
+        precompile(updated)
+
+    @staticmethod
+    def getPluginsStatus():
+        """ Returns (pipName, installed version, latest compatible release or
+        None if unknown) for each installed plugin, sorted by name """
+        from concurrent.futures import ThreadPoolExecutor
+        from scipion.install.plugin_funcs import PluginInfo, RemoteDataCache, NULL_VERSION
+
+        installed = {dist: version for _, _, dist, version in getInstalledPlugins() if dist}
+
+        def check(pipName):
+            plugin = PluginInfo(pipName, pipName, remote=False)
+            pipData = plugin.getPipJsonData()  # cached data unless it is too old
+            latest = None
+            if pipData:
+                latest = plugin.getCompatiblePipReleases(pipJsonData=pipData)['latest']
+            return pipName, installed[pipName], None if latest == NULL_VERSION else latest
+
+        with ThreadPoolExecutor(max_workers=PLUGIN_CHECK_WORKERS) as executor:
+            status = list(executor.map(check, sorted(installed)))
+        RemoteDataCache.save()
+        return status
+
+    @classmethod
+    def printPluginsStatus(cls, status):
+        """ Prints a table with the outdated plugins. Returns their
+        (pipName, latest release) """
+        outdated = [(pipName, latest) for pipName, version, latest in status
+                    if latest is not None and cls._isOutdated(version, latest)]
+        unknown = [pipName for pipName, _, latest in status if latest is None]
+
+        if outdated:
+            row = "{:<35} {:<15} {:<15}"
+            print(row.format('Plugin', 'Installed', 'Latest'))
+            for pipName, version, latest in status:
+                if (pipName, latest) in outdated:
+                    print(greenStr(row.format(pipName, version, latest)))
+        print("%d plugins checked, %d outdated." % (len(status), len(outdated)))
+        if unknown:
+            print("Cannot check update status of: %s" % ' '.join(unknown))
+        return outdated
+
+    @staticmethod
+    def upgradePlugins(outdatedPlugins):
+        """ Upgrades the plugins with a single pip call, so their
+        requirements are resolved together. Returns True if pip succeeded """
+        from scipion.install.sync import SyncPlan, applyPlan
+
+        plan = SyncPlan()
+        plan.pipInstall = dict(outdatedPlugins)
+        return applyPlan(plan)
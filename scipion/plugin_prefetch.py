@@ -0,0 +1,308 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Prefetch and concurrent import of the installed plugins, for installations
+on network filesystems.
+
+Importing the plugins stats and opens thousands of files, one after the
+other: on NFS each one is a round trip to the server. When SCIPION_PREFETCH
+is on:
+
+  - the modes that load the plugins start a detached process that walks the
+    packages of pyworkflow and the plugins in parallel threads (stat of every
+    entry, read of the sources and bytecode), so the attribute and page
+    caches are warm when the mode imports them,
+  - the project modes and the plugin variable registry import the plugins
+    in parallel threads before registering them: pyworkflow, pwem and the
+    SCIPION_PRIORITY_PACKAGE_LIST packages first, as all plugins use them,
+    then the rest concurrently. Plugins that fail are imported again one by
+    one, so errors are reported as usual.
+
+    python -m scipion.plugin_prefetch [-j N] [--import]
+
+runs them in the foreground and reports the time saved: the time the same
+work takes serially, in another python process run afterwards, minus the
+time it took in the threads. The serial run finds the caches warm, so the
+time saved is a lower bound. SCIPION_PREFETCH_JOBS sets the number of threads.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scipion.utils import envOn, getInstalledPlugins
+
+# Files read to warm the page cache, the rest are only stat'ed
+READ_SUFFIXES = ('.py', '.pyc')
+# Extension modules are big: the kernel is only told they will be needed
+ADVISE_SUFFIXES = ('.so',)
+SKIP_FOLDERS = {'tests', 'docs'}
+CHUNK_SIZE = 2 ** 20
+CORE_MODULES = ['pyworkflow', 'pwem']
+
+
+def isPrefetchOn():
+    return envOn('SCIPION_PREFETCH')
+
+
+def getJobs(default):
+    try:
+        return max(1, int(os.environ.get('SCIPION_PREFETCH_JOBS', default)))
+    except ValueError:
+        return default
+
+
+def getPackageFolders():
+    """ Folders of pyworkflow and the installed plugins, located without
+    importing them """
+    folders = []
+    modules = CORE_MODULES + [module.split(':')[0].split('.')[0]
+                              for _, module, _, _ in getInstalledPlugins()]
+    for moduleName in dict.fromkeys(modules):
+        try:
+            spec = importlib.util.find_spec(moduleName)
+        except (ImportError, ValueError):
+            continue
+        if spec is not None and spec.submodule_search_locations:
+            folders.extend(spec.submodule_search_locations)
+    return list(dict.fromkeys(folders))
+
+
+def _readFile(path):
+    """ Reads a file to put it in the page cache. Returns the bytes read """
+    size = 0
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        while True:
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                return size
+            size += len(chunk)
+    finally:
+        os.close(fd)
+
+
+def _adviseFile(path):
+    if not hasattr(os, 'posix_fadvise'):  # macOS
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def _prefetchFolder(path, isRoot, stats):
+    """ Stats and reads the entries of a folder. Returns its subfolders """
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return []
+    names = {entry.name for entry in entries}
+    # Only packages are imported: data folders are left alone
+    if not isRoot and '__init__.py' not in names and os.path.basename(path) != '__pycache__':
+        return []
+
+    folders = []
+    files = size = 0
+    for entry in entries:
+        try:
+            if entry.is_dir():
+                if entry.name not in SKIP_FOLDERS and not entry.name.startswith('.'):
+                    folders.append(entry.path)
+                continue
+            entry.stat()
+            files += 1
+            if entry.name.endswith(READ_SUFFIXES):
+                size += _readFile(entry.path)
+            elif entry.name.endswith(ADVISE_SUFFIXES):
+                _adviseFile(entry.path)
+        except OSError:
+            pass
+    with stats['lock']:
+        stats['files'] += files
+        stats['bytes'] += size
+    return folders
+
+
+def prefetch(folders=None, jobs=None):
+    """ Walks the folders (by default, the ones of pyworkflow and the plugins)
+    in parallel threads. Returns the files, bytes and wall time """
+    folders = getPackageFolders() if folders is None else folders
+    jobs = jobs or getJobs(min(32, (os.cpu_count() or 1) * 4))
+    stats = {'files': 0, 'bytes': 0, 'lock': threading.Lock()}
+    pending = queue.Queue()
+    for folder in folders:
+        pending.put((folder, True))
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            try:
+                for subFolder in _prefetchFolder(item[0], item[1], stats):
+                    pending.put((subFolder, False))
+            except Exception:
+                pass  # prefetching is only an optimization
+            finally:
+                # Otherwise pending.join() would wait forever
+                pending.task_done()
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(jobs)]
+    for thread in threads:
+        thread.start()
+    pending.join()
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join()
+    del stats['lock']
+    stats['wallTime'] = time.perf_counter() - t0
+    stats['jobs'] = jobs
+    return stats
+
+
+def startPrefetch():
+    """ Prefetches the plugins in a detached process, while the mode runs.
+    It outlives the launcher when the mode replaces its process """
+    try:
+        subprocess.Popen([sys.executable, '-m', 'scipion.plugin_prefetch', '--quiet'],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError:
+        pass
+
+
+def _importModule(moduleName):
+    try:
+        importlib.import_module(moduleName)
+        error = None
+    except BaseException as e:  # a plugin may even call sys.exit
+        error = e
+    return moduleName, error
+
+
+def importPlugins(jobs=None):
+    """ Imports the installed plugins in parallel threads, so registering them
+    later (Domain.getPlugins) finds them already imported. Returns the plugins
+    imported, wall time and errors of the ones that could not be imported
+    even one by one """
+    jobs = jobs or getJobs(min(8, os.cpu_count() or 1))
+    t0 = time.perf_counter()
+    # Every plugin uses these: imported before, so threads do not wait for each other
+    first = CORE_MODULES + os.environ.get('SCIPION_PRIORITY_PACKAGE_LIST', '').split()
+    for moduleName in dict.fromkeys(first):
+        if moduleName not in sys.modules:
+            _importModule(moduleName)
+
+    modules = [module.split(':')[0] for _, module, _, _ in getInstalledPlugins()]
+    modules = [m for m in dict.fromkeys(modules) if m not in sys.modules]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(_importModule, modules))
+
+    errors = {}
+    for moduleName, error in results:
+        if error is not None:
+            # A circular import between threads or a real error
+            _, error = _importModule(moduleName)
+            if error is not None:
+                errors[moduleName] = error
+    return {'plugins': len(modules), 'wallTime': time.perf_counter() - t0,
+            'jobs': jobs, 'errors': errors}
+
+
+def measureSerial(importPlugins=False):
+    """ Runs the same work with one thread in another python process, so no
+    module is imported yet. Returns {'prefetch': seconds, 'import': seconds},
+    None if it failed """
+    cmd = [sys.executable, '-m', 'scipion.plugin_prefetch', '--serial']
+    if importPlugins:
+        cmd.append('--import')
+    try:
+        output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                stdin=subprocess.DEVNULL, universal_newlines=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def printReport(title, stats, serialTime):
+    if serialTime is None:
+        print("%s: %.2fs with %d threads" % (title, stats['wallTime'], stats['jobs']))
+        return
+    print("%s: %.2fs with %d threads, %.2fs serially: %.2fs saved"
+          % (title, stats['wallTime'], stats['jobs'], serialTime,
+             max(0, serialTime - stats['wallTime'])))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m scipion.plugin_prefetch',
+                                     description='Warms the filesystem caches for the '
+                                                 'installed plugins and reports the time saved.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='threads (default: SCIPION_PREFETCH_JOBS or 4 per cpu, 32 at most)')
+    parser.add_argument('--import', dest='importPlugins', action='store_true',
+                        help='import the plugins concurrently after the prefetch')
+    parser.add_argument('--quiet', action='store_true', help='do not print the report')
+    # Serial baseline of the report, run in another process
+    parser.add_argument('--serial', action='store_true', help=argparse.SUPPRESS)
+    parsedArgs = parser.parse_args(args)
+
+    if parsedArgs.serial:
+        times = {'prefetch': prefetch(jobs=1)['wallTime']}
+        if parsedArgs.importPlugins:
+            times['import'] = importPlugins(jobs=1)['wallTime']
+        print(json.dumps(times))
+        return 0
+
+    prefetchStats = prefetch(jobs=parsedArgs.jobs)
+    importStats = importPlugins(jobs=parsedArgs.jobs) if parsedArgs.importPlugins else None
+    if parsedArgs.quiet:
+        return 1 if importStats and importStats['errors'] else 0
+
+    serial = measureSerial(parsedArgs.importPlugins) or {}
+    print("Prefetched %d files, %.1f MB"
+          % (prefetchStats['files'], prefetchStats['bytes'] / 2 ** 20))
+    printReport("Prefetch", prefetchStats, serial.get('prefetch'))
+    if importStats is not None:
+        printReport("Import of %d plugins" % importStats['plugins'], importStats,
+                    serial.get('import'))
+        for moduleName, error in sorted(importStats['errors'].items()):
+            print("Could not import %s: %s" % (moduleName, error))
+        return 1 if importStats['errors'] else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
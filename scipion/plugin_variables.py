@@ -0,0 +1,209 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Registry of the variables defined by pyworkflow and the plugins, kept on disk.
+
+Knowing the variables means importing every plugin. printenv, config and
+the install modes read them from this registry instead. The variables of
+each plugin are kept with its version, read from the package metadata:
+only plugins installed, upgraded or downgraded since the last time are
+imported again, as well as the ones that could not be imported the last
+time (e.g. a dependency was missing). Everything is imported again when the config files or the
+values of the variables in the environment change.
+
+Set SCIPION_PLUGIN_VARS_CACHE to 0 to always import the plugins.
+"""
+import os
+import sys
+
+from scipion.utils import (envOn, getCacheFolder, getInstalledPlugins, getMtime,
+                           readJsonCache, writeJsonCache)
+
+REGISTRY_FILE = 'plugin_variables.json'
+
+
+def isVariablesCacheOn():
+    return envOn('SCIPION_PLUGIN_VARS_CACHE', True)
+
+
+class PluginVariables:
+    """ Variables of pyworkflow and the plugins. For each variable: value,
+    default, description and source (pyworkflow or the plugin name) """
+
+    def __init__(self):
+        self.core = {}  # variables not defined by plugins
+        # plugin name -> {'version', 'url', 'variables',
+        #                 'pluginVars': the ones of the PLUGINS config section,
+        #                 'error': True if it could not be imported}
+        self.pluginEntries = {}
+
+    @property
+    def variables(self):
+        variables = dict(self.core)
+        for name in sorted(self.pluginEntries):
+            variables.update(self.pluginEntries[name]['variables'])
+        return variables
+
+    @property
+    def pluginVars(self):
+        """ Plugin.getVars() of all plugins """
+        pluginVars = {}
+        for name in sorted(self.pluginEntries):
+            pluginVars.update(self.pluginEntries[name]['pluginVars'])
+        return pluginVars
+
+    @property
+    def plugins(self):
+        """ plugin name -> {'version', 'url'} """
+        return {name: {'version': entry['version'], 'url': entry['url']}
+                for name, entry in self.pluginEntries.items()}
+
+    @staticmethod
+    def getPath():
+        return getCacheFolder(REGISTRY_FILE)
+
+    @staticmethod
+    def _getKey():
+        configFiles = [os.environ.get('SCIPION_CONFIG'), os.environ.get('SCIPION_LOCAL_CONFIG')]
+        return {'python': sys.executable,
+                'home': os.environ.get('SCIPION_HOME'),
+                'config': [[f, getMtime(f)] for f in configFiles]}
+
+    def load(self):
+        """ Loads the registry and imports the plugins whose version changed.
+        Returns False if it is missing or outdated """
+        data = readJsonCache(self.getPath())
+        if not isinstance(data, dict) or data.get('key') != self._getKey():
+            return False
+
+        # Variables are read from the environment first
+        environ = data['environ']
+        if any(os.environ.get(name) != value for name, value in environ.items()):
+            return False
+
+        self.core = data['core']
+        self.pluginEntries = data['plugins']
+
+        installed = {name: version for name, _, _, version in getInstalledPlugins()}
+        stale = [name for name, version in installed.items()
+                 if self.pluginEntries.get(name, {}).get('version', False) != version
+                 or self.pluginEntries[name].get('error')]
+        removed = [name for name in self.pluginEntries if name not in installed]
+        if stale or removed:
+            for name in removed:
+                del self.pluginEntries[name]
+            self._update(stale, installed)
+        return True
+
+    def build(self):
+        """ Imports all the plugins to get their variables and saves them """
+        import pyworkflow
+        from scipion.plugin_prefetch import isPrefetchOn, importPlugins
+        installed = {name: version for name, _, _, version in getInstalledPlugins()}
+        if isPrefetchOn():
+            importPlugins()
+        pyworkflow.Config.getDomain().getPlugins()
+        self.core = {}
+        self.pluginEntries = {}
+        self._update(sorted(installed), installed, loaded=True)
+
+    def _update(self, names, installed, loaded=False):
+        """ Gets the variables of the plugins in names, imported one by one
+        unless loaded, and saves the registry """
+        environ = dict(os.environ)
+        import pyworkflow
+        from pyworkflow.plugin import Plugin
+
+        domain = pyworkflow.Config.getDomain()
+        for name in names:
+            module = domain.getPlugins().get(name) if loaded else None
+            error = False
+            if module is None:
+                try:
+                    module = domain.getPluginModule(name)
+                except Exception as e:
+                    print("WARNING: Could not load plugin %s: %s" % (name, e), file=sys.stderr)
+                    error = True
+            plugin = getattr(module, 'Plugin', None)
+            self.pluginEntries[name] = {'version': installed.get(name),
+                                        'url': (plugin.getUrl() if plugin is not None else '') or '',
+                                        'variables': {}, 'pluginVars': {},
+                                        'error': error or module is None}
+
+        allPluginVars = Plugin.getVars()
+        variables = {}
+        for varName, var in pyworkflow.VariablesRegistry.variables().items():
+            variables[varName] = {'value': _toStr(var.value),
+                                  'default': _toStr(getattr(var, 'default', None)),
+                                  'description': getattr(var, 'description', None),
+                                  'source': _toStr(getattr(var, 'source', None))}
+        for varName, var in variables.items():
+            entry = self.pluginEntries.get(var['source'])
+            if var['source'] in names and entry is not None:
+                entry['variables'][varName] = var
+                if varName in allPluginVars:
+                    entry['pluginVars'][varName] = _toStr(allPluginVars[varName])
+            elif loaded and entry is None:
+                self.core[varName] = var
+
+        if isVariablesCacheOn():
+            allVariables = self.variables
+            writeJsonCache(self.getPath(),
+                           {'key': self._getKey(),
+                            'environ': {name: environ.get(name) for name in allVariables},
+                            'core': self.core,
+                            'plugins': self.pluginEntries})
+
+    def getPluginVariables(self, pluginName):
+        """ Returns {name: value} of the variables defined by a plugin """
+        entry = self.pluginEntries.get(pluginName, {})
+        return {name: var['value'] for name, var in entry.get('variables', {}).items()
+                if name in entry.get('pluginVars', {})}
+
+
+def _toStr(value):
+    return None if value is None else str(value)
+
+
+_registry = None
+
+
+def getPluginVariables():
+    """ Returns the PluginVariables, loaded from disk when still valid """
+    global _registry
+    if _registry is None:
+        _registry = PluginVariables()
+        if not (isVariablesCacheOn() and _registry.load()):
+            _registry.build()
+    return _registry
+
+
+def definePluginVariables():
+    """ Defines the variables of all the plugins, as importing them does,
+    without importing them. Variables already defined are kept """
+    from pyworkflow.plugin import Plugin
+    for name, value in getPluginVariables().pluginVars.items():
+        Plugin._vars.setdefault(name, value)
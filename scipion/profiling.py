@@ -0,0 +1,406 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Profiling of the launcher and of the scripts it runs.
+
+SCIPION_PROFILE selects the profiler:
+
+    cprofile (or 1, on, true)  cProfile, saved as .prof (pstats) files
+    importtime                 python -X importtime, saved as .importtime files
+    sample                     statistical profiler sampling the stack every
+                               SCIPION_PROFILE_INTERVAL ms of cpu time (default 5),
+                               saved as .sample (json) files
+
+Each invocation writes its own file, <label>-<date>-<pid>.<ext>, in
+SCIPION_PROFILE_DIR (default: the profiles folder of the scipion cache).
+The launcher itself is profiled as scipion-<mode> and the python scripts it
+runs (runprotocol, python, viewer, protocols...) with the script name.
+
+    scipion profile report|list|clean
+
+aggregates the files and ranks the hot functions (or modules) across runs.
+"""
+import os
+import sys
+import time
+from os.path import basename, exists, join, splitext
+
+from scipion.utils import getCacheFolder
+
+PROFILE_CPROFILE = 'cprofile'
+PROFILE_IMPORTTIME = 'importtime'
+PROFILE_SAMPLE = 'sample'
+PROFILERS = [PROFILE_CPROFILE, PROFILE_IMPORTTIME, PROFILE_SAMPLE]
+
+EXTENSIONS = {PROFILE_CPROFILE: '.prof',
+              PROFILE_IMPORTTIME: '.importtime',
+              PROFILE_SAMPLE: '.sample'}
+
+DEFAULT_INTERVAL_MS = 5
+IMPORTTIME_PREFIX = 'import time:'
+
+
+def getProfiler(value=None):
+    """ Profiler selected by value (default: SCIPION_PROFILE) or None """
+    value = (os.environ.get('SCIPION_PROFILE', '') if value is None else value).strip().lower()
+    if value in ['1', 'true', 'on', 'yes']:
+        return PROFILE_CPROFILE
+    if value in PROFILERS:
+        return value
+    return None
+
+
+def getProfileDir():
+    return os.environ.get('SCIPION_PROFILE_DIR') or getCacheFolder('profiles')
+
+
+def getProfilePath(profiler, label):
+    """ Unique file for one profiled run """
+    profileDir = getProfileDir()
+    os.makedirs(profileDir, exist_ok=True)
+    name = '%s-%s-%d%s' % (label, time.strftime('%Y%m%d-%H%M%S'), os.getpid(),
+                           EXTENSIONS[profiler])
+    return join(profileDir, name)
+
+
+def _printSaved(path):
+    sys.stderr.write("Profile saved to %s\n" % path)
+
+
+# ###################### Sampling profiler ############################
+
+def _getFunctionKey(code):
+    return '%s:%d(%s)' % (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+class Sampler:
+    """ Samples the stack of the main thread every interval seconds of cpu
+    time using SIGPROF. Counts how many samples each function was running
+    (self) or in the stack (total). """
+
+    def __init__(self, interval=None):
+        if interval is None:
+            interval = float(os.environ.get('SCIPION_PROFILE_INTERVAL', DEFAULT_INTERVAL_MS)) / 1000
+        self.interval = interval
+        self.samples = 0
+        self.selfCounts = {}
+        self.totalCounts = {}
+        self._codeKeys = {}
+        self._start = None
+
+    def _key(self, code):
+        key = self._codeKeys.get(code)
+        if key is None:
+            key = self._codeKeys[code] = _getFunctionKey(code)
+        return key
+
+    def _sample(self, signum, frame):
+        if frame is None:
+            return
+        self.samples += 1
+        key = self._key(frame.f_code)
+        self.selfCounts[key] = self.selfCounts.get(key, 0) + 1
+        seen = set()
+        while frame is not None:
+            key = self._key(frame.f_code)
+            if key not in seen:
+                seen.add(key)
+                self.totalCounts[key] = self.totalCounts.get(key, 0) + 1
+            frame = frame.f_back
+
+    def start(self):
+        import signal
+        self._start = time.time()
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        import signal
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def save(self, path):
+        import json
+        with open(path, 'w') as f:
+            json.dump({'interval': self.interval,
+                       'samples': self.samples,
+                       'elapsed': time.time() - self._start,
+                       'self': self.selfCounts,
+                       'total': self.totalCounts}, f)
+
+
+# ###################### Profiling runs ############################
+
+class Profile:
+    """ cProfile or sampling profile of the current process """
+
+    def __init__(self, profiler, label):
+        self.profiler = profiler
+        self.path = getProfilePath(profiler, label)
+        if profiler == PROFILE_CPROFILE:
+            import cProfile
+            self._profile = cProfile.Profile()
+        else:
+            self._profile = Sampler()
+        self._running = False
+
+    def start(self):
+        if self.profiler == PROFILE_CPROFILE:
+            self._profile.enable()
+        else:
+            self._profile.start()
+        self._running = True
+
+    def stop(self):
+        """ Stops profiling and saves the profile. Can be called more than once """
+        if not self._running:
+            return
+        self._running = False
+        if self.profiler == PROFILE_CPROFILE:
+            self._profile.disable()
+            self._profile.dump_stats(self.path)
+        else:
+            self._profile.stop()
+            self._profile.save(self.path)
+        _printSaved(self.path)
+
+
+_activeProfile = None
+
+
+def stopProfile():
+    """ Saves the profile of this process, if any. To be called before
+    exec'ing another program since the process is replaced """
+    if _activeProfile is not None:
+        _activeProfile.stop()
+
+
+def runWithImportTime(cmd, path, env=None):
+    """ Runs cmd under -X importtime saving the import times to path and
+    passing any other stderr output through. Returns the exit code. """
+    import subprocess
+    env = dict(os.environ if env is None else env)
+    env['PYTHONPROFILEIMPORTTIME'] = '1'
+    proc = subprocess.Popen(cmd, env=env, stderr=subprocess.PIPE,
+                            universal_newlines=True, errors='replace')
+    with open(path, 'w') as f:
+        for line in proc.stderr:
+            if line.startswith(IMPORTTIME_PREFIX):
+                f.write(line)
+            else:
+                sys.stderr.write(line)
+    exitCode = proc.wait()
+    _printSaved(path)
+    return exitCode
+
+
+def profileLauncher(func, mode, profiler):
+    """ Runs func (the launcher main) profiled with profiler """
+    global _activeProfile
+    label = 'scipion-%s' % mode
+
+    if profiler == PROFILE_IMPORTTIME:
+        if os.environ.pop('PYTHONPROFILEIMPORTTIME', None):
+            return func()  # already the profiled launcher, not inherited by the scripts
+        # Imports already happened in this process: run the launcher again
+        path = getProfilePath(profiler, label)
+        sys.exit(runWithImportTime([sys.executable, '-m', 'scipion'] + sys.argv[1:], path))
+
+    _activeProfile = Profile(profiler, label)
+    _activeProfile.start()
+    try:
+        return func()
+    finally:
+        stopProfile()
+
+
+def getScriptArgs(scriptArgs, profiler):
+    """ Python arguments to run scriptArgs (script and its arguments) with profiler """
+    if profiler is None or not scriptArgs or scriptArgs[0].startswith('-'):
+        return list(scriptArgs)  # not a script: python -c, -m or interactive
+    return ['-m', 'scipion.profiling', profiler] + list(scriptArgs)
+
+
+def profileScript(profiler, scriptArgs):
+    """ Runs a python script as __main__ with profiler. Returns the exit code """
+    script = scriptArgs[0]
+    label = splitext(basename(script))[0]
+
+    if profiler == PROFILE_IMPORTTIME:
+        # Imports of this process are not wanted: a new one is needed
+        return runWithImportTime([sys.executable] + scriptArgs,
+                                 getProfilePath(profiler, label))
+
+    import runpy
+    sys.argv = list(scriptArgs)
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    profile = Profile(profiler, label)
+    profile.start()
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        return e.code
+    finally:
+        profile.stop()
+    return 0
+
+
+# ###################### Reports ############################
+
+def getProfileFiles(profileDir=None, label=None):
+    """ Returns {profiler: [paths]} of the profiles in profileDir whose
+    label starts with label """
+    profileDir = profileDir or getProfileDir()
+    files = {p: [] for p in PROFILERS}
+    if not exists(profileDir):
+        return files
+    byExtension = {ext: p for p, ext in EXTENSIONS.items()}
+    for name in sorted(os.listdir(profileDir)):
+        profiler = byExtension.get(splitext(name)[1])
+        if profiler is not None and (label is None or name.startswith(label)):
+            files[profiler].append(join(profileDir, name))
+    return files
+
+
+def parseImportTime(path):
+    """ Returns {module: self microseconds} of an importtime file """
+    times = {}
+    with open(path) as f:
+        for line in f:
+            if not line.startswith(IMPORTTIME_PREFIX) or 'self [us]' in line:
+                continue
+            selfTime, _, name = line[len(IMPORTTIME_PREFIX):].split('|')
+            name = name.strip()
+            times[name] = times.get(name, 0) + int(selfTime)
+    return times
+
+
+def _shorten(key, width=70):
+    return key if len(key) <= width else '...' + key[-(width - 3):]
+
+
+def reportCProfile(paths, sort, limit, out):
+    import pstats
+    out.write("cProfile: %d runs\n" % len(paths))
+    stats = pstats.Stats(*paths, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+
+
+def reportSample(paths, sort, limit, out):
+    import json
+    samples = 0
+    counts = {'self': {}, 'total': {}}
+    runs = {}
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+        samples += data['samples']
+        for kind in counts:
+            for key, count in data[kind].items():
+                counts[kind][key] = counts[kind].get(key, 0) + count
+        for key in data['total']:
+            runs[key] = runs.get(key, 0) + 1
+
+    out.write("Sampling: %d runs, %d samples\n" % (len(paths), samples))
+    if not samples:
+        return
+    order = 'self' if sort == 'tottime' else 'total'
+    ranked = sorted(counts[order].items(), key=lambda item: -item[1])[:limit]
+    out.write("{:>7} {:>7} {:>5}  {}\n".format('self%', 'total%', 'runs', 'function'))
+    for key, _ in ranked:
+        out.write("{:>7.1f} {:>7.1f} {:>5}  {}\n".format(
+            100. * counts['self'].get(key, 0) / samples,
+            100. * counts['total'].get(key, 0) / samples,
+            runs.get(key, 0), _shorten(key)))
+
+
+def reportImportTime(paths, limit, out):
+    totals = {}
+    runs = {}
+    for path in paths:
+        for module, selfTime in parseImportTime(path).items():
+            totals[module] = totals.get(module, 0) + selfTime
+            runs[module] = runs.get(module, 0) + 1
+
+    out.write("Import time: %d runs\n" % len(paths))
+    ranked = sorted(totals.items(), key=lambda item: -item[1])[:limit]
+    out.write("{:>10} {:>10} {:>5}  {}\n".format('total ms', 'mean ms', 'runs', 'module'))
+    for module, total in ranked:
+        out.write("{:>10.1f} {:>10.1f} {:>5}  {}\n".format(
+            total / 1000., total / 1000. / runs[module], runs[module], module))
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='scipion profile',
+                                     description='Reports of the profiles saved with '
+                                                 'SCIPION_PROFILE=%s.' % '|'.join(PROFILERS))
+    parser.add_argument('command', choices=['report', 'list', 'clean'],
+                        help='report: rank the hot functions and modules across runs, '
+                             'list: list the profile files, clean: delete them.')
+    parser.add_argument('label', nargs='?',
+                        help='Only profiles whose name starts with this (e.g. scipion-config, '
+                             'pw_protocol_run).')
+    parser.add_argument('--dir', help='Profile folder (default %s).' % getProfileDir())
+    parser.add_argument('--sort', choices=['tottime', 'cumtime'], default='tottime',
+                        help='Rank functions by their own time or including their calls.')
+    parser.add_argument('-n', '--limit', type=int, default=30,
+                        help='Number of entries shown (default 30).')
+    parsedArgs = parser.parse_args(args)
+
+    files = getProfileFiles(parsedArgs.dir, parsedArgs.label)
+    allFiles = [path for paths in files.values() for path in paths]
+    if not allFiles:
+        print("No profiles found in %s." % (parsedArgs.dir or getProfileDir()))
+        return 1
+
+    if parsedArgs.command == 'list':
+        for path in allFiles:
+            print(path)
+    elif parsedArgs.command == 'clean':
+        for path in allFiles:
+            os.remove(path)
+        print("%d profiles deleted." % len(allFiles))
+    else:
+        out = sys.stdout
+        for profiler, paths in files.items():
+            if not paths:
+                continue
+            if profiler == PROFILE_CPROFILE:
+                reportCProfile(paths, parsedArgs.sort, parsedArgs.limit, out)
+            elif profiler == PROFILE_SAMPLE:
+                reportSample(paths, parsedArgs.sort, parsedArgs.limit, out)
+            else:
+                reportImportTime(paths, parsedArgs.limit, out)
+            out.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    # Used by the launcher: python -m scipion.profiling PROFILER script [args]
+    if len(sys.argv) < 3 or sys.argv[1] not in PROFILERS:
+        sys.exit("Usage: python -m scipion.profiling %s script [args]" % '|'.join(PROFILERS))
+    sys.exit(profileScript(sys.argv[1], sys.argv[2:]))
@@ -0,0 +1,191 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Catalog of the protocols of the installed plugins, kept on disk.
+
+Listing the protocols means importing the protocols module of every
+plugin. "scipion protocols" and "scipion inspect PLUGIN info" read them
+from this catalog instead: for each plugin (name and version, read from the
+package metadata) it keeps the name, label, package, base and viewer
+flags and the first line of the doc of its protocols. Only the plugins
+installed, upgraded or downgraded since the last time are imported again.
+
+Plugins installed in editable mode keep their version while their code
+changes: use "scipion protocols --rebuild" or set SCIPION_PROTOCOL_CATALOG
+to 0 to always import the plugins.
+"""
+import sys
+
+from scipion.utils import (envOn, getCacheFolder, getInstalledPlugins, readJsonCache,
+                           writeJsonCache)
+
+CATALOG_FILE = 'protocol_catalog.json'
+
+
+def isCatalogOn():
+    return envOn('SCIPION_PROTOCOL_CATALOG', True)
+
+
+class ProtocolCatalog:
+    """ Protocols of each plugin: {plugin name: {'version', 'error',
+    'protocols'}}. Each protocol is a dict with name, label, package, base,
+    viewer, declared (defined in the plugin, not imported by it) and doc """
+
+    def __init__(self):
+        self.plugins = {}
+
+    @staticmethod
+    def getPath():
+        return getCacheFolder(CATALOG_FILE)
+
+    def load(self):
+        data = readJsonCache(self.getPath())
+        if isinstance(data, dict) and data.get('python') == sys.executable:
+            self.plugins = data.get('plugins', {})
+
+    def save(self):
+        writeJsonCache(self.getPath(), {'python': sys.executable, 'plugins': self.plugins})
+
+    def update(self, rebuild=False):
+        """ Imports the plugins whose version changed and removes the ones
+        uninstalled. Returns the names of the plugins imported """
+        installed = {name: (module.split(':')[0], version)
+                     for name, module, _, version in getInstalledPlugins()}
+        stale = [name for name, (_, version) in sorted(installed.items())
+                 if rebuild or name not in self.plugins
+                 or self.plugins[name]['version'] != version]
+        removed = [name for name in self.plugins if name not in installed]
+
+        for name in removed:
+            del self.plugins[name]
+        for name in stale:
+            module, version = installed[name]
+            self.plugins[name] = dict(version=version, **_inspectPlugin(module))
+
+        if (stale or removed) and isCatalogOn():
+            self.save()
+        return stale
+
+    def getProtocols(self, pluginName=None):
+        """ Returns the protocols of a plugin, or of all of them """
+        names = [pluginName] if pluginName else sorted(self.plugins)
+        return [prot for name in names if name in self.plugins
+                for prot in self.plugins[name]['protocols']]
+
+    def getErrors(self):
+        return {name: entry['error'] for name, entry in self.plugins.items() if entry['error']}
+
+
+def _inspectPlugin(moduleName):
+    """ Imports a plugin and its protocols module, like
+    Domain.getProtocols does, and returns their description """
+    import importlib
+    import inspect
+    from pyworkflow.protocol import Protocol
+    from pyworkflow.viewer import Viewer
+    from scipion.install.inspect_plugins import getFirstLine, getSubmodule
+
+    try:
+        plugin = importlib.import_module(moduleName)
+        sub, error = getSubmodule(plugin, moduleName, 'protocols')
+    except Exception as e:
+        sub, error = None, str(e)
+    if sub is None:
+        if error is not None:
+            print("WARNING: Could not import the protocols of %s:\n%s" % (moduleName, error),
+                  file=sys.stderr)
+        return {'error': error, 'protocols': []}
+
+    protocols = []
+    for name in dir(sub):
+        attr = getattr(sub, name)
+        if not (inspect.isclass(attr) and issubclass(attr, Protocol)):
+            continue
+        # Set this special property used by Scipion, as showProtocols does
+        attr._package = plugin
+        attr._plugin = getattr(plugin, '_pluginInstance', None) or plugin.Plugin()
+        protocols.append({'name': name,
+                          'label': attr.getClassLabel(),
+                          'package': attr.getClassPackageName(),
+                          'base': bool(attr.isBase()),
+                          'viewer': issubclass(attr, Viewer),
+                          # Defined in the plugin, not imported from others
+                          'declared': sub.__name__ in attr.__module__,
+                          'doc': getFirstLine(attr.__doc__)})
+    return {'error': None, 'protocols': protocols}
+
+
+_catalog = None
+
+
+def getProtocolCatalog(rebuild=False):
+    """ Returns the ProtocolCatalog, updated for the installed plugins """
+    global _catalog
+    if _catalog is None:
+        _catalog = ProtocolCatalog()
+        if isCatalogOn():
+            _catalog.load()
+        _catalog.update(rebuild=rebuild or not isCatalogOn())
+    elif rebuild:
+        _catalog.update(rebuild=True)
+    return _catalog
+
+
+def getCatalogEntry(pluginName):
+    """ Returns the catalog entry of a plugin (entry point or module name)
+    if it is up to date, None otherwise. Nothing is imported """
+    if not isCatalogOn():
+        return None
+    catalog = _catalog
+    if catalog is None:
+        catalog = ProtocolCatalog()
+        catalog.load()
+    for name, module, _, version in getInstalledPlugins():
+        if pluginName in (name, module.split(':')[0]):
+            entry = catalog.plugins.get(name)
+            if entry is not None and entry['version'] == version:
+                return entry
+    return None
+
+
+def printProtocols(catalog):
+    """ Prints the protocols as pw_protocol_list.py does """
+    groups = {}
+    registered = set()
+    for prot in catalog.getProtocols():
+        # A name declared by two plugins is only registered once
+        if not prot['declared'] or prot['name'] in registered:
+            continue
+        registered.add(prot['name'])
+        prots = groups.setdefault(prot['package'], [])
+        if not prot['viewer'] and not prot['base']:
+            prots.append(prot)
+
+    formatStr = "{:<15}\t{:<35}\t{:<35}"
+    print(formatStr.format("PACKAGE", "PROTOCOL", "LABEL"))
+    for group in sorted(groups, key=lambda g: 1000 - len(groups[g])):
+        for prot in groups[group]:
+            print(formatStr.format(group, prot['name'], prot['label']))
@@ -34,12 +34,12 @@ from pathlib import Path
 from configparser import ConfigParser
 from shutil import copyfile
 
-from scipion.utils import getTemplatesPath
+from scipion.utils import getTemplatesPath, getConfigPathFromConfigFile
+from scipion.constants import HOSTS
 
 PYWORKFLOW_SECTION = "PYWORKFLOW"
 SCIPION_CONF = 'scipion'
 BACKUPS = 'backups'
-HOSTS = 'hosts'
 MISSING_VAR = "None"
 SCIPION_NOTIFY = 'SCIPION_NOTIFY'
 SCIPION_CONFIG = 'SCIPION_CONFIG'
@@ -89,19 +89,17 @@ def main(args=None):
     unattended = options.notify or options.unattended
 
     if options.p:
-        from pyworkflow import Config
+        from scipion.plugin_variables import getPluginVariables
         pluginName = options.p
-        plugin = (Config.getDomain().importFromPlugin(pluginName, 'Plugin'))
-
-        if plugin is not None:
-            plugin._defineVariables()
+        registry = getPluginVariables()
 
+        if pluginName in registry.plugins:
             print("Variables defined by plugin '%s':\n" % pluginName)
-            for k, v in plugin._vars.items():
+            for k, v in registry.getPluginVariables(pluginName).items():
                 print("%s = %s" % (k, v))
             print("\nThese variables can be added/edited in '%s'"
                   % os.environ[SCIPION_CONFIG])
-            url = plugin.getUrl()
+            url = registry.plugins[pluginName]['url']
 
             if url != "":
                 print("\nMore information these variables might be found at '%s'"
@@ -110,9 +108,8 @@ def main(args=None):
         else:
             print("No plugin found with name '%s'. Module name is expected.\n" % pluginName)
 
-            plugins = Config.getDomain().getPlugins()
             print("\nPlugins available:\n")
-            for k in sorted(plugins.keys()):
+            for k in sorted(registry.plugins.keys()):
                 print(k)
 
             print("\nExample: 'scipion3 config -p xmipp3' shows the config variables "
@@ -296,13 +293,10 @@ def addPyworkflowVariables(cf):
 
 
 def addPluginsVariables(cf):
-    # Once more we need a local import to prevent the Config to be wrongly initialized
-    import pyworkflow as pw
-    from pyworkflow.plugin import Plugin
+    # Plugin variables come from the registry: plugins are only imported if it is outdated
+    from scipion.plugin_variables import getPluginVariables
 
-    # Trigger plugin discovery and variable definition
-    pw.Config.getDomain().getPlugins()
-    addVariablesToSection(cf, "PLUGINS", Plugin.getVars())
+    addVariablesToSection(cf, "PLUGINS", getPluginVariables().pluginVars)
 
 
 def checkPaths(conf):
@@ -476,13 +470,5 @@ def compareConfigVariable(section, variableName, valueInConfig, valueInTemplate)
                                 yellow(valueInTemplate)))
 
 
-def getConfigPathFromConfigFile(scipionConfigFile, configFile):
-    """
-    :param scipionConfigFile path to the config file to derive the folder name from
-    :param configFile: name of the template: protocols or hosts so far
-    :return theoretical path for the template at the same path as the config file"""
-    return os.path.join(os.path.dirname(scipionConfigFile), configFile + ".conf")
-
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,192 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Import time benchmark of the installed plugins.
+
+    python -m scipion.tests.benchmark_plugin_imports --repeat 5 \\
+        --output results.json [--baseline baseline.json] [--budget 1.5]
+
+Each plugin and its submodules (see inspect_plugins.getSubmodule) are
+imported in a fresh python process, as "scipion inspect --all-health" does:
+
+    cold: the bytecode is written to an empty PYTHONPYCACHEPREFIX in each
+          run, so every module is compiled again (the os page cache is not
+          dropped)
+    warm: the bytecode left by a first run is used
+
+The results (seconds per run and their median, for each plugin and
+submodule) are printed and saved as json. Plugins whose warm median is
+over --budget seconds, and medians slower than the baseline by more than
+--threshold (and --minDelta seconds), make the exit code 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from scipion import __version__
+from scipion.install.plugin_health import runWorker
+from scipion.tests.benchmark_startup import STATE_COLD, STATE_WARM, compare
+from scipion.utils import getInstalledPlugins
+
+TOTAL = 'total'
+
+
+def getKey(plugin, module, state):
+    return '%s|%s|%s' % (plugin, module, state)
+
+
+def _summary(times):
+    return {'times': times,
+            'median': statistics.median(times),
+            'min': min(times),
+            'max': max(times)}
+
+
+def benchmarkPlugin(plugin, state, repeat, timeout):
+    """ Returns {module: result} of importing the plugin repeat times, plus
+    the total, and the errors found """
+    prefix = tempfile.mkdtemp(prefix='scipion-pycache-')
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=prefix)
+    times = OrderedDict()
+    errors = {}
+    try:
+        if state == STATE_WARM:
+            runWorker(plugin, timeout, env)
+        for _ in range(repeat):
+            if state == STATE_COLD:
+                shutil.rmtree(prefix, ignore_errors=True)
+            health = runWorker(plugin, timeout, env)
+            errors.update(health['errors'])
+            total = 0
+            for name, status, seconds, _ in health['modules']:
+                if status != 'missing':
+                    times.setdefault(name, []).append(seconds or 0)
+                    total += seconds or 0
+            times.setdefault(TOTAL, []).append(total)
+    finally:
+        shutil.rmtree(prefix, ignore_errors=True)
+    return OrderedDict((name, _summary(values)) for name, values in times.items()), errors
+
+
+def runBenchmark(plugins, repeat, timeout):
+    results = OrderedDict()
+    failed = {}
+    for plugin in plugins:
+        name = plugin[0]
+        for state in [STATE_COLD, STATE_WARM]:
+            modules, errors = benchmarkPlugin(plugin, state, repeat, timeout)
+            for module, result in modules.items():
+                results[getKey(name, module, state)] = result
+            if errors:
+                failed[name] = sorted(errors)
+            total = modules[TOTAL]
+            print("{:<25} {:<5} median {:7.3f}s  min {:7.3f}s  slowest: {}{}".format(
+                name, state, total['median'], total['min'],
+                _slowest(modules), '  (errors in %s)' % ', '.join(sorted(errors)) if errors else ''))
+            sys.stdout.flush()
+    return results, failed
+
+
+def _slowest(modules):
+    submodules = [(result['median'], name) for name, result in modules.items() if name != TOTAL]
+    return '%s %.3fs' % max(submodules)[::-1] if submodules else '-'
+
+
+def checkBudget(results, budget):
+    """ Returns the plugins whose warm import takes longer than budget """
+    overBudget = []
+    for key, result in results.items():
+        plugin, module, state = key.split('|')
+        if module == TOTAL and state == STATE_WARM and result['median'] > budget:
+            overBudget.append(plugin)
+            print("%s takes %.3fs to import, over the budget of %.3fs"
+                  % (plugin, result['median'], budget))
+    return overBudget
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Import time benchmark of the installed plugins.')
+    parser.add_argument('plugins', nargs='*', metavar='PLUGIN',
+                        help='Plugins to benchmark (default: all the installed ones).')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Imports of each plugin and state (default 5).')
+    parser.add_argument('--timeout', type=int, default=300,
+                        help='Seconds to wait for each import (default 300).')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='Seconds a plugin may take to import (warm).')
+    parser.add_argument('--output', help='Save the results to this json file.')
+    parser.add_argument('--baseline', help='Compare with the results saved in this json file.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown considered a regression (default 0.2).')
+    parser.add_argument('--minDelta', type=float, default=0.02,
+                        help='Slowdowns under these seconds are never regressions (default 0.02).')
+    parsedArgs = parser.parse_args(args)
+
+    plugins = getInstalledPlugins()
+    if parsedArgs.plugins:
+        unknown = set(parsedArgs.plugins) - {p[0] for p in plugins}
+        if unknown:
+            parser.error('Plugins not installed: %s' % ' '.join(sorted(unknown)))
+        plugins = [p for p in plugins if p[0] in parsedArgs.plugins]
+
+    results, failed = runBenchmark(plugins, parsedArgs.repeat, parsedArgs.timeout)
+
+    if parsedArgs.output:
+        with open(parsedArgs.output, 'w') as f:
+            json.dump({'scipion': __version__,
+                       'python': sys.version.split()[0],
+                       'platform': platform.platform(),
+                       'time': time.time(),
+                       'repeat': parsedArgs.repeat,
+                       'plugins': {p[0]: p[3] for p in plugins},
+                       'errors': failed,
+                       'results': results}, f, indent=2)
+        print("Results saved to %s" % parsedArgs.output)
+
+    exitCode = 0
+    if parsedArgs.budget is not None and checkBudget(results, parsedArgs.budget):
+        exitCode = 1
+
+    if parsedArgs.baseline:
+        with open(parsedArgs.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, parsedArgs.threshold, parsedArgs.minDelta,
+                              label='plugin|module|state')
+        if regressions:
+            print("\n%d regressions over %d%%." % (len(regressions), 100 * parsedArgs.threshold))
+            exitCode = 1
+    return exitCode
+
+
+if __name__ == '__main__':
+    sys.exit(main())
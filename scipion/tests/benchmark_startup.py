@@ -0,0 +1,346 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Startup benchmark of the launcher modes.
+
+    python -m scipion.tests.benchmark_startup --plugins 0,20,100 --repeat 5 \\
+        --output results.json [--baseline baseline.json]
+
+For each number of plugins, synthetic plugin packages (with a protocol and
+a binary each) are generated and registered through their metadata, and a
+local http server plays the plugin repository and pypi. Each mode runs in a
+scratch SCIPION_HOME:
+
+    cold: the scipion cache (environment snapshot, remote plugin data,
+          indexes) and the bytecode of the plugins are removed before each run
+    warm: the same after a first run filled them
+
+The results (seconds per run and their median) are printed and saved as
+json. With --baseline, medians slower than the baseline by more than
+--threshold (and --minDelta seconds) are reported as regressions and the
+exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+
+from scipion import __version__
+
+# Modes benchmarked: name -> scipion arguments
+MODES = OrderedDict([
+    ('help', ['help']),
+    ('version', ['version']),
+    ('printenv', ['printenv']),
+    ('config --compare', ['config', '--compare']),
+    ('protocols', ['protocols']),
+    ('installp --help', ['installp', '--help']),
+    ('installb --help', ['installb', '--help']),
+    ('inspect', ['inspect']),
+])
+
+STATE_COLD = 'cold'
+STATE_WARM = 'warm'
+
+PLUGIN_PREFIX = 'synth'
+PIP_PREFIX = 'scipion-em-synth'
+
+PLUGIN_INIT = '''\
+import pwem
+
+_logo = None
+_references = []
+
+
+class Plugin(pwem.Plugin):
+    _homeVar = 'SYNTH{i}_HOME'
+    _url = 'https://example.org/synth{i}'
+
+    @classmethod
+    def _defineVariables(cls):
+        cls._defineEmVar('SYNTH{i}_HOME', 'synth{i}-1.0')
+
+    @classmethod
+    def defineBinaries(cls, env):
+        env.addPackage('synth{i}', version='1.0', tar='void.tgz', default=True)
+'''
+
+PLUGIN_PROTOCOLS = '''\
+from pyworkflow.protocol import Protocol
+import pyworkflow.protocol.params as params
+
+
+class ProtSynth{i}(Protocol):
+    """ Synthetic protocol of the startup benchmark """
+    _label = 'synth {i}'
+
+    def _defineParams(self, form):
+        form.addSection(label='Input')
+        form.addParam('value', params.IntParam, default={i}, label='Value')
+
+    def _insertAllSteps(self):
+        pass
+'''
+
+
+def _getCoreVersion():
+    try:
+        from pyworkflow import CORE_VERSION
+        return CORE_VERSION
+    except ImportError:
+        return '3.0'
+
+
+class SyntheticInstallation:
+    """ Scratch SCIPION_HOME with n synthetic plugins, a local plugin
+    repository and a local pypi """
+
+    def __init__(self, root, nPlugins):
+        self.root = root
+        self.nPlugins = nPlugins
+        self.home = join(root, 'home')
+        self.site = join(root, 'site')
+        self.www = join(root, 'www')
+        self._server = None
+
+    def create(self):
+        for folder in [self.home, self.site, join(self.www, 'pypi')]:
+            os.makedirs(folder, exist_ok=True)
+
+        coreVersion = _getCoreVersion()
+        repository = {}
+        for i in range(self.nPlugins):
+            name = '%s%d' % (PLUGIN_PREFIX, i)
+            pipName = '%s%d' % (PIP_PREFIX, i)
+            self._writePlugin(i, name, pipName)
+            repository[pipName] = {'pipName': pipName, 'name': name,
+                                   'pluginSourceUrl': 'https://example.org/%s' % name}
+            pypiFolder = join(self.www, 'pypi', pipName)
+            os.makedirs(pypiFolder, exist_ok=True)
+            with open(join(pypiFolder, 'json'), 'w') as f:
+                json.dump({'info': {'summary': 'Synthetic plugin %d' % i,
+                                    'author': 'Benchmark',
+                                    'author_email': 'benchmark@example.org',
+                                    'home_page': 'https://example.org/%s' % name},
+                           'releases': {'1.0.0': [{'comment_text': 'scipion-%s' % coreVersion,
+                                                   'upload_time': '2024-01-01T00:00:00'}]}},
+                          f)
+
+        with open(join(self.www, 'repository.json'), 'w') as f:
+            json.dump(repository, f)
+
+        self._startServer()
+        # Config files of the scratch installation
+        self.run(['config', '--overwrite', '--unattended'])
+
+    def _writePlugin(self, i, name, pipName):
+        pluginFolder = join(self.site, name)
+        os.makedirs(pluginFolder, exist_ok=True)
+        with open(join(pluginFolder, '__init__.py'), 'w') as f:
+            f.write(PLUGIN_INIT.format(i=i))
+        with open(join(pluginFolder, 'protocols.py'), 'w') as f:
+            f.write(PLUGIN_PROTOCOLS.format(i=i))
+
+        distInfo = join(self.site, '%s-1.0.0.dist-info' % pipName.replace('-', '_'))
+        os.makedirs(distInfo, exist_ok=True)
+        with open(join(distInfo, 'METADATA'), 'w') as f:
+            f.write('Metadata-Version: 2.1\nName: %s\nVersion: 1.0.0\n'
+                    'Summary: Synthetic plugin %d\n' % (pipName, i))
+        with open(join(distInfo, 'entry_points.txt'), 'w') as f:
+            f.write('[pyworkflow.plugin]\n%s = %s\n' % (name, name))
+        with open(join(distInfo, 'top_level.txt'), 'w') as f:
+            f.write('%s\n' % name)
+
+    def _startServer(self):
+        handler = partial(_QuietHandler, directory=self.www)
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def getEnv(self):
+        url = 'http://127.0.0.1:%d' % self._server.server_address[1]
+        env = dict(os.environ)
+        for var in ['SCIPION_PROFILE', 'SCIPION_ZYGOTE', 'SCIPION_CONFIG']:
+            env.pop(var, None)
+        env.update(SCIPION_HOME=self.home,
+                   SCIPION_LOCAL_CONFIG=join(self.home, 'config', 'scipion_local.conf'),
+                   SCIPION_CACHE_FOLDER=self.getCacheFolder(),
+                   SCIPION_PLUGIN_JSON='%s/repository.json' % url,
+                   SCIPION_PYPI_URL='%s/pypi' % url,
+                   PYTHONPATH=os.pathsep.join([self.site] + ([env['PYTHONPATH']]
+                                                             if env.get('PYTHONPATH') else [])))
+        return env
+
+    def getCacheFolder(self):
+        return join(self.home, 'cache')
+
+    def clearCaches(self):
+        """ Removes what a first run leaves for the next ones """
+        shutil.rmtree(self.getCacheFolder(), ignore_errors=True)
+        for i in range(self.nPlugins):
+            shutil.rmtree(join(self.site, '%s%d' % (PLUGIN_PREFIX, i), '__pycache__'),
+                          ignore_errors=True)
+
+    def run(self, args):
+        """ Runs scipion with args. Returns (seconds, exit code) """
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-m', 'scipion'] + args,
+                                env=self.getEnv(), cwd=self.home,
+                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+        return time.perf_counter() - start, result.returncode
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def getKey(mode, nPlugins, state):
+    return '%s|%d|%s' % (mode, nPlugins, state)
+
+
+def benchmarkMode(installation, args, state, repeat):
+    """ Returns the result of running args repeat times """
+    times = []
+    failures = 0
+    if state == STATE_WARM:
+        installation.run(args)
+    for _ in range(repeat):
+        if state == STATE_COLD:
+            installation.clearCaches()
+        elapsed, exitCode = installation.run(args)
+        times.append(elapsed)
+        failures += exitCode != 0
+    return {'times': times,
+            'median': statistics.median(times),
+            'min': min(times),
+            'max': max(times),
+            'failures': failures}
+
+
+def runBenchmark(pluginCounts, modes, repeat, keep=False):
+    results = OrderedDict()
+    for nPlugins in pluginCounts:
+        root = tempfile.mkdtemp(prefix='scipion-bench-%d-' % nPlugins)
+        installation = SyntheticInstallation(root, nPlugins)
+        try:
+            installation.create()
+            for mode in modes:
+                for state in [STATE_COLD, STATE_WARM]:
+                    result = benchmarkMode(installation, MODES[mode], state, repeat)
+                    results[getKey(mode, nPlugins, state)] = result
+                    print("{:<18} {:>4} plugins {:<5} median {:7.3f}s  min {:7.3f}s{}".format(
+                        mode, nPlugins, state, result['median'], result['min'],
+                        '  (%d failed)' % result['failures'] if result['failures'] else ''))
+                    sys.stdout.flush()
+        finally:
+            installation.stop()
+            if keep:
+                print("Scratch installation kept at %s" % root)
+            else:
+                shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold, minDelta, label='mode|plugins|state'):
+    """ Prints the comparison with the baseline results. Returns the keys
+    of the regressions """
+    regressions = []
+    print("\n{:<40} {:>9} {:>9} {:>8}".format(label, 'baseline', 'current', 'change'))
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        change = result['median'] / base['median'] - 1 if base['median'] else 0
+        slower = (result['median'] > base['median'] * (1 + threshold)
+                  and result['median'] - base['median'] > minDelta)
+        if slower:
+            regressions.append(key)
+        print("{:<40} {:>8.3f}s {:>8.3f}s {:>+7.1f}%{}".format(
+            key, base['median'], result['median'], 100 * change, '  REGRESSION' if slower else ''))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Startup benchmark of the scipion launcher modes.')
+    parser.add_argument('--plugins', default='0,20',
+                        help='Comma separated numbers of synthetic plugins (default 0,20).')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs of each mode and state (default 5).')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES),
+                        metavar='MODE', help='Modes to run: %s.' % ', '.join(MODES))
+    parser.add_argument('--output', help='Save the results to this json file.')
+    parser.add_argument('--baseline', help='Compare with the results saved in this json file.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown considered a regression (default 0.2).')
+    parser.add_argument('--minDelta', type=float, default=0.02,
+                        help='Slowdowns under these seconds are never regressions (default 0.02).')
+    parser.add_argument('--keep', action='store_true',
+                        help='Do not delete the scratch installations.')
+    parsedArgs = parser.parse_args(args)
+
+    pluginCounts = [int(n) for n in parsedArgs.plugins.split(',')]
+    results = runBenchmark(pluginCounts, parsedArgs.modes, parsedArgs.repeat, parsedArgs.keep)
+
+    if parsedArgs.output:
+        with open(parsedArgs.output, 'w') as f:
+            json.dump({'scipion': __version__,
+                       'python': sys.version.split()[0],
+                       'platform': platform.platform(),
+                       'time': time.time(),
+                       'repeat': parsedArgs.repeat,
+                       'results': results}, f, indent=2)
+        print("Results saved to %s" % parsedArgs.output)
+
+    if parsedArgs.baseline:
+        with open(parsedArgs.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, parsedArgs.threshold, parsedArgs.minDelta)
+        if regressions:
+            print("\n%d regressions over %d%%." % (len(regressions), 100 * parsedArgs.threshold))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Plugin bundle (scipion.bundle) built from a fake plugin distribution in a
+temporary folder.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from importlib import metadata
+from unittest import mock
+
+from scipion import bundle
+
+DIST_NAME = 'scipion-em-fakebundle'
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _writeDist(site):
+    """ Installs the fake plugin, with its RECORD and entry point, in site """
+    distInfo = os.path.join(site, 'scipion_em_fakebundle-1.0.dist-info')
+    os.makedirs(distInfo)
+    os.makedirs(os.path.join(site, 'fakebundle'))
+    with open(os.path.join(site, 'fakebundle', '__init__.py'), 'w') as f:
+        f.write('')
+    with open(os.path.join(site, 'fakebundle', 'sub.py'), 'w') as f:
+        f.write("SOURCE = 'bundle'\n")
+    with open(os.path.join(distInfo, 'METADATA'), 'w') as f:
+        f.write('Metadata-Version: 2.1\nName: %s\nVersion: 1.0\n' % DIST_NAME)
+    with open(os.path.join(distInfo, 'entry_points.txt'), 'w') as f:
+        f.write('[pyworkflow.plugin]\nfakebundle = fakebundle\n')
+    with open(os.path.join(distInfo, 'RECORD'), 'w') as f:
+        f.write('fakebundle/__init__.py,,\nfakebundle/sub.py,,\n'
+                '../../bin/fakebundle.py,,\nscipion_em_fakebundle-1.0.dist-info/RECORD,,\n')
+
+
+class TestBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.site = os.path.join(self.tmp, 'site')
+        self.path = os.path.join(self.tmp, 'bundle.zip')
+        _writeDist(self.site)
+        sys.path.insert(0, self.site)
+        # Only the fake plugin is bundled
+        plugins = [['fakebundle', 'fakebundle', DIST_NAME, '1.0']]
+        for patcher in [mock.patch.object(bundle, 'CORE_DISTS', []),
+                        mock.patch('scipion.utils.getInstalledPlugins', return_value=plugins)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.manifest = bundle.buildBundle(self.path, jobs=1)
+        # Only the bundle has the original code from now on
+        with open(os.path.join(self.site, 'fakebundle', 'sub.py'), 'w') as f:
+            f.write("SOURCE = 'installation'\n")
+
+    def tearDown(self):
+        sys.meta_path[:] = [f for f in sys.meta_path if not isinstance(f, bundle.BundleFinder)]
+        for name in ['fakebundle', 'fakebundle.sub']:
+            sys.modules.pop(name, None)
+        sys.path.remove(self.site)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _touchSite(self):
+        """ What installing or uninstalling a package does to the site folder """
+        future = time.time() + 10
+        os.utime(self.site, (future, future))
+
+    def testGetModules(self):
+        package = os.path.join(self.site, 'fakebundle')
+        self.assertEqual(bundle.getModules(metadata.distribution(DIST_NAME)),
+                         {'fakebundle': (os.path.join(package, '__init__.py'), True),
+                          'fakebundle.sub': (os.path.join(package, 'sub.py'), False)})
+
+    def testImportFromBundle(self):
+        self.assertEqual(self.manifest['dists'], {DIST_NAME: '1.0'})
+        bundle.installFinder(self.path)
+        import fakebundle.sub
+        package = os.path.join(self.site, 'fakebundle')
+        self.assertEqual(fakebundle.sub.SOURCE, 'bundle')
+        self.assertEqual(fakebundle.sub.__file__, os.path.join(package, 'sub.py'))
+        self.assertEqual(fakebundle.__file__, os.path.join(package, '__init__.py'))
+        self.assertEqual(list(fakebundle.__path__), [package])
+
+    def testStale(self):
+        self.assertIsNone(bundle.checkManifest(bundle.readManifest(self.path)))
+        self._touchSite()
+        self.assertIn('installed or uninstalled', bundle.checkManifest(bundle.readManifest(self.path)))
+        self.assertEqual(bundle.checkManifest(None), 'not built')
+
+    def _runChild(self):
+        """ Imports the fake plugin in a python process with the bundle first
+        in its PYTHONPATH, as the launcher does """
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([self.path, REPO_ROOT, self.site]))
+        return subprocess.run([sys.executable, '-c', 'import fakebundle.sub; print(fakebundle.sub.SOURCE)'],
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+
+    def testChildProcess(self):
+        self.assertEqual(self._runChild().stdout.strip(), 'bundle')
+        self._touchSite()
+        result = self._runChild()
+        self.assertEqual(result.stdout.strip(), 'installation')
+        self.assertIn('not used', result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
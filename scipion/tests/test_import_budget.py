@@ -0,0 +1,155 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Import budget of the launcher modes.
+
+Each mode is run with "python -X importtime -m scipion" and fails if it
+imports a forbidden module or if its imports take longer than its budget.
+Budgets are in milliseconds over a bare python start and can be scaled
+for slow machines with SCIPION_IMPORT_BUDGET_FACTOR. The modes that need
+pyworkflow may import it, but not the GUI nor the remote data modules.
+Modes that open a GUI or import all the plugins (project, plugins,
+tests, runprotocol...) are not budgeted.
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Modules only the modes that really need them should import
+HEAVY_MODULES = ['pyworkflow', 'pwem', 'requests', 'pkg_resources',
+                 'tkinter', 'numpy']
+
+# Not even the modes that import pyworkflow should import these
+PYWORKFLOW_FORBIDDEN = ['tkinter', 'requests']
+
+BUDGET_FACTOR = float(os.environ.get('SCIPION_IMPORT_BUDGET_FACTOR', 1))
+
+
+def parseImportTime(stderr):
+    """ Returns the names of all imported modules and the total time in
+    microseconds (sum of the top level imports) from the -X importtime output """
+    modules = set()
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name.startswith('  '):  # nested imports are indented
+            total += int(cumulative)
+    return modules, total
+
+
+@unittest.skipIf(importlib.util.find_spec('pyworkflow') is None,
+                 "pyworkflow is needed to launch scipion")
+class TestImportBudget(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpDir = tempfile.mkdtemp(prefix='scipion-imports-')
+        cls.env = dict(os.environ,
+                       SCIPION_HOME=cls.tmpDir,
+                       SCIPION_CACHE_FOLDER=os.path.join(cls.tmpDir, 'cache'),
+                       SCIPION_LOCAL_CONFIG=os.path.join(cls.tmpDir, 'scipion.conf'))
+        cls.specFile = os.path.join(cls.tmpDir, 'spec.json')
+        with open(cls.specFile, 'w') as f:
+            json.dump({'plugins': {}}, f)
+        # Plugin search must answer from the index, without building it
+        os.makedirs(cls.env['SCIPION_CACHE_FOLDER'])
+        with open(os.path.join(cls.env['SCIPION_CACHE_FOLDER'], 'plugins_index.json'), 'w') as f:
+            json.dump({'plugins': {'scipion-em-relion': {'summary': 'Relion plugin',
+                                                         'binaries': ['relion-5.0']}}}, f)
+        cls.baseline = cls._importTime(['-c', 'pass'])[1]
+
+    @classmethod
+    def _importTime(cls, args):
+        result = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                                env=cls.env, cwd=cls.tmpDir,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        return parseImportTime(result.stderr)
+
+    def _checkMode(self, args, budgetMs, forbidden=HEAVY_MODULES):
+        modules, total = self._importTime(['-m', 'scipion'] + args)
+        mode = ' '.join(args)
+
+        imported = [m for m in forbidden
+                    if any(name == m or name.startswith(m + '.') for name in modules)]
+        self.assertEqual(imported, [], "scipion %s imports %s" % (mode, imported))
+
+        elapsedMs = (total - self.baseline) / 1000
+        print("scipion %s: %0.1f ms of imports (budget %d ms)" % (mode, elapsedMs, budgetMs))
+        self.assertLessEqual(elapsedMs, budgetMs * BUDGET_FACTOR,
+                             "scipion %s imports exceed the budget" % mode)
+
+    def test_help(self):
+        self._checkMode(['help'], 40)
+
+    def test_version(self):
+        self._checkMode(['version'], 80)
+
+    def test_pluginSearch(self):
+        self._checkMode(['plugins', 'search', 'relion'], 150)
+
+    def test_syncNothingToDo(self):
+        self._checkMode(['sync', self.specFile, '--dry'], 120)
+
+    def test_pipWithEnvironmentSnapshot(self):
+        # First run resolves the environment and saves the snapshot
+        self._importTime(['-m', 'scipion', 'pip', '--version'])
+        self._checkMode(['pip', '--version'], 60)
+
+    def test_profile(self):
+        self._checkMode(['profile', 'list'], 60)
+
+    def test_bundleStatus(self):
+        self._checkMode(['bundle', 'status'], 80)
+
+    def test_config(self):
+        self._checkMode(['config', '--help'], 400, forbidden=PYWORKFLOW_FORBIDDEN)
+
+    def test_printenv(self):
+        self._checkMode(['printenv'], 400, forbidden=PYWORKFLOW_FORBIDDEN)
+
+    def test_protocols(self):
+        self._checkMode(['protocols'], 500, forbidden=PYWORKFLOW_FORBIDDEN)
+
+    def test_inspect(self):
+        self._checkMode(['inspect'], 500, forbidden=PYWORKFLOW_FORBIDDEN)
+
+    def test_installpHelp(self):
+        self._checkMode(['installp', '--help'], 500, forbidden=PYWORKFLOW_FORBIDDEN)
+
+    def test_installbHelp(self):
+        self._checkMode(['installb', '--help'], 500, forbidden=PYWORKFLOW_FORBIDDEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
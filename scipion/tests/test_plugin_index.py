@@ -0,0 +1,56 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Search of the plugin index (scipion.install.plugin_index).
+"""
+import unittest
+
+from scipion.install.plugin_index import PluginIndex
+
+
+class TestPluginIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PluginIndex({
+            'scipion-em-cistem': {'summary': 'cisTEM protocols', 'author': '',
+                                  'version': '3.0', 'binaries': ['ctffind_4.1.14']},
+            'scipion-em-gctf': {'summary': 'Gctf protocols', 'author': '',
+                                'version': '3.0', 'binaries': ['gctf_1.18']}})
+
+    def _search(self, text):
+        return [pipName for pipName, _ in self.index.search(text, fuzzy=False)]
+
+    def testBinaryVersion(self):
+        self.assertEqual(self._search('ctffind 4.1'), ['scipion-em-cistem'])
+        self.assertEqual(self._search('ctffind 4.1.14'), ['scipion-em-cistem'])
+        self.assertEqual(self._search('ctffind_4.1'), ['scipion-em-cistem'])
+        self.assertEqual(self._search('ctffind 4.2'), [])
+
+    def testName(self):
+        self.assertEqual(self._search('gctf'), ['scipion-em-gctf'])
+
+
+if __name__ == '__main__':
+    unittest.main()
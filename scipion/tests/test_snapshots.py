@@ -0,0 +1,123 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Rollback of the package snapshots, with a fake distribution in a temporary
+folder. pip is not run: its uninstall is replaced by removing the files.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from scipion.install import snapshots
+
+DIST_NAME = 'scipion-em-fakesnap'
+
+
+def _writeDist(site, version, distName=DIST_NAME, package='fakesnap', requires=()):
+    """ Installs a fake distribution, with its RECORD, in site """
+    distInfo = os.path.join(site, '%s-%s.dist-info' % (distName.replace('-', '_'), version))
+    os.makedirs(distInfo)
+    os.makedirs(os.path.join(site, package), exist_ok=True)
+    with open(os.path.join(site, package, '__init__.py'), 'w') as f:
+        f.write('VERSION = %r\n' % version)
+    with open(os.path.join(distInfo, 'METADATA'), 'w') as f:
+        f.write('Metadata-Version: 2.1\nName: %s\nVersion: %s\n' % (distName, version))
+        f.writelines('Requires-Dist: %s\n' % r for r in requires)
+    with open(os.path.join(distInfo, 'RECORD'), 'w') as f:
+        f.write('%s/__init__.py,,\n%s/METADATA,,\n%s/RECORD,,\n'
+                % ((package,) + (os.path.basename(distInfo),) * 2))
+
+
+def _uninstall(site):
+    """ What pip uninstall does with the fake distribution """
+    def call(cmd):
+        for name in os.listdir(site):
+            shutil.rmtree(os.path.join(site, name))
+        return 0
+    return call
+
+
+class TestRollback(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.site = os.path.join(self.tmp, 'site')
+        os.makedirs(self.site)
+        sys.path.insert(0, self.site)
+        self.environ = mock.patch.dict(os.environ, {
+            'SCIPION_SNAPSHOT_FOLDER': os.path.join(self.tmp, 'snapshots'),
+            'SCIPION_SNAPSHOTS_KEEP': '1'})
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        sys.path.remove(self.site)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _readVersion(self):
+        with open(os.path.join(self.site, 'fakesnap', '__init__.py')) as f:
+            return f.read()
+
+    def _upgrade(self):
+        """ Takes the snapshot before the upgrade to 2.0, as the updates do """
+        _writeDist(self.site, '1.0')
+        snapshotId = snapshots.takeSnapshot([DIST_NAME], reason='test')
+        _uninstall(self.site)(None)
+        _writeDist(self.site, '2.0')
+        return snapshotId
+
+    def testRollbackKeepOne(self):
+        snapshotId = self._upgrade()
+        with mock.patch.object(snapshots.subprocess, 'call', side_effect=_uninstall(self.site)):
+            self.assertTrue(snapshots.rollback(snapshotId))
+
+        self.assertIn("'1.0'", self._readVersion())
+        ids = [s['id'] for s in snapshots.getSnapshots()]
+        self.assertIn(snapshotId, ids)  # not pruned by the snapshot before the rollback
+        self.assertEqual(len(ids), 2)
+
+    def testDependencies(self):
+        _writeDist(self.site, '1.0', distName='fakesnapdep', package='fakesnapdep')
+        _writeDist(self.site, '1.0', requires=['fakesnapdep>=1.0', 'pip',
+                                               'fakesnapextra; extra == "test"'])
+        snapshotId = snapshots.takeSnapshot([DIST_NAME], reason='test')
+        info = [s for s in snapshots.getSnapshots() if s['id'] == snapshotId][0]
+        self.assertEqual([(d['name'], d['version']) for d in info['distributions']],
+                         [('fakesnapdep', '1.0'), (DIST_NAME, '1.0')])
+
+    def testIncompleteSnapshot(self):
+        snapshotId = self._upgrade()
+        shutil.rmtree(snapshots.getSnapshotFolder(snapshotId, snapshots.FILES_FOLDER))
+        with mock.patch.object(snapshots.subprocess, 'call') as call:
+            self.assertFalse(snapshots.rollback(snapshotId))
+            call.assert_not_called()
+        self.assertIn("'2.0'", self._readVersion())
+
+
+if __name__ == '__main__':
+    unittest.main()
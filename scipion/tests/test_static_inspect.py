@@ -0,0 +1,133 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Static inspection of plugins (scipion.install.static_inspect) on a small
+plugin source tree written in a temporary folder.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from scipion.install.static_inspect import getPluginPaths, inspectSource
+
+SOURCES = {
+    '__init__.py': '''
+        import pwem
+
+        VERSION = '1.2'
+        FAKE_HOME = 'FAKE_HOME'
+
+
+        class Plugin(pwem.Plugin):
+            @classmethod
+            def _defineVariables(cls):
+                cls._defineEmVar(FAKE_HOME, 'fake-' + VERSION)
+
+            @classmethod
+            def defineBinaries(cls, env):
+                env.addPackage('fake', version=VERSION, default=True)
+                env.addPackage('fake', version='1.0')
+        ''',
+    'bibtex.py': '''
+        """
+        @article{Fake2020,
+          title = "Fake"
+        }
+        """
+        ''',
+    'protocols/__init__.py': '''
+        from .protocol_base import ProtFakeBase
+        from .protocol_fake import ProtFake
+        ''',
+    'protocols/protocol_base.py': '''
+        from pwem.protocols import EMProtocol
+
+
+        class ProtFakeBase(EMProtocol):
+            """ Base of the fake protocols """
+        ''',
+    'protocols/protocol_fake.py': '''
+        from .protocol_base import ProtFakeBase
+
+
+        class ProtFake(ProtFakeBase):
+            """ Runs nothing.
+            More lines
+            """
+            _label = 'fake run'
+        ''',
+    'tests/test_fake.py': 'this is not parsed',
+    'broken.py': 'def broken(:\n',
+}
+
+
+class TestStaticInspect(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pluginPath = os.path.join(self.tmp, 'fakeplugin')
+        for name, source in SOURCES.items():
+            path = os.path.join(self.pluginPath, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(textwrap.dedent(source))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def testInspectSource(self):
+        info = inspectSource(self.pluginPath)
+        self.assertEqual(info['plugin'], 'fakeplugin')
+        protocols = sorted(info['protocols'], key=lambda p: p['name'])
+        self.assertEqual([(p['name'], p['module'], p['label'], p['base'], p['doc'])
+                          for p in protocols],
+                         [('ProtFake', 'protocols.protocol_fake', 'fake run', False, 'Runs nothing.'),
+                          ('ProtFakeBase', 'protocols.protocol_base', None, True,
+                           'Base of the fake protocols')])
+        self.assertEqual(info['binaries'], [
+            {'call': 'addPackage', 'name': 'fake', 'version': '1.2', 'default': True},
+            {'call': 'addPackage', 'name': 'fake', 'version': '1.0', 'default': False}])
+        self.assertEqual(info['variables'], [{'name': 'FAKE_HOME', 'default': 'fake-1.2'}])
+        self.assertEqual(info['references'], ['Fake2020'])
+        self.assertEqual(list(info['errors']), ['broken'])
+
+    def testPluginPaths(self):
+        self.assertEqual(getPluginPaths([self.tmp]), [('fakeplugin', self.pluginPath)])
+        sys.path.insert(0, self.tmp)
+        try:
+            self.assertEqual(getPluginPaths(['fakeplugin.protocols']),
+                             [('fakeplugin.protocols', os.path.join(self.pluginPath, 'protocols'))])
+            self.assertNotIn('fakeplugin', sys.modules)  # nothing imported
+            with self.assertRaises(ValueError):
+                getPluginPaths(['notaplugin.protocols'])
+        finally:
+            sys.path.remove(self.tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Spec reading and plans of "scipion sync" (scipion.install.sync).
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from scipion.install import sync
+from scipion.install.sync import SPEC_PLUGINS, SPEC_UNINSTALL, computePlan, readSpec
+
+
+class TestReadSpec(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write(self, name, text):
+        path = os.path.join(self.folder, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def testJson(self):
+        path = self._write('spec.json', json.dumps({
+            'plugins': {'scipion-em-relion': '5.0.1',
+                        'scipion-em-xmipp': {'version': '3.24.12.0',
+                                             'binaries': ['xmippSrc-v3.24.12']},
+                        'scipion-em-eman2': {'binaries': []},
+                        'scipion-em-cistem': None},
+            'uninstall': ['scipion-em-gctf']}))
+        spec = readSpec(path)
+        self.assertEqual(spec[SPEC_PLUGINS], {
+            'scipion-em-relion': ('5.0.1', None),
+            'scipion-em-xmipp': ('3.24.12.0', ['xmippSrc-v3.24.12']),
+            'scipion-em-eman2': ('', []),
+            'scipion-em-cistem': ('', None)})
+        self.assertEqual(spec[SPEC_UNINSTALL], ['scipion-em-gctf'])
+
+    def testYamlNumberVersion(self):
+        try:
+            import yaml  # noqa: F401
+        except ImportError:
+            self.skipTest('PyYAML is not installed')
+        path = self._write('spec.yaml', 'plugins:\n  scipion-em-relion: 3.10\n')
+        with self.assertRaisesRegex(ValueError, 'quote'):
+            readSpec(path)
+        path = self._write('spec.yaml', "plugins:\n  scipion-em-relion:\n    version: '3.10'\n")
+        self.assertEqual(readSpec(path)[SPEC_PLUGINS], {'scipion-em-relion': ('3.10', None)})
+
+    def testInstallAndUninstall(self):
+        path = self._write('spec.json', json.dumps({'plugins': {'scipion-em-gctf': ''},
+                                                    'uninstall': ['scipion-em-gctf']}))
+        with self.assertRaises(ValueError):
+            readSpec(path)
+
+
+class TestComputePlan(unittest.TestCase):
+    INSTALLED = {'scipion-em-relion': '5.0', 'scipion-em-xmipp': '3.24.12.0',
+                 'scipion-em-gctf': '3.1'}
+
+    def setUp(self):
+        self.emRoot = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.emRoot, 'xmippSrc-v3.24.12'))
+        patcher = mock.patch.object(sync, 'getInstalledVersion', self.INSTALLED.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.emRoot, ignore_errors=True)
+
+    def _plan(self, plugins, uninstall=()):
+        return computePlan({SPEC_PLUGINS: plugins, SPEC_UNINSTALL: list(uninstall)},
+                           emRoot=self.emRoot)
+
+    def testUpToDate(self):
+        plan = self._plan({'scipion-em-relion': ('5.0.0', None),
+                           'scipion-em-xmipp': ('', ['xmippSrc-v3.24.12'])},
+                          uninstall=['scipion-em-cistem'])
+        self.assertTrue(plan.isEmpty())
+
+    def testOperations(self):
+        plan = self._plan({'scipion-em-relion': ('5.0.1', None),
+                           'scipion-em-xmipp': ('3.24.12.0', ['xmippSrc-v3.24.12', 'xmippBin']),
+                           'scipion-em-cistem': ('', None),
+                           'scipion-em-eman2': ('2.99', [])},
+                          uninstall=['scipion-em-gctf'])
+        self.assertEqual(plan.pipInstall, {'scipion-em-relion': '5.0.1',
+                                           'scipion-em-cistem': '',
+                                           'scipion-em-eman2': '2.99'})
+        self.assertEqual(plan.pipUninstall, ['scipion-em-gctf'])
+        self.assertEqual(plan.binaries, {'scipion-em-xmipp': ['xmippBin'],
+                                         'scipion-em-cistem': None})
+        # Installs and updates first, sorted, then uninstalls and binaries
+        self.assertEqual(str(plan).splitlines(), [
+            'install    scipion-em-cistem (latest compatible)',
+            'install    scipion-em-eman2 2.99',
+            'update     scipion-em-relion 5.0 -> 5.0.1',
+            'uninstall  scipion-em-gctf',
+            'installb   scipion-em-cistem: (default binaries)',
+            'installb   scipion-em-xmipp: xmippBin'])
+
+
+if __name__ == '__main__':
+    unittest.main()
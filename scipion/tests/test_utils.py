@@ -0,0 +1,70 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Plugins read from the package metadata by scipion.utils.getInstalledPlugins.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from importlib import metadata
+from unittest import mock
+
+from scipion.utils import getInstalledPlugins
+
+
+class TestInstalledPlugins(unittest.TestCase):
+    def setUp(self):
+        self.site = tempfile.mkdtemp()
+        distInfo = os.path.join(self.site, 'scipion_em_fakeplugin-1.2.dist-info')
+        os.makedirs(distInfo)
+        with open(os.path.join(distInfo, 'METADATA'), 'w') as f:
+            f.write('Metadata-Version: 2.1\nName: scipion-em-fakeplugin\nVersion: 1.2\n')
+        with open(os.path.join(distInfo, 'entry_points.txt'), 'w') as f:
+            f.write('[pyworkflow.plugin]\nfakeplugin = fakeplugin\n')
+        sys.path.insert(0, self.site)
+
+    def tearDown(self):
+        sys.path.remove(self.site)
+        shutil.rmtree(self.site, ignore_errors=True)
+
+    def testDistribution(self):
+        plugins = [p for p in getInstalledPlugins() if p[0] == 'fakeplugin']
+        self.assertEqual(plugins, [['fakeplugin', 'fakeplugin', 'scipion-em-fakeplugin', '1.2']])
+
+    def testEntryPointWithoutDist(self):
+        """ Entry points of python < 3.10 have no dist attribute """
+        entryPoint = mock.Mock(spec=['name', 'value', 'group'])
+        entryPoint.name = entryPoint.value = 'fakeplugin'
+        entryPoint.group = 'pyworkflow.plugin'
+        with mock.patch.object(metadata, 'entry_points', return_value=[entryPoint]):
+            plugins = getInstalledPlugins()
+        self.assertEqual(plugins, [['fakeplugin', 'fakeplugin', 'scipion-em-fakeplugin', '1.2']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,8 +26,9 @@
 # *
 # **************************************************************************
 import sys
-from os.path import join, dirname, exists, isdir
+from os.path import join, dirname, exists, isdir, expanduser
 from os import environ
+import os
 import importlib
 
 
@@ -62,6 +63,14 @@ def getTemplatesPath():
     return join(getScipionAppPath(), 'templates')
 
 
+def getConfigPathFromConfigFile(scipionConfigFile, configFile):
+    """
+    :param scipionConfigFile path to the config file to derive the folder name from
+    :param configFile: name of the template: protocols or hosts so far
+    :return theoretical path for the template at the same path as the config file"""
+    return os.path.join(os.path.dirname(scipionConfigFile), configFile + ".conf")
+
+
 def getExternalJsonTemplates():
     import pyworkflow
     return dirname(pyworkflow.Config.SCIPION_CONFIG)
@@ -71,3 +80,127 @@ def getModuleFolder(moduleName):
     """ Returns the path of a module without importing it"""
     spec = importlib.util.find_spec(moduleName)
     return dirname(spec.origin)
+
+
+def getEmRoot():
+    """ Returns the folder where the EM binaries are installed (EM_ROOT)
+    without importing pwem. Relative paths are relative to SCIPION_HOME"""
+    home = getScipionHome()
+    software = environ.get('SCIPION_SOFTWARE', join(home, 'software'))
+    emRoot = environ.get('EM_ROOT', join(software, 'em'))
+    return join(home, expanduser(emRoot))
+
+
+def getUserConfigFolder():
+    """ Returns the folder of the user config file (~/.config/scipion by default)"""
+    return dirname(expanduser(environ.get('SCIPION_LOCAL_CONFIG',
+                                          '~/.config/scipion/scipion.conf')))
+
+
+def envOn(varName, default=False):
+    """ Returns whether a flag environment variable is on. When it is not
+    set (or empty), default. Flags on by default are only turned off by
+    0, false, off or no, the rest only turned on by 1, true, on or yes """
+    value = environ.get(varName, '').strip().lower()
+    if not value:
+        return default
+    if default:
+        return value not in ['0', 'false', 'off', 'no']
+    return value in ['1', 'true', 'on', 'yes']
+
+
+def getMtime(path):
+    """ Modification time of a path, None if it does not exist """
+    try:
+        return os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+
+
+def getInstalledVersion(distName):
+    """ Version of an installed distribution read from its metadata
+    (nothing is imported), None if it is not installed """
+    from importlib import metadata
+    try:
+        return metadata.version(distName)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def getCacheFolder(*paths):
+    """ Returns a path in the folder where scipion keeps data between
+    executions. It can be changed with SCIPION_CACHE_FOLDER"""
+    cacheFolder = environ.get('SCIPION_CACHE_FOLDER',
+                              join(getUserConfigFolder(), 'cache'))
+    return join(cacheFolder, *paths)
+
+
+def readJsonCache(path):
+    """ Returns the content of a json cache file or None if it does not
+    exist or can not be read """
+    import json
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def writeJsonCache(path, data):
+    """ Writes data in a json cache file. The file is replaced atomically so
+    concurrent readers never see it half written. Errors are ignored: a
+    missing cache is never fatal."""
+    import json
+    try:
+        os.makedirs(dirname(path), exist_ok=True)
+        tmpPath = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmpPath, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmpPath, path)
+        return True
+    except OSError:
+        return False
+
+
+def getInstalledPlugins():
+    """ Returns the plugins registered in the 'pyworkflow.plugin' entry
+    points, read from the package metadata (nothing is imported), as a
+    sorted list of [name, module, distribution, version] """
+    from importlib import metadata
+    try:
+        entryPoints = metadata.entry_points(group='pyworkflow.plugin')
+    except TypeError:  # python < 3.10
+        entryPoints = metadata.entry_points().get('pyworkflow.plugin', [])
+
+    plugins = []
+    owners = None
+    for entryPoint in entryPoints:
+        dist = getattr(entryPoint, 'dist', None)
+        if dist is None:  # python < 3.10: entry points do not know their distribution
+            if owners is None:
+                owners = _getEntryPointOwners(metadata, 'pyworkflow.plugin')
+            dist = owners.get((entryPoint.name, entryPoint.value))
+        plugins.append([entryPoint.name, entryPoint.value,
+                        dist.metadata['Name'] if dist is not None else None,
+                        dist.version if dist is not None else None])
+    return sorted(plugins)
+
+
+def _getEntryPointOwners(metadata, group):
+    """ Returns {(name, value): distribution} of the entry points of a group """
+    owners = {}
+    for dist in metadata.distributions():
+        for entryPoint in dist.entry_points:
+            if entryPoint.group == group:
+                owners.setdefault((entryPoint.name, entryPoint.value), dist)
+    return owners
+
+
+def parse_version(version):
+    """ Same as pkg_resources.parse_version, without importing pkg_resources
+    if packaging is available """
+    try:
+        from packaging.version import parse
+    except ImportError:
+        from pkg_resources import parse_version as parse
+    return parse(version)
@@ -0,0 +1,489 @@
+# **************************************************************************
+# *
+# * Authors:    Scipion team (scipion@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+"""
+Zygote: a local daemon that keeps pyworkflow, pwem and the priority
+plugins imported and forks a child for each python script to run.
+
+    scipion zygote start|stop|status
+
+When SCIPION_ZYGOTE is on, runprotocol, python and viewer send their
+script, arguments, environment, working directory and standard streams
+(passed as file descriptors) to the zygote through a Unix socket. The
+launcher waits for the child, forwards it the signals it receives and
+exits with its exit code. If the zygote is not running or was started
+with a different environment, the script is launched as usual.
+"""
+import argparse
+import array
+import hashlib
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+from scipion.utils import getCacheFolder
+
+# Modules preloaded besides the SCIPION_PRIORITY_PACKAGE_LIST ones. More can
+# be added with SCIPION_ZYGOTE_PRELOAD (space separated)
+PRELOAD_MODULES = ['pyworkflow', 'pyworkflow.protocol', 'pyworkflow.project', 'pwem']
+# Variables checked to decide if a request can use the preloaded modules
+# besides the scipion and plugin ones
+ENV_KEYS = ['PYTHONPATH', 'LD_LIBRARY_PATH']
+
+CMD_RUN = 'run'
+CMD_PING = 'ping'
+CMD_STOP = 'stop'
+
+# Streams passed to the child: stdin, stdout, stderr
+STD_FDS = [0, 1, 2]
+HEADER = struct.Struct('!4sI')
+MAGIC = b'SZYG'
+CONNECT_TIMEOUT = 2
+START_TIMEOUT = 120
+
+
+def getSocketPath():
+    """ Socket of the zygote of this installation. It can be set with
+    SCIPION_ZYGOTE_SOCKET """
+    path = os.environ.get('SCIPION_ZYGOTE_SOCKET')
+    if path:
+        return path
+    key = '%s\n%s' % (os.environ.get('SCIPION_HOME', ''), sys.executable)
+    # Unix socket paths are short: use the temporary folder
+    return os.path.join(tempfile.gettempdir(), 'scipion-zygote-%d-%s.sock'
+                        % (os.getuid(), hashlib.sha1(key.encode()).hexdigest()[:10]))
+
+
+def _sendMessage(sock, message, fds=()):
+    """ Sends a json message, with file descriptors if any """
+    data = json.dumps(message).encode()
+    header = HEADER.pack(MAGIC, len(data))
+    ancillary = []
+    if fds:
+        ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))]
+    sock.sendmsg([header], ancillary)
+    sock.sendall(data)
+
+
+def _recvExactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return data
+
+
+def _recvMessage(sock, maxFds=0):
+    """ Receives a json message and the file descriptors sent with it """
+    fds = array.array('i')
+    header, ancillary, flags, addr = sock.recvmsg(
+        HEADER.size, socket.CMSG_LEN(maxFds * fds.itemsize) if maxFds else 0)
+    for level, type, data in ancillary:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    if len(header) < HEADER.size:
+        header += _recvExactly(sock, HEADER.size - len(header))
+    magic, size = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ConnectionError("Unexpected message")
+    return json.loads(_recvExactly(sock, size).decode()), list(fds)
+
+
+def _connect(timeout=CONNECT_TIMEOUT):
+    """ Returns a socket connected to the zygote or None if it is not running """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(getSocketPath())
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def _sendCommand(cmd):
+    """ Sends a command to the zygote. Returns its reply or None if it is not running """
+    sock = _connect()
+    if sock is None:
+        return None
+    with sock:
+        try:
+            _sendMessage(sock, {'cmd': cmd})
+            reply, _ = _recvMessage(sock)
+        except (OSError, ValueError):
+            return None
+        return reply
+
+
+def _exitCode(status):
+    """ Shell-like exit code of a wait status """
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ZygoteClient:
+    """ Runs python scripts in the zygote """
+
+    FORWARDED_SIGNALS = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP,
+                         signal.SIGUSR1, signal.SIGUSR2]
+
+    def run(self, argv, cwd=None):
+        """ Runs the python script argv[0] with arguments argv[1:] in the
+        current environment. Returns its exit code or None if the zygote
+        could not run it. """
+        sock = _connect()
+        if sock is None:
+            return None
+
+        with sock:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                _sendMessage(sock, {'cmd': CMD_RUN,
+                                    'argv': list(argv),
+                                    'cwd': cwd or os.getcwd(),
+                                    'env': dict(os.environ),
+                                    'python': sys.executable}, STD_FDS)
+                reply, _ = _recvMessage(sock)
+                if 'pid' not in reply:
+                    if os.environ.get('SCIPION_DEBUG'):
+                        print("Zygote can not run %s: %s" % (argv[0], reply.get('error')))
+                    return None
+            except (OSError, ValueError):
+                return None
+
+            pid = reply['pid']
+            for sig in self.FORWARDED_SIGNALS:
+                signal.signal(sig, lambda s, frame: os.kill(pid, s))
+
+            # From now on the script is running: wait for it as long as needed
+            sock.settimeout(None)
+            while True:
+                try:
+                    reply, _ = _recvMessage(sock)
+                    return reply.get('exit', 1)
+                except InterruptedError:
+                    continue
+                except (OSError, ValueError):
+                    print("Connection with the zygote lost while running %s" % argv[0])
+                    return 1
+
+
+class ZygoteServer:
+    """ Preloads the modules and forks a child for each request """
+
+    def __init__(self, socketPath=None, envKeys=()):
+        self.socketPath = socketPath or getSocketPath()
+        self.envKeys = set(envKeys).union(ENV_KEYS)
+        self.environ = None
+        self.startTime = None
+        self.preloaded = []
+        self._children = {}  # pid -> connection waiting for its exit code
+        self._running = False
+
+    def preload(self):
+        modules = list(PRELOAD_MODULES)
+        modules += os.environ.get('SCIPION_PRIORITY_PACKAGE_LIST', '').split()
+        modules += os.environ.get('SCIPION_ZYGOTE_PRELOAD', '').split()
+        import importlib
+        for moduleName in dict.fromkeys(modules):
+            try:
+                importlib.import_module(moduleName)
+                self.preloaded.append(moduleName)
+            except Exception as e:
+                print("Zygote: could not preload %s: %s" % (moduleName, e))
+
+        # Plugin variables are read from the environment when they are imported
+        try:
+            import pyworkflow
+            self.envKeys.update(pyworkflow.VariablesRegistry.variables().keys())
+        except Exception:
+            pass
+        self.environ = {k: os.environ.get(k) for k in self.envKeys}
+
+    def _canRun(self, request):
+        """ Returns None if the request can be run with the preloaded modules
+        or the reason why it can not """
+        if request.get('python') != sys.executable:
+            return "different python: %s" % request.get('python')
+        env = request.get('env', {})
+        different = [k for k in self.envKeys if env.get(k) != self.environ[k]]
+        if different:
+            return "different environment: %s" % ' '.join(sorted(different))
+        return None
+
+    def serve(self):
+        """ Serves requests until stopped """
+        if _sendCommand(CMD_PING) is not None:
+            sys.exit("Zygote already running at %s" % self.socketPath)
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+
+        self.preload()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        oldMask = os.umask(0o177)  # only the user can connect
+        try:
+            listener.bind(self.socketPath)
+        finally:
+            os.umask(oldMask)
+        listener.listen(64)
+
+        # SIGCHLD wakes up the select through this pipe
+        wakeupRead, wakeupWrite = os.pipe()
+        os.set_blocking(wakeupRead, False)
+        os.set_blocking(wakeupWrite, False)
+        signal.set_wakeup_fd(wakeupWrite)
+        signal.signal(signal.SIGCHLD, lambda *args: None)
+        signal.signal(signal.SIGTERM, lambda *args: self.stop())
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(listener, selectors.EVENT_READ, 'accept')
+        self._selector.register(wakeupRead, selectors.EVENT_READ, 'signal')
+        self._closeInChild = [listener.fileno(), wakeupRead, wakeupWrite]
+        self.startTime = time.time()
+        self._running = True
+        print("Zygote %d listening at %s. Preloaded: %s"
+              % (os.getpid(), self.socketPath, ' '.join(self.preloaded)))
+        sys.stdout.flush()
+
+        try:
+            while self._running:
+                for key, events in self._selector.select():
+                    if key.data == 'accept':
+                        self._accept(listener)
+                    elif key.data == 'signal':
+                        try:
+                            os.read(wakeupRead, 512)
+                        except BlockingIOError:
+                            pass
+                        self._reapChildren()
+                    else:
+                        self._checkClient(key.fileobj, key.data)
+        finally:
+            listener.close()
+            if os.path.exists(self.socketPath):
+                os.remove(self.socketPath)
+
+    def stop(self):
+        self._running = False
+
+    def _accept(self, listener):
+        conn, _ = listener.accept()
+        fds = []
+        try:
+            conn.settimeout(CONNECT_TIMEOUT)
+            creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                    struct.calcsize('3i'))
+            pid, uid, gid = struct.unpack('3i', creds)
+            if uid != os.getuid():
+                raise ConnectionError("Request from another user: %d" % uid)
+
+            request, fds = _recvMessage(conn, maxFds=len(STD_FDS))
+            cmd = request.get('cmd')
+            if cmd == CMD_PING:
+                _sendMessage(conn, {'pid': os.getpid(), 'preloaded': self.preloaded,
+                                    'uptime': time.time() - self.startTime,
+                                    'running': len(self._children)})
+            elif cmd == CMD_STOP:
+                _sendMessage(conn, {'pid': os.getpid()})
+                self.stop()
+            elif cmd == CMD_RUN:
+                reason = self._canRun(request)
+                if reason is None and len(fds) != len(STD_FDS):
+                    reason = "standard streams not received"
+                if reason is not None:
+                    _sendMessage(conn, {'error': reason})
+                else:
+                    childPid = self._fork(request, fds, conn)
+                    _sendMessage(conn, {'pid': childPid})
+                    self._children[childPid] = conn
+                    self._selector.register(conn, selectors.EVENT_READ, childPid)
+                    conn = None  # kept open until the child exits
+        except (OSError, ValueError) as e:
+            print("Zygote: invalid request: %s" % e)
+        finally:
+            for fd in fds:
+                os.close(fd)
+            if conn is not None:
+                conn.close()
+
+    def _fork(self, request, fds, conn):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid:
+            return pid
+
+        # Child: becomes the requested script
+        exitCode = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            for sig in [signal.SIGCHLD, signal.SIGTERM, signal.SIGINT]:
+                signal.signal(sig, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            os.setsid()
+            conn.close()
+            for other in self._children.values():
+                other.close()
+            self._selector.close()
+            for fd in self._closeInChild:
+                os.close(fd)
+            for target, fd in zip(STD_FDS, fds):
+                os.dup2(fd, target)
+            for fd in fds:
+                os.close(fd)
+
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            argv = request['argv']
+            script = os.path.abspath(argv[0])
+            sys.argv = [script] + argv[1:]
+            sys.path.insert(0, os.path.dirname(script))
+
+            import runpy
+            runpy.run_path(script, run_name='__main__')
+            exitCode = 0
+        except KeyboardInterrupt:
+            traceback.print_exc()
+            exitCode = 128 + signal.SIGINT
+        except SystemExit as e:
+            if e.code is None:
+                exitCode = 0
+            elif isinstance(e.code, int):
+                exitCode = e.code
+            else:
+                print(e.code, file=sys.stderr)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(exitCode)
+
+    def _reapChildren(self):
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            conn = self._children.pop(pid, None)
+            if conn is not None:
+                if conn in self._selector.get_map():
+                    self._selector.unregister(conn)
+                try:
+                    _sendMessage(conn, {'exit': _exitCode(status)})
+                except OSError:
+                    pass
+                conn.close()
+
+    def _checkClient(self, conn, childPid):
+        """ The client only closes the connection if it was killed:
+        the child is terminated too """
+        try:
+            data = conn.recv(1)
+        except OSError:
+            data = b''
+        if not data:
+            self._selector.unregister(conn)
+            try:
+                os.kill(childPid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def startZygote(envKeys):
+    """ Starts the zygote as a background process and waits until it is
+    ready. Its output goes to the zygote.log file in the cache folder. """
+    if _sendCommand(CMD_PING) is not None:
+        print("Zygote already running at %s" % getSocketPath())
+        return 0
+
+    logPath = getCacheFolder('zygote.log')
+    os.makedirs(os.path.dirname(logPath), exist_ok=True)
+    with open(logPath, 'a') as log:
+        proc = subprocess.Popen([sys.executable, '-m', 'scipion', 'zygote',
+                                 'start', '--foreground'],
+                                stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                                start_new_session=True)
+
+    start = time.time()
+    while time.time() - start < START_TIMEOUT:
+        if proc.poll() is not None:
+            print("Zygote could not be started, see %s" % logPath)
+            return 1
+        if _sendCommand(CMD_PING) is not None:
+            print("Zygote %d started in %0.1f seconds, listening at %s"
+                  % (proc.pid, time.time() - start, getSocketPath()))
+            return 0
+        time.sleep(0.2)
+    print("Zygote not ready after %d seconds, see %s" % (START_TIMEOUT, logPath))
+    return 1
+
+
+def main(args, envKeys=()):
+    """ scipion zygote start|stop|status """
+    parser = argparse.ArgumentParser(prog='scipion zygote',
+                                     description='Daemon with pyworkflow, pwem and the priority '
+                                                 'plugins preloaded. Set SCIPION_ZYGOTE=1 so '
+                                                 'runprotocol, python and viewer use it.')
+    parser.add_argument('command', choices=['start', 'stop', 'status'])
+    parser.add_argument('--foreground', action='store_true',
+                        help='Run the zygote in this process.')
+    parsedArgs = parser.parse_args(args)
+
+    if parsedArgs.command == 'start':
+        if parsedArgs.foreground:
+            ZygoteServer(envKeys=envKeys).serve()
+            return 0
+        return startZygote(envKeys)
+
+    reply = _sendCommand(CMD_PING if parsedArgs.command == 'status' else CMD_STOP)
+    if reply is None:
+        print("Zygote not running.")
+        return 1 if parsedArgs.command == 'status' else 0
+
+    if parsedArgs.command == 'status':
+        print("Zygote %d running for %d seconds at %s, %d scripts running.\nPreloaded: %s"
+              % (reply['pid'], reply['uptime'], getSocketPath(), reply['running'],
+                 ' '.join(reply['preloaded'])))
+    else:
+        print("Zygote %d stopped." % reply['pid'])
+    return 0